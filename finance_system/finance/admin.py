@@ -5,7 +5,7 @@ from django.utils.html import format_html
 from .models import (
     CustomUser, Family, FamilyMember, Account,
     Category, Transaction, Budget, FinancialGoal, GoalContribution,
-    Notification, FamilyInvitation
+    Notification, NotificationArchive, NotificationDelivery, FamilyInvitation, ReportJob, BudgetPeriodSpend
 )
 
 @admin.register(CustomUser)
@@ -62,17 +62,26 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('date', 'amount', 'currency', 'type', 'category', 'account', 'user', 'created_via')
-    list_filter = ('type', 'currency', 'created_via', 'date')
+    list_filter = ('type', 'currency', 'created_via', 'is_recurring', 'date')
     search_fields = ('description', 'merchant', 'user__username')
     readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('recurring_source',)
     date_hierarchy = 'date'
 
+class BudgetPeriodSpendInline(admin.TabularInline):
+    model = BudgetPeriodSpend
+    extra = 0
+    can_delete = False
+    readonly_fields = ('period_start', 'spent', 'warned_at')
+    ordering = ('-period_start',)
+
 @admin.register(Budget)
 class BudgetAdmin(admin.ModelAdmin):
     list_display = ('name', 'period', 'amount', 'spent_amount', 'remaining_amount', 'user')
     list_filter = ('period',)
     search_fields = ('name', 'user__username')
     readonly_fields = ('spent_amount', 'remaining_amount')
+    inlines = [BudgetPeriodSpendInline]
 
 @admin.register(FinancialGoal)
 class FinancialGoalAdmin(admin.ModelAdmin):
@@ -101,8 +110,33 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ('title', 'message', 'user__username')
     readonly_fields = ('created_at',)
 
+
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'notification_type', 'title', 'created_at', 'archived_at')
+    list_filter = ('notification_type',)
+    search_fields = ('title', 'user__username')
+    readonly_fields = ('created_at', 'read_at', 'archived_at')
+
+
+@admin.register(NotificationDelivery)
+class NotificationDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('notification', 'channel', 'address', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('channel', 'status')
+    search_fields = ('address', 'notification__title')
+    raw_id_fields = ('notification',)
+    readonly_fields = ('created_at', 'sent_at')
+
 @admin.register(FamilyInvitation)
 class FamilyInvitationAdmin(admin.ModelAdmin):
     list_display = ('family', 'inviter', 'invitee_email', 'status', 'created_at', 'expires_at')
     list_filter = ('status',)
     search_fields = ('invitee_email', 'family__name', 'inviter__username')
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'format', 'start_date', 'end_date', 'status', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'format')
+    search_fields = ('user__username',)
+    readonly_fields = ('data_version', 'cache_key', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class FinanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'finance'
-    verbose_name = 'Финансовое приложение'
\ No newline at end of file
+    verbose_name = 'Финансовое приложение'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,19 @@
+"""Проверки конфигурации для продакшена: python manage.py check --deploy."""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register(deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Версии данных в кэше (finance/utils/cache.py) должны быть общими для всех процессов: с locmem каждый воркер
+    gunicorn держит свои версии, и после записи в одном воркере другие отдают устаревшие виджеты до истечения TTL.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if settings.DEBUG or not backend.endswith('LocMemCache'):
+        return []
+    return [Warning(
+        'Кэш locmem не общий для процессов: версионированные виджеты и страницы расходятся между воркерами.',
+        hint='Задайте CACHE_BACKEND=redis или filesystem, либо запускайте веб-сервер одним процессом.',
+        id='finance.W001',
+    )]
@@ -1,10 +1,9 @@
 # context_processors.py
 """Контекст-процессоры для шаблонов."""
-from .models import Notification
 
 
 def unread_notifications(request):
-    """Добавляет количество непрочитанных уведомлений для авторизованного пользователя."""
+    """Количество непрочитанных уведомлений — из денормализованного поля пользователя, без запроса к уведомлениям."""
     if request.user.is_authenticated:
-        return {'unread_notifications_count': Notification.objects.filter(user=request.user, is_read=False).count()}
+        return {'unread_notifications_count': request.user.unread_notifications_count}
     return {'unread_notifications_count': 0}
@@ -0,0 +1,27 @@
+# management/commands/archive_notifications.py
+"""Переносит старые прочитанные уведомления в архив, чтобы основная таблица оставалась небольшой. Запускать по cron раз в сутки."""
+from django.core.management.base import BaseCommand
+
+from finance.utils.notifications import archive_read_notifications, recount_unread
+
+
+class Command(BaseCommand):
+    help = 'Переносит прочитанные уведомления старше N дней в архив.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Возраст уведомления в днях (по умолчанию 90).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки переноса.')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, сколько уведомлений будет перенесено.')
+        parser.add_argument('--recount', action='store_true', help='Пересчитать счётчики непрочитанных у всех пользователей.')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        dry_run = options['dry_run']
+        moved = archive_read_notifications(days, batch_size=options['batch_size'], dry_run=dry_run)
+        if dry_run:
+            self.stdout.write(f'[dry-run] К переносу в архив: {moved}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Перенесено в архив: {moved}'))
+        if options['recount'] and not dry_run:
+            updated = recount_unread()
+            self.stdout.write(f'Пересчитаны счётчики непрочитанных: {updated} пользователей')
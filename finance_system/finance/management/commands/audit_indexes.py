@@ -0,0 +1,170 @@
+# management/commands/audit_indexes.py
+"""
+Аудит индексов по реальным запросам страниц.
+
+Страницы открываются тестовым клиентом от имени пользователя, все SQL-запросы перехватываются,
+для каждого SELECT выполняется EXPLAIN (SQLite: EXPLAIN QUERY PLAN, PostgreSQL: EXPLAIN).
+Отчёт:
+  - запросы с полным сканированием таблицы или сортировкой без индекса — кандидаты на новые индексы;
+  - индексы таблиц приложения, которые не встретились ни в одном плане — кандидаты на удаление.
+Планы зависят от объёма данных, поэтому запускать стоит на копии боевой БД или после seed_scale.
+"""
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from finance.models import CustomUser, Family
+
+
+SQLITE_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)(?!.*USING)')
+POSTGRES_INDEX_RE = re.compile(r'Index (?:Only )?Scan (?:Backward )?using (\S+)|Bitmap Index Scan on (\S+)')
+POSTGRES_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+def default_urls(user):
+    urls = [
+        reverse('dashboard'),
+        reverse('dashboard') + '?chart_month=' + user.date_joined.strftime('%Y-%m'),
+        reverse('dashboard_chart_data'),
+        reverse('transactions_feed'),
+        reverse('notifications_list'),
+        reverse('family_list'),
+        reverse('report_jobs'),
+    ]
+    family = Family.objects.filter(members__user=user).first() or Family.objects.filter(created_by=user).first()
+    if family:
+        urls += [
+            reverse('family_detail', args=[family.id]),
+            reverse('family_admin_chart', args=[family.id]),
+            reverse('family_chart_data', args=[family.id]),
+        ]
+    return urls
+
+
+def normalize_sql(sql):
+    """SQL без значений параметров — для группировки одинаковых запросов."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def explain_plan(sql):
+    """Строки плана запроса для текущей БД."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN ' + sql)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def analyze_plan(plan):
+    """(использованные индексы, таблицы с полным сканированием, есть ли сортировка без индекса)."""
+    used, scans, temp_sort = set(), set(), False
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            used.update(SQLITE_INDEX_RE.findall(line))
+            match = SQLITE_SCAN_RE.match(line.strip())
+            if match:
+                scans.add(match.group(1))
+            temp_sort = temp_sort or ('USE TEMP B-TREE FOR' in line and 'ORDER BY' in line)
+        else:
+            for a, b in POSTGRES_INDEX_RE.findall(line):
+                used.add(a or b)
+            scans.update(POSTGRES_SCAN_RE.findall(line))
+            temp_sort = temp_sort or line.strip().startswith('Sort ')
+    return used, scans, temp_sort
+
+
+def app_indexes(include_fk=False):
+    """
+    {имя индекса: (таблица, столбцы)} для таблиц приложения finance, без первичных ключей и UNIQUE-ограничений.
+    Одностолбцовые индексы внешних ключей по умолчанию не включаются: они нужны для JOIN и каскадного удаления.
+    """
+    from django.apps import apps
+    result = {}
+    with connection.cursor() as cursor:
+        for model in apps.get_app_config('finance').get_models():
+            table = model._meta.db_table
+            fk_columns = {f.column for f in model._meta.concrete_fields if f.is_relation}
+            for name, info in connection.introspection.get_constraints(cursor, table).items():
+                if not info['index'] or info['primary_key'] or info['unique']:
+                    continue
+                if not include_fk and len(info['columns']) == 1 and info['columns'][0] in fk_columns:
+                    continue
+                result[name] = (table, info['columns'])
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Перехватывает запросы страниц и по планам EXPLAIN показывает недостающие и неиспользуемые индексы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Пользователь, от имени которого открываются страницы (по умолчанию — с наибольшим числом транзакций).')
+        parser.add_argument('--url', action='append', dest='urls', help='Страница для аудита (можно несколько).')
+        parser.add_argument('--tables', nargs='*', default=None,
+                            help='Учитывать сканирования только этих таблиц (по умолчанию — все таблицы finance_*).')
+        parser.add_argument('--include-fk', action='store_true', help='Показывать и неиспользованные индексы внешних ключей.')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = CustomUser.objects.filter(username=options['user']).first()
+        else:
+            user = CustomUser.objects.annotate(n=Count('transactions')).order_by('-n').first()
+        if user is None:
+            raise CommandError('Нет пользователя для аудита: создайте данные (seed_data) или укажите --user.')
+        urls = options['urls'] or default_urls(user)
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+
+        queries = OrderedDict()  # нормализованный SQL -> {sql, urls, count}
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                status = client.get(url).status_code
+            self.stdout.write(f'{url}: {status}, запросов {len(ctx.captured_queries)}')
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                entry = queries.setdefault(normalize_sql(sql), {'sql': sql, 'urls': set(), 'count': 0})
+                entry['urls'].add(url)
+                entry['count'] += 1
+
+        tables = options['tables']
+        used_indexes = set()
+        problems = []
+        for entry in queries.values():
+            try:
+                plan = explain_plan(entry['sql'])
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'EXPLAIN не выполнен: {e}'))
+                continue
+            used, scans, temp_sort = analyze_plan(plan)
+            used_indexes |= used
+            scans = {t for t in scans if (t in tables if tables else t.startswith('finance_'))}
+            if scans or temp_sort:
+                problems.append((entry, scans, temp_sort, plan))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nЗапросы без подходящего индекса: {len(problems)}'))
+        for entry, scans, temp_sort, plan in problems:
+            reasons = [f'полное сканирование {", ".join(sorted(scans))}'] if scans else []
+            if temp_sort:
+                reasons.append('сортировка без индекса')
+            self.stdout.write(f"\n[{'; '.join(reasons)}] x{entry['count']} на {', '.join(sorted(entry['urls']))}")
+            self.stdout.write(f"  {entry['sql'][:400]}")
+            for line in plan:
+                self.stdout.write(f'    {line}')
+
+        unused = {name: info for name, info in app_indexes(options['include_fk']).items() if name not in used_indexes}
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nИндексы, не использованные ни одним запросом: {len(unused)}'))
+        for name, (table, columns) in sorted(unused.items(), key=lambda item: item[1]):
+            self.stdout.write(f'  {table}.{name} ({", ".join(columns)})')
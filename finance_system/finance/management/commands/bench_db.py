@@ -0,0 +1,143 @@
+# management/commands/bench_db.py
+"""
+Бенчмарк профилей БД: запросы в секунду для страниц приложения при разных настройках соединений.
+
+Каждый профиль запускается отдельным процессом с нужными переменными окружения
+(DB_CONN_MAX_AGE, SQLITE_WAL, DB_POOL — см. settings.py). Запросы подаются напрямую в WSGI-обработчик
+из нескольких потоков — как у настоящего WSGI-сервера, с сигналами начала/конца запроса,
+которые закрывают или переиспользуют соединения. При DB_ENGINE=postgresql сравниваются профили PostgreSQL.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from finance.models import CustomUser
+
+
+BENCH_USERNAME = 'bench_db_user'
+
+SQLITE_PROFILES = [
+    ('sqlite: соединение на запрос, без WAL', {'DB_CONN_MAX_AGE': '0', 'SQLITE_WAL': '0'}),
+    ('sqlite: постоянные соединения, без WAL', {'DB_CONN_MAX_AGE': '60', 'SQLITE_WAL': '0'}),
+    ('sqlite: постоянные соединения + WAL', {'DB_CONN_MAX_AGE': '60', 'SQLITE_WAL': '1'}),
+]
+
+POSTGRES_PROFILES = [
+    ('postgresql: соединение на запрос', {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '0'}),
+    ('postgresql: постоянные соединения', {'DB_CONN_MAX_AGE': '60', 'DB_POOL': '0'}),
+    ('postgresql: пул psycopg', {'DB_POOL': '1'}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает запросы/сек для разных профилей подключения к БД.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Число запросов на профиль.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Число потоков-клиентов.')
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='Страница для нагрузки (можно несколько). По умолчанию дашборд и уведомления.')
+        parser.add_argument('--run', action='store_true', help='(внутреннее) выполнить один профиль в текущем процессе.')
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or ['/dashboard/', '/notifications/']
+        if options['run']:
+            result = self._run_profile(urls, options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        profiles = list(SQLITE_PROFILES)
+        if settings.DATABASES['default']['ENGINE'].endswith('postgresql'):
+            profiles = list(POSTGRES_PROFILES)
+        CustomUser.objects.get_or_create(username=BENCH_USERNAME)
+        self.stdout.write(f"{options['requests']} запросов, {options['concurrency']} потока(ов), страницы: {', '.join(urls)}\n")
+        try:
+            for name, env in profiles:
+                cmd = [sys.executable, sys.argv[0], 'bench_db', '--run',
+                       '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])]
+                for url in urls:
+                    cmd += ['--url', url]
+                proc = subprocess.run(cmd, env={**os.environ, **env}, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    self.stdout.write(self.style.ERROR(f'{name}: ошибка\n{proc.stderr[-2000:]}'))
+                    continue
+                r = json.loads(proc.stdout.strip().splitlines()[-1])
+                self.stdout.write(
+                    f"{name:42} {r['rps']:8.1f} req/s  p50 {r['p50_ms']:6.1f} мс  p95 {r['p95_ms']:6.1f} мс  "
+                    f"новых соединений: {r['connections']}  не-200: {r['errors']}"
+                )
+        finally:
+            CustomUser.objects.filter(username=BENCH_USERNAME).delete()
+
+    def _run_profile(self, urls, n_requests, concurrency):
+        user = CustomUser.objects.get(username=BENCH_USERNAME)
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        login_client = Client(HTTP_HOST=host)
+        login_client.force_login(user)
+        cookie = '; '.join(f'{k}={v.value}' for k, v in login_client.cookies.items())
+        connections.close_all()
+        handler = WSGIHandler()
+        opened = []
+        errors = []
+        lock = threading.Lock()
+
+        def on_connect(sender, connection, **kwargs):
+            with lock:
+                opened.append(1)
+
+        connection_created.connect(on_connect, weak=False)
+
+        def request(url):
+            path, _, query = url.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': host, 'HTTP_COOKIE': cookie,
+                'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            def start_response(status, headers, exc_info=None):
+                if not status.startswith('200'):
+                    with lock:
+                        errors.append(status)
+
+            response = handler(environ, start_response)
+            for _ in response:
+                pass
+            response.close()  # сигнал request_finished: здесь Django закрывает или оставляет соединение
+
+        def worker(count):
+            timings = []
+            for i in range(count):
+                started = time.perf_counter()
+                request(urls[i % len(urls)])
+                timings.append(time.perf_counter() - started)
+            connections.close_all()
+            return timings
+
+        per_worker = [n_requests // concurrency + (1 if i < n_requests % concurrency else 0) for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = [t for chunk in pool.map(worker, per_worker) for t in chunk]
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        return {
+            'rps': len(timings) / elapsed,
+            'p50_ms': statistics.median(timings) * 1000,
+            'p95_ms': timings[int(len(timings) * 0.95) - 1] * 1000,
+            'connections': len(opened),
+            'errors': len(errors),
+        }
@@ -0,0 +1,114 @@
+# management/commands/bench_reports.py
+"""
+Бенчмарк генерации отчётов на 10 тыс., 100 тыс. и 1 млн транзакций.
+Данные создаются bulk_create во временной транзакции и откатываются после замера.
+PDF режется до REPORT_PDF_MAX_ROWS строк: в выводе указывается, сколько строк реально отрисовано;
+--pdf-max-rows меняет предел на время замера (0 — без предела).
+"""
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from finance.models import Account, Category, CustomUser, Transaction
+from finance.reports import write_excel_report, write_pdf_report
+
+
+WRITERS = {
+    'pdf': write_pdf_report,
+    'xlsx': write_excel_report,
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время, пиковую память и размер PDF/Excel-отчётов на больших объёмах транзакций.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Количество транзакций в отчёте.')
+        parser.add_argument('--format', choices=['pdf', 'xlsx', 'all'], default='all', help='Формат отчёта.')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Замерять пиковую память Python (tracemalloc, замедляет генерацию).')
+        parser.add_argument('--pdf-max-rows', type=int, default=None,
+                            help='Предел строк PDF на время замера (0 — без предела); '
+                                 'по умолчанию REPORT_PDF_MAX_ROWS.')
+
+    def handle(self, *args, **options):
+        formats = list(WRITERS) if options['format'] == 'all' else [options['format']]
+        pdf_max_rows = options['pdf_max_rows']
+        if pdf_max_rows is None:
+            pdf_max_rows = getattr(settings, 'REPORT_PDF_MAX_ROWS', None)
+        with override_settings(REPORT_PDF_MAX_ROWS=pdf_max_rows or None):
+            for size in options['sizes']:
+                try:
+                    with transaction.atomic():
+                        user, start, end = self._seed(size)
+                        for fmt in formats:
+                            self._measure(fmt, size, user, start, end, options['trace_memory'])
+                        raise _Rollback
+                except _Rollback:
+                    pass
+
+    def _seed(self, size):
+        rng = random.Random(size)
+        user = CustomUser.objects.create_user('bench_reports_user')
+        account = Account.objects.create(owner=user, name='Бенчмарк')
+        categories = [Category.objects.create(name=f'Категория {i}', owner=user, color='#4361ee') for i in range(12)]
+        end = timezone.now()
+        start = end - timedelta(days=3 * 365)
+        span = int((end - start).total_seconds())
+        start_date, end_date = timezone.localdate(start), timezone.localdate(end)
+        started = time.perf_counter()
+        batch = []
+        for i in range(size):
+            batch.append(Transaction(
+                user=user, account=account, category=rng.choice(categories),
+                amount=Decimal(rng.randint(100, 500_000)) / 100,
+                type='expense' if rng.random() < 0.85 else 'income',
+                description=f'Покупка #{i}',
+                date=start + timedelta(seconds=rng.randrange(span)),
+                created_via='import',
+            ))
+            if len(batch) == 5000:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Transaction.objects.bulk_create(batch)
+        self.stdout.write(f'\n{size} транзакций создано за {time.perf_counter() - started:.1f} с')
+        return user, start_date, end_date
+
+    def _measure(self, fmt, size, user, start, end, trace_memory):
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with tempfile.TemporaryFile() as out:
+            WRITERS[fmt](out, user, start, end)
+            out_size = out.tell()
+        elapsed = time.perf_counter() - started
+        rows = size
+        label = f'{size:>9} строк'
+        if fmt == 'pdf' and settings.REPORT_PDF_MAX_ROWS and size > settings.REPORT_PDF_MAX_ROWS:
+            # PDF обрезается до предела: скорость считается по реально отрисованным строкам
+            rows = settings.REPORT_PDF_MAX_ROWS
+            label = f'{rows:>9} строк (из {size}, предел REPORT_PDF_MAX_ROWS)'
+        peak = ''
+        if trace_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak = f'  пик памяти {peak_bytes / 1024 / 1024:.1f} МБ'
+        self.stdout.write(
+            f'  {fmt:4} {label}: {elapsed:7.2f} с  ({rows / elapsed:,.0f} строк/с)  '
+            f'файл {out_size / 1024 / 1024:.1f} МБ{peak}'
+        )
@@ -0,0 +1,80 @@
+# management/commands/bench_sessions.py
+"""
+Нагрузочный тест сессий: сколько запросов к таблице django_session (и сколько из них записей)
+приходится на один просмотр страницы при разных стратегиях хранения сессий.
+Все данные создаются внутри транзакции и откатываются.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from finance.models import CustomUser
+
+
+SLIDING_MIDDLEWARE = 'finance_system.middleware.SlidingSessionExpiryMiddleware'
+
+PROFILES = [
+    # (название, настройки)
+    ('db, сохранение на каждый запрос (было)', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'SESSION_SAVE_EVERY_REQUEST': True,
+        'MIDDLEWARE': [m for m in settings.MIDDLEWARE if m != SLIDING_MIDDLEWARE],
+    }),
+    ('db, скользящее окно', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'SESSION_SAVE_EVERY_REQUEST': False,
+    }),
+    ('cached_db, скользящее окно', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'SESSION_SAVE_EVERY_REQUEST': False,
+    }),
+    ('signed_cookies, скользящее окно', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'SESSION_SAVE_EVERY_REQUEST': False,
+    }),
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает число записей в django_session на запрос для разных стратегий сессий.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Число запросов на профиль.')
+        parser.add_argument('--url', default='/notifications/', help='Страница для запросов (нужен вход).')
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        url = options['url']
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        table = 'django_session'
+        self.stdout.write(f'{n} запросов к {url} на профиль\n')
+        for name, overrides in PROFILES:
+            try:
+                with transaction.atomic(), override_settings(**overrides):
+                    user = CustomUser.objects.create_user('bench_sessions_user', password='bench-pass-123')
+                    client = Client(HTTP_HOST=host)
+                    client.force_login(user)
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as ctx:
+                        for _ in range(n):
+                            client.get(url)
+                    elapsed = time.perf_counter() - started
+                    session_sql = [q['sql'].lstrip().upper() for q in ctx.captured_queries if table in q['sql']]
+                    writes = sum(1 for sql in session_sql if sql.startswith(('INSERT', 'UPDATE', 'DELETE')))
+                    self.stdout.write(
+                        f'{name:45} записей/запрос: {writes / n:.3f}  '
+                        f'запросов к сессиям/запрос: {len(session_sql) / n:.3f}  '
+                        f'всего SQL/запрос: {len(ctx.captured_queries) / n:.1f}  '
+                        f'{n / elapsed:.0f} req/s'
+                    )
+                    raise _Rollback
+            except _Rollback:
+                pass
@@ -0,0 +1,253 @@
+# management/commands/bench_views.py
+"""
+Сквозной бенчмарк основных страниц на тестовом клиенте Django.
+
+Для каждого сценария — задержка p50/p95 (мс), число SQL-запросов и пиковая память Python одного запроса
+(tracemalloc, отдельным прогоном, чтобы не искажать время). Результат пишется в JSON; с --compare
+сравнивается с прошлым файлом, и рост p95/запросов сверх --threshold считается регрессией.
+
+Запускать на большой БД (python manage.py seed_scale ...). Изменяющие запросы (импорт Excel, пополнение цели)
+выполняются в точке сохранения, которая откатывается, а поднятые ими версии кэша восстанавливаются — данные
+и закэшированные виджеты не меняются между прогонами.
+Для админ-панели создаётся временный сотрудник, после замера он удаляется.
+"""
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from io import BytesIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from finance.models import CustomUser, Family, FinancialGoal, Transaction
+from finance.utils.cache import data_versions, restore_data_versions
+
+
+BENCH_STAFF_USERNAME = 'bench_views_staff'
+SCENARIOS = ('dashboard', 'family_detail', 'family_admin_chart', 'notifications_list',
+             'import_transactions_excel', 'add_money_to_goal', 'site_admin_dashboard')
+
+
+def percentile(values, pct):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def excel_upload(rows):
+    """xlsx-файл для импорта: дата, сумма, категория, магазин."""
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['Дата', 'Сумма', 'Категория', 'Магазин'])
+    today = timezone.localdate()
+    for i in range(rows):
+        ws.append([today.isoformat(), 100 + i % 900, 'Продукты', f'Магазин {i % 17}'])
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Замеряет p50/p95, число SQL-запросов и пиковую память основных страниц; результат — JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Пользователь для замеров (по умолчанию — участник семьи с наибольшим числом транзакций).')
+        parser.add_argument('--iterations', type=int, default=20, help='Замеров на сценарий.')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на сценарий (не учитываются).')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Только указанные сценарии (можно несколько).')
+        parser.add_argument('--import-rows', type=int, default=200, help='Строк в файле импорта Excel.')
+        parser.add_argument('--output', help='Файл результатов (по умолчанию bench_results/bench_views-<коммит>.json).')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--threshold', type=float, default=20.0, help='Допустимый рост p95 и числа запросов, %%.')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Завершиться с ошибкой при регрессии.')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = CustomUser.objects.filter(username=options['user']).first()
+        else:
+            # Самый активный пользователь, по возможности — участник семьи, чтобы замерить и семейные страницы
+            ranked = CustomUser.objects.annotate(n=Count('transactions')).order_by('-n')
+            user = ranked.filter(family_memberships__isnull=False).first() or ranked.first()
+        if user is None:
+            raise CommandError('Нет данных для замеров: заполните БД (seed_scale) или укажите --user.')
+
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        staff, _ = CustomUser.objects.get_or_create(username=BENCH_STAFF_USERNAME, defaults={'is_staff': True})
+        staff_client = Client(HTTP_HOST=host)
+        staff_client.force_login(staff)
+        try:
+            scenarios = self.build_scenarios(user, client, staff_client, options)
+            results = {}
+            for name in options['scenarios'] or SCENARIOS:
+                if name not in scenarios:
+                    self.stdout.write(self.style.WARNING(f'{name}: пропущен (нет данных для сценария)'))
+                    continue
+                results[name] = self.measure(scenarios[name], options['iterations'], options['warmup'])
+                r = results[name]
+                self.stdout.write(
+                    f"{name:28} p50 {r['p50_ms']:8.1f} мс  p95 {r['p95_ms']:8.1f} мс  "
+                    f"запросов {r['queries']:4}  память {r['peak_memory_kb']:8.0f} КБ  HTTP {r['status']}"
+                )
+        finally:
+            CustomUser.objects.filter(username=BENCH_STAFF_USERNAME).delete()
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'user': user.username,
+                'user_transactions': Transaction.objects.filter(user=user).count(),
+                'total_transactions': Transaction.objects.count(),
+                'iterations': options['iterations'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+            },
+            'results': results,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'bench_results', f"bench_views-{report['meta']['commit'] or 'local'}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+
+        if options['compare']:
+            regressions = self.compare(options['compare'], results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Регрессии: {", ".join(regressions)}')
+
+    def build_scenarios(self, user, client, staff_client, options):
+        """{имя: функция одного запроса}. Сценарии без нужных данных (нет семьи, цели) не включаются."""
+        scenarios = {
+            'dashboard': lambda: client.get(reverse('dashboard')),
+            'notifications_list': lambda: client.get(reverse('notifications_list')),
+            'site_admin_dashboard': lambda: staff_client.get(reverse('admin_dashboard')),
+        }
+        family = Family.objects.filter(Q(created_by=user) | Q(members__user=user)).order_by('created_at').first()
+        if family:
+            scenarios['family_detail'] = lambda: client.get(reverse('family_detail', args=[family.id]))
+            scenarios['family_admin_chart'] = lambda: client.get(reverse('family_admin_chart', args=[family.id]))
+        # Версии кэша, которые поднимают изменяющие сценарии: после отката транзакции они восстанавливаются
+        scopes = [('user', user.pk)] + [
+            ('family', family_id) for family_id in
+            Family.objects.filter(Q(created_by=user) | Q(members__user=user)).values_list('pk', flat=True).distinct()
+        ]
+        goal = FinancialGoal.objects.filter(
+            Q(user=user) | Q(family__members__user=user), status='active',
+        ).order_by('created_at').first()
+        if goal:
+            goal_url = reverse('add_money_to_goal', args=[goal.id])
+            scenarios['add_money_to_goal'] = lambda: self.rolled_back(
+                lambda: client.post(goal_url, {'amount': '100', 'action': 'add'}), scopes
+            )
+        try:
+            payload = excel_upload(options['import_rows'])
+        except ImportError:
+            payload = None
+        if payload is not None:
+            import_url = reverse('import_transactions_excel')
+            mime = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            scenarios['import_transactions_excel'] = lambda: self.rolled_back(
+                lambda: client.post(import_url, {'excel_file': SimpleUploadedFile('import.xlsx', payload, content_type=mime)}),
+                scopes,
+            )
+        return scenarios
+
+    @staticmethod
+    def rolled_back(request, scopes):
+        """Выполняет изменяющий запрос и откатывает его: и транзакцию БД, и поднятые им версии кэша."""
+        versions = data_versions(scopes)
+        try:
+            with transaction.atomic():
+                response = request()
+                transaction.set_rollback(True)
+        finally:
+            restore_data_versions(versions)
+        return response
+
+    def measure(self, run, iterations, warmup):
+        for _ in range(warmup):
+            run()
+        timings, queries, status = [], [], None
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = run()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(ctx.captured_queries))
+            status = response.status_code
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'status': status,
+        }
+
+    def compare(self, path, results, threshold):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nСравнение с {path} (коммит {baseline.get('meta', {}).get('commit')}), порог {threshold:.0f}%"
+        ))
+        regressions = []
+        for name, current in results.items():
+            before = baseline.get('results', {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'queries', 'peak_memory_kb'):
+                old, new = before.get(key), current[key]
+                if old:
+                    changes.append((key, old, new, (new - old) / old * 100))
+            regressed = [key for key, old, new, pct in changes if key in ('p95_ms', 'queries') and pct > threshold]
+            line = '  '.join(f'{key} {old}→{new} ({pct:+.0f}%)' for key, old, new, pct in changes)
+            if regressed:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f'{name:28} {line}'))
+            else:
+                self.stdout.write(f'{name:28} {line}')
+        return regressions
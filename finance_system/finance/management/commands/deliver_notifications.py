@@ -0,0 +1,34 @@
+# management/commands/deliver_notifications.py
+"""Воркер доставки уведомлений по email и Telegram из очереди NotificationDelivery. Для продакшена — отдельный процесс с --loop."""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from finance.utils.notification_delivery import CHANNELS, channel_configured, deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Отправляет уведомления из очереди доставки (email, telegram) пачками, с повтором неудачных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, опрашивая очередь.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Пауза между опросами очереди, сек.')
+        parser.add_argument('--channel', choices=CHANNELS, action='append', help='Только указанный канал (можно несколько).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Записей в одной пачке.')
+
+    def handle(self, *args, **options):
+        channels = options['channel'] or CHANNELS
+        for channel in channels:
+            if not channel_configured(channel):
+                self.stdout.write(self.style.WARNING(f'Канал {channel} не настроен (TELEGRAM_BOT_TOKEN) — пропуск.'))
+        while True:
+            close_old_connections()
+            totals = deliver_pending(channels, batch_size=options['batch_size'])
+            for channel, (sent, failed) in totals.items():
+                if sent or failed:
+                    self.stdout.write(f'{channel}: отправлено {sent}, отложено/ошибок {failed}')
+            if not options['loop']:
+                break
+            if not any(sent or failed for sent, failed in totals.values()):
+                time.sleep(options['interval'])
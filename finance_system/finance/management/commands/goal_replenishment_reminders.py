@@ -4,7 +4,10 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 
-from finance.models import FinancialGoal, Notification, FamilyMember  # noqa: F401
+from finance.models import FinancialGoal
+from finance.utils.goal_reminders import reminder_dedup_key
+from finance.utils.metrics import REMINDER_JOB_SECONDS
+from finance.utils.notifications import notify, resolve_recipients
 
 
 FREQUENCY_DAYS = {
@@ -24,11 +27,12 @@ class Command(BaseCommand):
         parser.add_argument('--verbose', action='store_true', help='Подробный вывод.')
         parser.add_argument('--test', action='store_true', help='Создать тестовое уведомление для первой подходящей цели (игнорируя срок).')
 
+    @REMINDER_JOB_SECONDS.time(job='cron')
     def handle(self, *args, **options):
         dry_run = options.get('dry_run', False)
         verbose = options.get('verbose', False)
         test_mode = options.get('test', False)
-        today = timezone.now().date()
+        today = timezone.localdate()  # та же дата, что в ключе напоминаний дашборда
         created = 0
 
         goals = FinancialGoal.objects.filter(
@@ -61,48 +65,28 @@ class Command(BaseCommand):
             title = 'Напоминание: пополнение цели'
             message = f'Цель «{goal.name}»: по графику пополнение {display_freq}. Рекомендуется внести сумму.'
 
-            if goal.family_id:
-                # Семейная цель — уведомляем всех участников семьи
-                users_to_notify = [goal.family.created_by_id]
-                for m in FamilyMember.objects.filter(family=goal.family).select_related('user'):
-                    if m.user_id not in users_to_notify:
-                        users_to_notify.append(m.user_id)
-                for user_id in users_to_notify:
-                    if dry_run:
-                        self.stdout.write(f'[dry-run] Уведомление пользователю {user_id}: {title} — {goal.name}')
-                        created += 1
-                        continue
-                    Notification.objects.create(
-                        user_id=user_id,
-                        notification_type='goal_replenishment_reminder',
-                        title=title,
-                        message=message,
-                        data={
-                            'goal_id': str(goal.id),
-                            'family_id': str(goal.family_id),
-                            'goal_name': goal.name,
-                        },
-                    )
-                    created += 1
-            else:
-                # Личная цель
-                if not goal.user_id:
-                    continue
-                if dry_run:
-                    self.stdout.write(f'[dry-run] Уведомление пользователю {goal.user_id}: {title} — {goal.name}')
-                    created += 1
-                    continue
-                Notification.objects.create(
-                    user=goal.user,
-                    notification_type='goal_replenishment_reminder',
-                    title=title,
-                    message=message,
-                    data={
-                        'goal_id': str(goal.id),
-                        'goal_name': goal.name,
-                    },
+            if not goal.family_id and not goal.user_id:
+                continue
+            if dry_run:
+                recipients = resolve_recipients(
+                    user_ids=[] if goal.family_id else [goal.user_id],
+                    family_ids=[goal.family_id] if goal.family_id else [],
                 )
-                created += 1
+                for recipient in recipients:
+                    self.stdout.write(f'[dry-run] Уведомление пользователю {recipient["id"]}: {title} — {goal.name}')
+                created += len(recipients)
+                continue
+            # Семейная цель — уведомляем всех участников семьи; повтор за день (дашборд уже создал) пропускается
+            data = {'goal_id': str(goal.id), 'goal_name': goal.name}
+            if goal.family_id:
+                data['family_id'] = str(goal.family_id)
+            created += len(notify(
+                'goal_replenishment_reminder', title, message,
+                user_ids=[] if goal.family_id else [goal.user_id],
+                family_ids=[goal.family_id] if goal.family_id else [],
+                data=data,
+                dedup_key=reminder_dedup_key(goal, today),
+            ))
 
         if goals.count() == 0:
             self.stdout.write(self.style.WARNING('Нет целей с заданным графиком пополнения. Укажите «Обязательное пополнение» при создании/редактировании цели.'))
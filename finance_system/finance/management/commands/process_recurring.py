@@ -0,0 +1,34 @@
+# management/commands/process_recurring.py
+"""
+Планировщик повторяющихся транзакций: создаёт наступившие повторы (finance.utils.recurring).
+Для cron — без параметров; как постоянный процесс — с --loop. Несколько экземпляров могут работать одновременно.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from finance.utils.recurring import RECURRING_BATCH_SIZE, process_due
+
+
+class Command(BaseCommand):
+    help = 'Создаёт транзакции по наступившим повторам (is_recurring / next_occurrence).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECURRING_BATCH_SIZE, help='Шаблонов в одной пачке.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Максимум пачек за проход.')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно.')
+        parser.add_argument('--interval', type=float, default=60.0, help='Пауза между проходами, сек.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            started = time.monotonic()
+            templates, created = process_due(batch_size=options['batch_size'], max_batches=options['max_batches'])
+            if templates or not options['loop']:
+                self.stdout.write(
+                    f'Шаблонов: {templates}, создано транзакций: {created} за {time.monotonic() - started:.2f} с'
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+# management/commands/rebuild_budget_spend.py
+"""Расходы по бюджетам: переключение на текущий период (раз в сутки по cron) или полный пересчёт (--full)."""
+from django.core.management.base import BaseCommand
+
+from finance.models import Budget
+from finance.utils.budgets import rebuild_budget_spend, refresh_current_spend
+
+
+class Command(BaseCommand):
+    help = 'Обновляет расходы бюджетов за текущий период; с --full пересчитывает все периоды по транзакциям.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Полный пересчёт всех периодов по истории транзакций.')
+
+    def handle(self, *args, **options):
+        if options['full']:
+            buckets = sum(rebuild_budget_spend(budget) for budget in Budget.objects.all())
+            self.stdout.write(self.style.SUCCESS(f'Пересчитано периодов: {buckets}'))
+        else:
+            updated = refresh_current_spend()
+            self.stdout.write(self.style.SUCCESS(f'Обновлено бюджетов: {updated}'))
@@ -0,0 +1,21 @@
+# management/commands/rebuild_category_rollup.py
+"""Полная перестройка свёртки расходов по категориям и месяцам (после ручных правок в БД или массового импорта через bulk_create)."""
+from django.core.management.base import BaseCommand
+
+from finance.models import CustomUser
+from finance.utils.rollups import rebuild_category_rollup
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает MonthlyCategorySpend по транзакциям.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Только для пользователя (можно несколько).')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Размер пачки вставки.')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(CustomUser.objects.filter(username__in=options['usernames']).values_list('id', flat=True))
+        created = rebuild_category_rollup(user_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Строк свёртки: {created}'))
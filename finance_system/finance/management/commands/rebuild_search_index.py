@@ -0,0 +1,20 @@
+# management/commands/rebuild_search_index.py
+"""
+Перестраивает поисковый индекс транзакций (finance.utils.search).
+SQLite: заново заполняет FTS5-таблицу и пересоздаёт триггеры; PostgreSQL: создаёт GIN-индексы, если их нет.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from finance.utils.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс транзакций (магазин, описание, теги).'
+
+    def handle(self, *args, **options):
+        rebuilt = install_search_index(connection, rebuild=True)
+        if rebuilt:
+            self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Поисковые индексы на месте ({connection.vendor}).'))
@@ -0,0 +1,25 @@
+# management/commands/reconcile_balances.py
+"""Сверка балансов счетов с полным пересчётом по транзакциям (один SQL-запрос). Запускать по cron или после ручных правок в БД."""
+from django.core.management.base import BaseCommand
+
+from finance.utils.balances import find_balance_drift, fix_balances
+
+
+class Command(BaseCommand):
+    help = 'Сверяет Account.balance с пересчётом по транзакциям; с --fix исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Записать пересчитанные балансы.')
+
+    def handle(self, *args, **options):
+        drifted = find_balance_drift()
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Балансы всех счетов совпадают с транзакциями.'))
+            return
+        for account, computed in drifted:
+            self.stdout.write(f'{account.pk} {account.name}: сохранено {account.balance}, по транзакциям {computed}')
+        if options['fix']:
+            fixed = fix_balances()
+            self.stdout.write(self.style.SUCCESS(f'Исправлено счетов: {fixed}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Расхождений: {len(drifted)} (запустите с --fix для исправления)'))
@@ -0,0 +1,31 @@
+# management/commands/run_report_jobs.py
+"""Воркер заданий на отчёты: выполняет задания из очереди. Для продакшена — отдельный процесс с --loop."""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from finance.utils.report_jobs import evict_reports, process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задания на отчёты из очереди (PDF/Excel) и чистит дисковый кэш отчётов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, опрашивая очередь.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза между опросами очереди, сек.')
+        parser.add_argument('--limit', type=int, default=None, help='Максимум заданий за один проход.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            done = process_pending_jobs(limit=options['limit'])
+            if done:
+                self.stdout.write(f'Выполнено заданий: {done}')
+            if not options['loop']:
+                removed = evict_reports()
+                if removed:
+                    self.stdout.write(f'Удалено из кэша отчётов: {removed}')
+                break
+            if not done:
+                time.sleep(options['interval'])
@@ -0,0 +1,388 @@
+# management/commands/seed_scale.py
+"""
+Генератор больших синтетических наборов данных для нагрузочного тестирования.
+
+Создаёт пользователей, семьи, счета, личные категории, бюджеты, цели с пополнениями и транзакции
+с правдоподобными распределениями: число операций на пользователя — логнормальное, суммы — логнормальные
+по категориям, зарплата дважды в месяц, переводы на накопительный счёт, больше кафе и развлечений в выходные.
+
+Воспроизводимость: у каждого пользователя свой генератор случайных чисел, зависящий только от --seed и
+номера пользователя, поэтому результат не зависит от числа процессов (--workers).
+Всё пишется через bulk_create пачками (--chunk-size), сигналы не вызываются; после загрузки балансы, свёртка
+расходов, расходы бюджетов и поисковый индекс пересчитываются целиком (на время загрузки индекс снимается).
+
+Примеры:
+  python manage.py seed_scale --users 1000 --transactions 1000000 --workers 4
+  python manage.py seed_scale --users 50 --transactions 20000 --prefix demo_ --flush
+"""
+import math
+import multiprocessing
+import random
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from finance.management.commands.seed_categories import DEFAULT_CATEGORIES
+from finance.models import (
+    Account, Budget, Category, CustomUser, Family, FamilyMember, FinancialGoal, GoalContribution, Transaction,
+)
+from finance.utils.balances import fix_balances
+from finance.utils.budgets import rebuild_budget_spend
+from finance.utils.rollups import rebuild_category_rollup
+from finance.utils.search import install_search_index, uninstall_search_index
+
+
+# Категория: (медианная сумма, разброс логнормального распределения, частота, магазины)
+CATEGORY_PROFILES = {
+    'Продукты': (900, 0.7, 30, ['Пятёрочка', 'Магнит', 'Перекрёсток', 'Лента', 'ВкусВилл', 'Ашан', 'Дикси']),
+    'Еда': (450, 0.6, 8, ['Самокат', 'Яндекс Лавка', 'Delivery Club', 'Пекарня']),
+    'Кафе и рестораны': (1100, 0.8, 10, ['Шоколадница', 'Кофемания', 'Теремок', 'Вкусно — и точка', 'Тануки']),
+    'Такси': (420, 0.5, 8, ['Яндекс Go', 'Ситимобил', 'Uber']),
+    'Транспорт': (90, 0.6, 12, ['Метро', 'Тройка', 'Автобус', 'Лукойл', 'Газпромнефть']),
+    'Коммунальные услуги': (5200, 0.4, 2, ['ЖКХ', 'Мосэнергосбыт', 'Водоканал']),
+    'Здоровье': (1500, 0.9, 3, ['Аптека Ригла', '36,6', 'Инвитро', 'Стоматология']),
+    'Развлечения': (1300, 0.8, 4, ['Кинопоиск', 'Синема Парк', 'Steam', 'Яндекс Афиша']),
+    'Одежда и обувь': (3500, 0.8, 2, ['Zara', 'Lamoda', 'Wildberries', 'Спортмастер']),
+    'Связь': (550, 0.3, 2, ['МТС', 'Билайн', 'МегаФон', 'Ростелеком']),
+    'Образование': (4000, 0.7, 1, ['Skillbox', 'Литрес', 'Нетология']),
+    'Товары для дома': (1200, 0.9, 4, ['Леруа Мерлен', 'IKEA', 'OZON', 'Fix Price']),
+    'Прочее': (700, 1.0, 4, ['OZON', 'Wildberries', 'AliExpress', 'Почта России']),
+}
+WEEKEND_CATEGORIES = {'Кафе и рестораны', 'Развлечения', 'Такси'}
+PERSONAL_CATEGORIES = [('Питомцы', '#A1887F'), ('Хобби', '#7986CB'), ('Подарки', '#F06292'), ('Спорт', '#4DB6AC')]
+PERSONAL_PROFILE = (1500, 0.9, 3, ['Магазин', 'OZON', 'Wildberries'])
+TAGS = ['работа', 'отпуск', 'ребёнок', 'подарок', 'кэшбэк', 'дача', 'машина']
+FIRST_NAMES = ['Иван', 'Анна', 'Сергей', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена', 'Павел', 'Наталья']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов']
+GOALS = [('Отпуск', 'travel'), ('Подушка безопасности', 'savings'), ('Новый ноутбук', 'purchase'),
+         ('Погасить кредит', 'debt'), ('Курсы английского', 'education'), ('Автомобиль', 'purchase')]
+
+
+def user_rng(seed, index):
+    """Генератор пользователя: зависит только от seed и номера, не от порядка обработки."""
+    return random.Random(f'{seed}:{index}')
+
+
+def lognormal_amount(rng, median, sigma):
+    amount = rng.lognormvariate(math.log(median), sigma)
+    # Мелкие покупки — с копейками, крупные — округлены до рубля
+    return Decimal(f'{amount:.2f}') if amount < 1000 else Decimal(round(amount))
+
+
+def split_total(rng, total, parts, sigma=0.8):
+    """Делит total на parts логнормально распределённых долей (не меньше 1), сумма ровно total."""
+    weights = [rng.lognormvariate(0, sigma) for _ in range(parts)]
+    scale = total / sum(weights)
+    counts = [max(1, int(w * scale)) for w in weights]
+    counts[-1] = max(1, counts[-1] + total - sum(counts))
+    return counts
+
+
+def random_moment(rng, start, end, weekend_boost=False):
+    """Случайный момент в [start, end): днём чаще, чем ночью; для «выходных» категорий — чаще в субботу и воскресенье."""
+    span = (end - start).total_seconds()
+    while True:
+        moment = start + timedelta(seconds=rng.random() * span)
+        if not weekend_boost or moment.weekday() >= 5 or rng.random() < 0.5:
+            break
+    hour = min(23, max(7, int(rng.triangular(7, 23, 19))))
+    moment = timezone.localtime(moment).replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=0)
+    return min(moment, end)
+
+
+def generate_transactions(spec, options, now):
+    """Транзакции одного пользователя — генератор, чтобы не держать в памяти все строки сразу."""
+    rng = user_rng(options['seed'], spec['index'])
+    months = options['months']
+    start = now - timedelta(days=30 * months)
+    categories = spec['categories']  # [(id, name, профиль)]
+    preference = [profile[2] * rng.uniform(0.3, 1.7) for _, _, profile in categories]
+    accounts = spec['accounts']
+    main_account, savings_account = accounts[0], spec.get('savings_account')
+
+    # Доходы: зарплата 5-го и 20-го числа, переводы на накопительный счёт
+    income = spec['monthly_income']
+    month_start = date(start.year, start.month, 1)
+    while month_start <= now.date():
+        for day, share in ((5, Decimal('0.4')), (20, Decimal('0.6'))):
+            moment = timezone.make_aware(datetime(month_start.year, month_start.month, day, 10, rng.randrange(60)))
+            if start <= moment <= now:
+                yield Transaction(
+                    user_id=spec['user_id'], account_id=main_account, type='income', created_via='seed',
+                    amount=(income * share).quantize(Decimal('1')), date=moment, merchant='Зарплата',
+                )
+                if savings_account and day == 20 and rng.random() < 0.7:
+                    yield Transaction(
+                        user_id=spec['user_id'], account_id=main_account, transfer_to_account_id=savings_account,
+                        type='transfer', created_via='seed', date=moment + timedelta(hours=2),
+                        amount=(income * Decimal(rng.uniform(0.05, 0.2))).quantize(Decimal('1')),
+                    )
+        month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+    for _ in range(spec['expenses']):
+        category_id, name, (median, sigma, _, merchants) = rng.choices(categories, weights=preference)[0]
+        family_id = spec['family_id'] if spec['family_id'] and rng.random() < 0.3 else None
+        account_id = spec['family_account'] if family_id and spec['family_account'] else rng.choice(accounts)
+        yield Transaction(
+            user_id=spec['user_id'], account_id=account_id, family_id=family_id, category_id=category_id,
+            type='expense', created_via='seed', amount=max(Decimal('1'), lognormal_amount(rng, median, sigma)),
+            date=random_moment(rng, start, now, weekend_boost=name in WEEKEND_CATEGORIES),
+            merchant=rng.choice(merchants),
+            description=f'Покупка в {rng.choice(merchants)}' if rng.random() < 0.15 else '',
+            tags=[rng.choice(TAGS)] if rng.random() < 0.08 else [],
+        )
+
+
+def insert_transactions(specs, options, now):
+    """Вставляет транзакции пользователей пачками; возвращает число строк. Выполняется и в дочерних процессах."""
+    chunk_size = options['chunk_size']
+    inserted = 0
+    batch = []
+    for spec in specs:
+        for tx in generate_transactions(spec, options, now):
+            batch.append(tx)
+            if len(batch) >= chunk_size:
+                Transaction.objects.bulk_create(batch)
+                inserted += len(batch)
+                batch = []
+    if batch:
+        Transaction.objects.bulk_create(batch)
+        inserted += len(batch)
+    return inserted
+
+
+def _worker(args):
+    specs, options, now = args
+    try:
+        return insert_transactions(specs, options, now)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Генерирует большой синтетический набор данных (пользователи, семьи, счета, цели, миллионы транзакций).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Число пользователей.')
+        parser.add_argument('--transactions', type=int, default=100000, help='Всего расходных транзакций (примерно).')
+        parser.add_argument('--months', type=int, default=24, help='Глубина истории в месяцах.')
+        parser.add_argument('--family-share', type=float, default=0.4, help='Доля пользователей, состоящих в семьях.')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в одном bulk_create.')
+        parser.add_argument('--workers', type=int, default=1, help='Параллельных процессов для вставки транзакций.')
+        parser.add_argument('--prefix', default='load_', help='Префикс логинов создаваемых пользователей.')
+        parser.add_argument('--password', default='loadtest123', help='Пароль всех создаваемых пользователей.')
+        parser.add_argument('--flush', action='store_true', help='Сначала удалить пользователей с этим префиксом.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        prefix = options['prefix']
+        existing = CustomUser.objects.filter(username__startswith=prefix)
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError(f'Пользователи с префиксом «{prefix}» уже есть: укажите --flush или другой --prefix.')
+            deleted = self.flush(existing)
+            self.stdout.write(f'Удалено пользователей: {deleted}')
+
+        rng = random.Random(options['seed'])
+        now = timezone.now().replace(microsecond=0)
+        specs = self.create_owners(rng, options)
+        self.stdout.write(f'Пользователи, семьи, счета, бюджеты и цели: {time.monotonic() - started:.1f} с')
+
+        # Поисковый индекс строится один раз после загрузки, а не триггером на каждую строку
+        uninstall_search_index(connection)
+        try:
+            inserted = self.create_transactions(specs, options, now)
+        finally:
+            install_search_index(connection, rebuild=True)
+        self.stdout.write(f'Транзакций: {inserted} за {time.monotonic() - started:.1f} с')
+
+        user_ids = [spec['user_id'] for spec in specs]
+        fixed = fix_balances(Account.objects.filter(owner_id__in=user_ids))
+        rollup_rows = rebuild_category_rollup(user_ids)
+        for budget in Budget.objects.filter(user_id__in=user_ids):
+            rebuild_budget_spend(budget)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с: пользователей {len(specs)}, транзакций {inserted}, '
+            f'счетов с пересчитанным балансом {fixed}, строк свёртки {rollup_rows}.'
+        ))
+
+    def flush(self, existing):
+        """
+        Удаляет пользователей с префиксом и всё, что им принадлежит. Собственные транзакции этих пользователей
+        удаляются SQL-запросом DELETE по пачкам пользователей, без сигналов: их балансы, свёртки и бюджеты
+        удаляются вместе с ними, а построчные post_delete на миллионах строк заняли бы часы. Остальное (семьи,
+        счета с транзакциями других пользователей) удаляется штатным delete() с сигналами; затем для других
+        пользователей, чьи данные касались удалённых, балансы, свёртка и расходы бюджетов пересчитываются.
+        """
+        user_ids = list(existing.values_list('pk', flat=True))
+        own = Transaction.objects.filter(user_id__in=user_ids)
+        others = Transaction.objects.exclude(user_id__in=user_ids)
+        # Чужие счета и семьи, в которые попадали удаляемые транзакции, и другие участники семей удаляемых
+        accounts = set(own.exclude(account__owner_id__in=user_ids).values_list('account_id', flat=True))
+        accounts |= set(
+            own.filter(transfer_to_account__isnull=False).exclude(transfer_to_account__owner_id__in=user_ids)
+            .values_list('transfer_to_account_id', flat=True)
+        )
+        families = set(
+            own.filter(family__isnull=False).exclude(family__created_by_id__in=user_ids).values_list('family_id', flat=True)
+        )
+        members = set(
+            others.filter(Q(family__created_by_id__in=user_ids) | Q(account__owner_id__in=user_ids))
+            .values_list('user_id', flat=True)
+        )
+        others.filter(recurring_source__user_id__in=user_ids).update(recurring_source=None)
+
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        column = connection.ops.quote_name(Transaction._meta.get_field('user').column)
+        pk_field = CustomUser._meta.pk
+        uninstall_search_index(connection)
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for i in range(0, len(user_ids), 500):
+                        chunk = [pk_field.get_db_prep_value(pk, connection) for pk in user_ids[i:i + 500]]
+                        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(chunk))})', chunk)
+                Family.objects.filter(created_by_id__in=user_ids).delete()
+                deleted = existing.delete()[1].get('finance.CustomUser', 0)
+        finally:
+            install_search_index(connection, rebuild=True)
+
+        fix_balances(Account.objects.filter(Q(pk__in=accounts) | Q(owner_id__in=members)))
+        if members:
+            rebuild_category_rollup(members)
+        for budget in Budget.objects.filter(Q(family_id__in=families) | Q(user_id__in=members, family__isnull=True)):
+            rebuild_budget_spend(budget)
+        return deleted
+
+    def create_owners(self, rng, options):
+        """Пользователи, семьи, счета, категории, бюджеты, цели и пополнения. Возвращает описания пользователей для генерации транзакций."""
+        n_users = options['users']
+        chunk = options['chunk_size']
+        password = make_password(options['password'])
+        system = {}
+        for item in DEFAULT_CATEGORIES:
+            category, _ = Category.objects.get_or_create(
+                name=item['name'], is_system=True, owner=None, defaults={'type': 'expense', 'color': item['color']},
+            )
+            system[item['name']] = category.id
+        expenses = split_total(rng, options['transactions'], n_users) if n_users else []
+
+        users, specs = [], []
+        for i in range(n_users):
+            urng = user_rng(options['seed'], i)
+            first, last = urng.choice(FIRST_NAMES), urng.choice(LAST_NAMES)
+            user = CustomUser(
+                username=f'{options["prefix"]}{i:06d}', email=f'{options["prefix"]}{i:06d}@example.com',
+                password=password, first_name=first, last_name=last,
+                monthly_income=Decimal(round(urng.lognormvariate(math.log(90000), 0.5), -3)),
+            )
+            users.append(user)
+            specs.append({'index': i, 'user_id': user.id, 'monthly_income': user.monthly_income,
+                          'expenses': expenses[i], 'family_id': None, 'family_account': None})
+
+        families, members, accounts, categories, budgets, goals, contributions = [], [], [], [], [], [], []
+        # Семьи из подряд идущих пользователей по 2–4 человека
+        i = 0
+        while i < n_users:
+            size = rng.randint(2, 4)
+            if rng.random() < options['family_share'] and i + size <= n_users:
+                family = Family(name=f'Семья {users[i].last_name}', created_by_id=users[i].id)
+                families.append(family)
+                family_account = Account(name='Семейный бюджет', account_type='debit', ownership='family',
+                                         owner_id=users[i].id, family_id=family.id)
+                accounts.append(family_account)
+                for k in range(size):
+                    members.append(FamilyMember(family_id=family.id, user_id=users[i + k].id,
+                                                role='creator' if k == 0 else 'member'))
+                    specs[i + k]['family_id'] = family.id
+                    specs[i + k]['family_account'] = family_account.id
+                goals.append(FinancialGoal(name='Семейный отпуск', goal_type='travel', family_id=family.id,
+                                           target_amount=Decimal(rng.randrange(100, 600) * 1000),
+                                           deadline=timezone.localdate() + timedelta(days=rng.randint(60, 700))))
+                i += size
+            else:
+                i += 1
+
+        for user, spec in zip(users, specs):
+            urng = user_rng(options['seed'], spec['index'])
+            own = [Account(name='Основная карта', account_type='debit', owner_id=user.id,
+                           initial_balance=Decimal(urng.randrange(0, 50) * 1000))]
+            if urng.random() < 0.6:
+                own.append(Account(name='Наличные', account_type='cash', owner_id=user.id,
+                                   initial_balance=Decimal(urng.randrange(0, 20) * 500)))
+            savings = Account(name='Накопительный', account_type='savings', owner_id=user.id) if urng.random() < 0.4 else None
+            accounts.extend(own + ([savings] if savings else []))
+            spec['accounts'] = [a.id for a in own]
+            spec['savings_account'] = savings.id if savings else None
+            spec['categories'] = [(system[name], name, profile) for name, profile in CATEGORY_PROFILES.items() if name in system]
+            for name, color in urng.sample(PERSONAL_CATEGORIES, urng.randint(0, 2)):
+                category = Category(name=name, color=color, owner_id=user.id)
+                categories.append(category)
+                spec['categories'].append((category.id, name, PERSONAL_PROFILE))
+            if urng.random() < 0.3:
+                budgets.append(Budget(name='Продукты', period='monthly', amount=Decimal(urng.randrange(15, 40) * 1000),
+                                      user_id=user.id, category_id=system.get('Продукты'),
+                                      start_date=timezone.localdate().replace(day=1) - timedelta(days=365)))
+            for name, goal_type in urng.sample(GOALS, urng.randint(0, 2)):
+                goals.append(FinancialGoal(name=name, goal_type=goal_type, user_id=user.id,
+                                           target_amount=Decimal(urng.randrange(20, 500) * 1000),
+                                           replenishment_frequency=urng.choice(['', 'weekly', 'monthly']),
+                                           deadline=timezone.localdate() + timedelta(days=urng.randint(30, 900))))
+
+        member_users = {}
+        for member in members:
+            member_users.setdefault(member.family_id, []).append(member.user_id)
+        for goal in goals:
+            contributors = member_users.get(goal.family_id, [goal.user_id])
+            total = Decimal('0')
+            for _ in range(rng.randint(0, 24)):
+                amount = Decimal(rng.randrange(1, 30) * 500)
+                total += amount
+                contributions.append(GoalContribution(
+                    goal_id=goal.id, amount=amount, user_id=rng.choice(contributors),
+                    contributed_at=timezone.now() - timedelta(days=rng.randint(0, 30 * options['months'])),
+                ))
+            # bulk_create не вызывает FinancialGoal.save(): прогресс и статус считаем здесь
+            goal.current_amount = total
+            goal.progress_percentage = min(100.0, float(total / goal.target_amount * 100))
+            goal.status = 'completed' if total >= goal.target_amount else 'active'
+
+        for account in accounts:
+            account.balance = account.initial_balance
+        with transaction.atomic():
+            for model, rows in ((CustomUser, users), (Family, families), (FamilyMember, members),
+                                (Account, accounts), (Category, categories), (Budget, budgets),
+                                (FinancialGoal, goals), (GoalContribution, contributions)):
+                model.objects.bulk_create(rows, batch_size=chunk)
+        return specs
+
+    def create_transactions(self, specs, options, now):
+        workers = max(1, options['workers'])
+        if workers == 1:
+            return insert_transactions(specs, options, now)
+        # Пользователи раздаются процессам небольшими группами — крупные и мелкие перемешиваются
+        groups = [specs[i:i + 20] for i in range(0, len(specs), 20)]
+        # Дочерние процессы открывают собственные соединения с БД
+        connections.close_all()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        inserted = 0
+        with context.Pool(workers, initializer=_init_worker) as pool:
+            for count in pool.imap_unordered(_worker, [(group, options, now) for group in groups]):
+                inserted += count
+                self.stdout.write(f'  вставлено {inserted}', ending='\r')
+        self.stdout.write('')
+        return inserted
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_unread_counts(apps, schema_editor):
+    """Начальное заполнение счётчика непрочитанных уведомлений."""
+    from django.db.models import Count, OuterRef, Subquery, Value
+    from django.db.models.functions import Coalesce
+    CustomUser = apps.get_model('finance', 'CustomUser')
+    Notification = apps.get_model('finance', 'Notification')
+    unread = Notification.objects.filter(
+        user_id=OuterRef('pk'), is_read=False
+    ).order_by().values('user_id').annotate(c=Count('id')).values('c')
+    CustomUser.objects.update(unread_notifications_count=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0007_remove_unused_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('notification_type', models.CharField(choices=[('budget_warning', 'Превышение бюджета'), ('bill_reminder', 'Напоминание о счете'), ('goal_progress', 'Прогресс цели'), ('goal_replenishment_reminder', 'Напоминание о пополнении цели'), ('family_invite', 'Приглашение в семью'), ('member_joined', 'Участник присоединился к семье'), ('transaction_added', 'Добавлена транзакция'), ('system', 'Системное уведомление')], max_length=30)),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Архивное уведомление',
+                'verbose_name_plural': 'Архив уведомлений',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_notifications_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Непрочитанных уведомлений'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at'], name='finance_not_user_id_135222_idx'),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationarchive',
+            index=models.Index(fields=['user', '-created_at'], name='finance_not_user_id_82bf10_idx'),
+        ),
+        migrations.RunPython(fill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:54
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_notification_inbox_index_and_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('format', models.CharField(choices=[('xlsx', 'Excel'), ('pdf', 'PDF')], default='xlsx', max_length=4)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('data_version', models.CharField(blank=True, max_length=64)),
+                ('cache_key', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Задание на отчёт',
+                'verbose_name_plural': 'Задания на отчёты',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='finance_rep_status_384d56_idx'), models.Index(fields=['user', '-created_at'], name='finance_rep_user_id_8665e9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:55
+
+from django.db import migrations
+
+
+def recompute_balances(apps, schema_editor):
+    """Начальное заполнение Account.balance по уже существующим транзакциям."""
+    from decimal import Decimal
+    from django.db.models import Q, Sum
+    Account = apps.get_model('finance', 'Account')
+    Transaction = apps.get_model('finance', 'Transaction')
+    balances = {}
+    rows = Transaction.objects.order_by().values('account_id').annotate(
+        income=Sum('amount', filter=Q(type='income')),
+        outgoing=Sum('amount', filter=Q(type__in=['expense', 'transfer'])),
+    )
+    for row in rows:
+        balances[row['account_id']] = (row['income'] or 0) - (row['outgoing'] or 0)
+    incoming = Transaction.objects.filter(type='transfer', transfer_to_account__isnull=False).order_by().values(
+        'transfer_to_account_id').annotate(total=Sum('amount'))
+    for row in incoming:
+        account_id = row['transfer_to_account_id']
+        balances[account_id] = balances.get(account_id, 0) + row['total']
+    for account in Account.objects.only('id', 'initial_balance', 'balance'):
+        balance = account.initial_balance + balances.get(account.id, Decimal('0'))
+        if balance != account.balance:
+            Account.objects.filter(pk=account.pk).update(balance=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0009_report_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_recompute_account_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetPeriodSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('warned_at', models.DateTimeField(blank=True, null=True)),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_spends', to='finance.budget')),
+            ],
+            options={
+                'verbose_name': 'Расходы бюджета за период',
+                'verbose_name_plural': 'Расходы бюджетов по периодам',
+                'constraints': [models.UniqueConstraint(fields=('budget', 'period_start'), name='uniq_budget_period_spend')],
+            },
+        ),
+    ]
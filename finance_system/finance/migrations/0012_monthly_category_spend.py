@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_rollup(apps, schema_editor):
+    """Начальное заполнение свёртки по существующим расходам."""
+    from datetime import datetime
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncMonth
+    Transaction = apps.get_model('finance', 'Transaction')
+    MonthlyCategorySpend = apps.get_model('finance', 'MonthlyCategorySpend')
+    rows = (
+        Transaction.objects.filter(type='expense').order_by()
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'family_id', 'category_id', 'month')
+        .annotate(total=Sum('amount'), n=Count('id'))
+    )
+    MonthlyCategorySpend.objects.bulk_create([
+        MonthlyCategorySpend(
+            user_id=row['user_id'], family_id=row['family_id'], category_id=row['category_id'],
+            month=row['month'].date() if isinstance(row['month'], datetime) else row['month'],
+            amount=row['total'], count=row['n'],
+        )
+        for row in rows
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_budget_period_spend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategorySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spends', to='finance.category')),
+                ('family', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_category_spends', to='finance.family')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_category_spends', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Расходы категории за месяц',
+                'verbose_name_plural': 'Расходы по категориям и месяцам',
+                'indexes': [models.Index(fields=['user', 'month'], name='finance_mon_user_id_5e4e48_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False), ('family__isnull', False)), fields=('user', 'family', 'category', 'month'), name='uniq_mcs_family_category'), models.UniqueConstraint(condition=models.Q(('category__isnull', False), ('family__isnull', True)), fields=('user', 'category', 'month'), name='uniq_mcs_category'), models.UniqueConstraint(condition=models.Q(('category__isnull', True), ('family__isnull', False)), fields=('user', 'family', 'month'), name='uniq_mcs_family_uncategorized'), models.UniqueConstraint(condition=models.Q(('category__isnull', True), ('family__isnull', True)), fields=('user', 'month'), name='uniq_mcs_uncategorized')],
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_monthly_category_spend'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='finance_not_user_id_135222_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='finance_tra_user_id_3294c0_idx',
+        ),
+        migrations.AddIndex(
+            model_name='financialgoal',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['replenishment_frequency'], name='goal_active_replenish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goalcontribution',
+            index=models.Index(fields=['goal', '-contributed_at'], name='contrib_goal_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notif_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-date', '-created_at'], name='tx_user_date_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'type', 'date'], name='tx_user_type_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    """Поисковый индекс транзакций: GIN по tsvector и тегам (PostgreSQL) или FTS5 с триггерами (SQLite)."""
+    from finance.utils.search import install_search_index
+    install_search_index(schema_editor.connection, rebuild=True)
+
+
+def uninstall(apps, schema_editor):
+    from finance.utils.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_transaction_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
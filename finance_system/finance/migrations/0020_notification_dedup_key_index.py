@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0019_report_job_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('dedup_key__isnull', False)), fields=['dedup_key'], name='notif_dedup_key_idx'),
+        ),
+    ]
@@ -14,6 +14,8 @@ class CustomUser(AbstractUser):
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     default_currency = models.CharField(max_length=3, default='RUB')
     monthly_income = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Денормализованный счётчик непрочитанных уведомлений (обновляется сигналами, см. finance/signals.py)
+    unread_notifications_count = models.PositiveIntegerField(default=0, verbose_name='Непрочитанных уведомлений')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -127,6 +129,20 @@ class Account(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_account_type_display()})"
 
+    def save(self, *args, **kwargs):
+        # Новый счёт начинает с начального остатка; дальше balance меняют только транзакции
+        # атомарными UPDATE (finance/utils/balances.py). Существующий счёт без явных update_fields
+        # сохраняется без balance: устаревшее значение в памяти иначе затёрло бы параллельные изменения
+        if self._state.adding:
+            if not self.balance:
+                self.balance = self.initial_balance
+        elif kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'balance'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     """Категории операций с иерархической структурой"""
@@ -212,6 +228,9 @@ class Transaction(models.Model):
     is_recurring = models.BooleanField(default=False)
     recurring_rule = models.CharField(max_length=100, blank=True, null=True)  # Например: "monthly", "weekly"
     next_occurrence = models.DateTimeField(null=True, blank=True)
+    # Для операций, созданных планировщиком (finance.utils.recurring), — исходная повторяющаяся транзакция
+    recurring_source = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                         related_name='occurrences')
 
     # Теги для поиска
     tags = models.JSONField(default=list, blank=True)
@@ -229,7 +248,17 @@ class Transaction(models.Model):
             models.Index(fields=['date']),
             models.Index(fields=['type', 'date']),
             models.Index(fields=['category', 'date']),
-            models.Index(fields=['user', 'date']),
+            # Лента транзакций с keyset-пагинацией (user, order_by -date, -created_at, -id) и фильтры по периоду (user, date)
+            models.Index(fields=['user', '-date', '-created_at', '-id'], name='tx_user_feed_idx'),
+            # Расходы пользователя за период без свёртки (пересчёт бюджетов, выборки по типу операции)
+            models.Index(fields=['user', 'type', 'date'], name='tx_user_type_date_idx'),
+            # Выборка наступивших повторов планировщиком: только повторяющиеся транзакции
+            models.Index(fields=['next_occurrence'], name='tx_recurring_due_idx', condition=models.Q(is_recurring=True)),
+        ]
+        constraints = [
+            # Одно вхождение повтора на дату: повторный или параллельный запуск планировщика не создаёт дублей
+            models.UniqueConstraint(fields=['recurring_source', 'date'], name='uniq_recurring_occurrence',
+                                    condition=models.Q(recurring_source__isnull=False)),
         ]
 
     def __str__(self):
@@ -284,6 +313,63 @@ class Budget(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_period_display()})"
 
+
+class BudgetPeriodSpend(models.Model):
+    """Расходы по бюджету за один период (день/неделя/месяц/квартал/год). Обновляется инкрементально, см. finance/utils/budgets.py."""
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name='period_spends')
+    period_start = models.DateField()
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    warned_at = models.DateTimeField(null=True, blank=True)  # когда отправлено предупреждение о пороге
+
+    class Meta:
+        verbose_name = 'Расходы бюджета за период'
+        verbose_name_plural = 'Расходы бюджетов по периодам'
+        constraints = [
+            models.UniqueConstraint(fields=['budget', 'period_start'], name='uniq_budget_period_spend'),
+        ]
+
+    def __str__(self):
+        return f"{self.budget.name} с {self.period_start}: {self.spent}"
+
+
+class MonthlyCategorySpend(models.Model):
+    """Свёртка расходов по месяцам: пользователь, семья, категория. Обновляется инкрементально, см. finance/utils/rollups.py."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='monthly_category_spends')
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, null=True, blank=True, related_name='monthly_category_spends')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='monthly_spends')
+    month = models.DateField()  # первое число месяца (локальное время)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Расходы категории за месяц'
+        verbose_name_plural = 'Расходы по категориям и месяцам'
+        # family и category могут быть NULL — уникальность задаётся отдельно для каждого сочетания
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'family', 'category', 'month'], name='uniq_mcs_family_category',
+                condition=models.Q(family__isnull=False, category__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'category', 'month'], name='uniq_mcs_category',
+                condition=models.Q(family__isnull=True, category__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'family', 'month'], name='uniq_mcs_family_uncategorized',
+                condition=models.Q(family__isnull=False, category__isnull=True),
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'month'], name='uniq_mcs_uncategorized',
+                condition=models.Q(family__isnull=True, category__isnull=True),
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} {self.category_id}: {self.amount}"
+
 class FinancialGoal(models.Model):
     """Финансовые цели для накопления"""
     GOAL_TYPES = [
@@ -360,6 +446,11 @@ class FinancialGoal(models.Model):
     class Meta:
         verbose_name = 'Финансовая цель'
         verbose_name_plural = 'Финансовые цели'
+        indexes = [
+            # Напоминания о пополнении: только активные цели с заданной периодичностью
+            models.Index(fields=['replenishment_frequency'], name='goal_active_replenish_idx',
+                         condition=models.Q(status='active')),
+        ]
         ordering = ['deadline']
 
     def save(self, *args, **kwargs):
@@ -387,6 +478,10 @@ class GoalContribution(models.Model):
         verbose_name = 'Пополнение цели'
         verbose_name_plural = 'Пополнения целей'
         ordering = ['-contributed_at']
+        indexes = [
+            # Пополнения целей семьи за период (графики семьи): goal_id IN (...) AND contributed_at >= ... < ...
+            models.Index(fields=['goal', '-contributed_at'], name='contrib_goal_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.goal.name}: +{self.amount} ({self.contributed_at.date()})"
@@ -416,6 +511,8 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     is_sent = models.BooleanField(default=False)
     sent_via = models.CharField(max_length=20, default='in_app')  # in_app, email, push, telegram
+    # Ключ события для защиты от повторов (например, «цель:дата» у напоминаний); пусто — без проверки
+    dedup_key = models.CharField(max_length=100, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
@@ -424,10 +521,83 @@ class Notification(models.Model):
         verbose_name = 'Уведомление'
         verbose_name_plural = 'Уведомления'
         ordering = ['-created_at']
+        indexes = [
+            # Лента уведомлений: непрочитанные первыми, затем по дате и id (курсор inbox_page)
+            models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notif_inbox_idx'),
+            # Проверка «событие уже разослано» по ключу без получателя (напоминания о целях на дашборде)
+            models.Index(fields=['dedup_key'], name='notif_dedup_key_idx', condition=models.Q(dedup_key__isnull=False)),
+        ]
+        constraints = [
+            # Одно уведомление на событие: повторная рассылка (cron + дашборд, двойной клик) не создаёт дублей
+            models.UniqueConstraint(fields=['user', 'notification_type', 'dedup_key'], name='uniq_notification_dedup',
+                                    condition=models.Q(dedup_key__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.user.username}"
 
+
+class NotificationArchive(models.Model):
+    """Архив старых прочитанных уведомлений (компактная копия без data и статусов доставки)."""
+    id = models.UUIDField(primary_key=True, editable=False)  # id исходного уведомления
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_notifications')
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Архивное уведомление'
+        verbose_name_plural = 'Архив уведомлений'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.title} (архив)"
+
+
+class NotificationDelivery(models.Model):
+    """Исходящая очередь (outbox) доставки уведомления по внешнему каналу: email, telegram."""
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('telegram', 'Telegram'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    address = models.CharField(max_length=254)  # email или chat_id на момент рассылки
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Доставка уведомления'
+        verbose_name_plural = 'Доставки уведомлений'
+        indexes = [
+            # Выборка очереди воркером доставки: только ожидающие, по времени следующей попытки
+            models.Index(fields=['channel', 'next_attempt_at'], name='delivery_pending_idx',
+                         condition=models.Q(status='pending')),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'channel'], name='uniq_delivery_channel'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} → {self.address} ({self.status})"
+
 class FamilyInvitation(models.Model):
     """Приглашения в семью"""
     STATUS_CHOICES = [
@@ -458,3 +628,47 @@ class FamilyInvitation(models.Model):
 
     def __str__(self):
         return f"{self.invitee_email} → {self.family.name}"
+
+
+class ReportJob(models.Model):
+    """Задание на формирование отчёта (Excel/PDF) за период — выполняется фоновым воркером."""
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('pdf', 'PDF'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Формируется'),
+        ('done', 'Готов'),
+        ('failed', 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='report_jobs')
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES, default='xlsx')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    # Ключ файла в дисковом кэше: (пользователь, период, формат, версия данных)
+    data_version = models.CharField(max_length=64, blank=True)
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)  # захват воркером
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # продлевается воркером при рендере — по нему находятся зависшие задания
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задание на отчёт'
+        verbose_name_plural = 'Задания на отчёты'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_format_display()} {self.start_date}–{self.end_date} ({self.get_status_display()})"
@@ -2,97 +2,199 @@
 Генерация отчетов в форматах Excel и PDF.
 """
 
-import pandas as pd
-from django.http import HttpResponse
+import tempfile
+
+from django.db.models import Sum
+from django.http import FileResponse
+from django.utils import timezone
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+from reportlab.platypus import Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
-from io import BytesIO
-from datetime import datetime
 
 
-def generate_excel_report(user, start_date, end_date):
-    """Генерация Excel отчета"""
-    from .models import Transaction
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-    transactions = Transaction.objects.filter(
-        user=user,
-        date__gte=start_date,
-        date__lte=end_date
-    ).values('date', 'type', 'category__name', 'amount', 'description')
+# Сколько строк забирать из БД за один раз при потоковой выгрузке
+REPORT_CHUNK_SIZE = 2000
 
-    df = pd.DataFrame(list(transactions))
 
-    # Создание Excel файла
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Транзакции', index=False)
+def _report_transactions(user, start_date, end_date):
+    """
+    Транзакции за даты start_date–end_date включительно (как в форме отчёта).
+    Фильтр строится по полуоткрытым границам [начало первого дня, начало дня после последнего),
+    см. finance/utils/periods.py.
+    """
+    from .models import Transaction
+    from .utils.periods import date_range_bounds, period_q
 
-        # Сводная таблица
-        pivot = pd.pivot_table(df, values='amount',
-                               index='category__name',
-                               columns='type',
-                               aggfunc='sum',
-                               fill_value=0)
-        pivot.to_excel(writer, sheet_name='Сводка')
+    return Transaction.objects.filter(period_q('date', *date_range_bounds(start_date, end_date)), user=user)
 
-    output.seek(0)
 
-    response = HttpResponse(
-        output.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+def write_excel_report(fileobj, user, start_date, end_date, progress=None):
+    """
+    Записывает Excel-отчёт в fileobj без загрузки всех транзакций в память:
+    openpyxl в режиме write-only, строки из БД читаются итератором,
+    сводная таблица считается в БД через GROUP BY.
+    progress — необязательный вызываемый объект, вызывается на каждой строке (heartbeat задания).
+    """
+    import openpyxl
+    from .models import Transaction
 
-    return response
+    type_names = dict(Transaction.TRANSACTION_TYPES)
+    transactions = _report_transactions(user, start_date, end_date)
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Транзакции')
+    ws.append(['Дата', 'Тип', 'Категория', 'Сумма', 'Описание'])
+    rows = transactions.order_by('date').values_list(
+        'date', 'type', 'category__name', 'amount', 'description'
+    ).iterator(chunk_size=REPORT_CHUNK_SIZE)
+    for date_val, type_val, category_name, amount, description in rows:
+        if progress is not None:
+            progress()
+        # Excel не поддерживает даты с часовым поясом — пишем локальное время
+        ws.append([
+            timezone.localtime(date_val).replace(tzinfo=None),
+            type_names.get(type_val, type_val),
+            category_name or '-',
+            amount,
+            description,
+        ])
 
+    # Сводная таблица: категории × типы операций
+    totals = transactions.order_by().values('category__name', 'type').annotate(total=Sum('amount'))
+    pivot = {}
+    present_types = set()
+    for row in totals:
+        pivot.setdefault(row['category__name'] or '-', {})[row['type']] = row['total']
+        present_types.add(row['type'])
+    columns = [code for code, _ in Transaction.TRANSACTION_TYPES if code in present_types]
+    ws_pivot = wb.create_sheet('Сводка')
+    ws_pivot.append(['Категория'] + [type_names[code] for code in columns])
+    for category_name in sorted(pivot):
+        ws_pivot.append([category_name] + [pivot[category_name].get(code, 0) for code in columns])
 
-def generate_pdf_report(user, start_date, end_date):
-    """Генерация PDF отчета"""
-    from .models import Transaction
+    wb.save(fileobj)
 
-    transactions = Transaction.objects.filter(
-        user=user,
-        date__gte=start_date,
-        date__lte=end_date
-    )
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
+def generate_excel_report(user, start_date, end_date):
+    """Генерация Excel отчета — файл собирается во временном файле и отдаётся потоком."""
+    tmp = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        write_excel_report(tmp, user, start_date, end_date)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    # FileResponse читает файл блоками и закрывает (удаляет) его после отправки
+    return FileResponse(tmp, as_attachment=True, filename='report.xlsx', content_type=XLSX_CONTENT_TYPE)
+
+
+def _pdf_rows(transactions, limit=None):
+    """Строки таблицы PDF: значения без загрузки моделей, категория — через JOIN, а не запрос на строку."""
+    from .models import Transaction
 
+    type_names = dict(Transaction.TRANSACTION_TYPES)
+    rows = transactions.order_by('date').values_list(
+        'date', 'type', 'category__name', 'amount', 'description'
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    rows = rows.iterator(chunk_size=REPORT_CHUNK_SIZE)
+    for date_val, type_val, category_name, amount, description in rows:
+        yield [
+            timezone.localtime(date_val).strftime('%d.%m.%Y'),
+            type_names.get(type_val, type_val),
+            (category_name or '-')[:25],
+            f"{amount} ₽",
+            (description or '')[:50],
+        ]
+
+
+PDF_MARGIN = 36
+PDF_ROW_HEIGHT = 16
+PDF_COL_WIDTHS = [62, 62, 120, 86, 210]
+PDF_HEADER = ['Дата', 'Тип', 'Категория', 'Сумма', 'Описание']
+PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+
+def write_pdf_report(fileobj, user, start_date, end_date, progress=None):
+    """
+    Записывает PDF-отчёт в fileobj постранично.
+    Строки режутся на таблицы ровно по странице с фиксированными ширинами колонок и высотой строк:
+    reportlab не подбирает размеры по всему содержимому (это сверхлинейно на больших таблицах),
+    и таблица страницы не хранится после отрисовки. Сам Canvas при этом держит все страницы в памяти
+    до save(), поэтому память растёт с числом страниц — отчёт ограничен REPORT_PDF_MAX_ROWS строками,
+    о чём в конце таблицы добавляется пометка (полный список — в Excel-отчёте).
+    progress — необязательный вызываемый объект, вызывается на каждой строке (heartbeat задания).
+    """
+    from django.conf import settings
+    from reportlab.pdfgen.canvas import Canvas
+
+    max_rows = getattr(settings, 'REPORT_PDF_MAX_ROWS', None)
+
+    width, height = letter
+    canvas = Canvas(fileobj, pagesize=letter, pageCompression=1)
     styles = getSampleStyleSheet()
-    elements.append(Paragraph(f"Отчет по транзакциям", styles['Title']))
-    elements.append(Paragraph(f"Период: {start_date} - {end_date}", styles['Normal']))
-    elements.append(Paragraph(f"Пользователь: {user.username}", styles['Normal']))
-
-    # Таблица транзакций
-    data = [['Дата', 'Тип', 'Категория', 'Сумма', 'Описание']]
-
-    for t in transactions:
-        data.append([
-            t.date.strftime('%d.%m.%Y'),
-            t.get_type_display(),
-            t.category.name if t.category else '-',
-            f"{t.amount} ₽",
-            t.description[:50]
-        ])
 
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    top = height - PDF_MARGIN
+    for text, style in [
+        ("Отчет по транзакциям", 'Title'),
+        (f"Период: {start_date:%d.%m.%Y} - {end_date:%d.%m.%Y}", 'Normal'),
+        (f"Пользователь: {user.username}", 'Normal'),
+    ]:
+        paragraph = Paragraph(text, styles[style])
+        _, h = paragraph.wrapOn(canvas, width - 2 * PDF_MARGIN, height)
+        top -= h + 6
+        paragraph.drawOn(canvas, PDF_MARGIN, top)
+    top -= 12
+
+    def draw_page(rows, top):
+        table = Table([PDF_HEADER] + rows, colWidths=PDF_COL_WIDTHS, rowHeights=PDF_ROW_HEIGHT)
+        table.setStyle(PDF_TABLE_STYLE)
+        _, h = table.wrapOn(canvas, width - 2 * PDF_MARGIN, top - PDF_MARGIN)
+        table.drawOn(canvas, PDF_MARGIN, top - h)
+        canvas.showPage()
+
+    page_rows = []
+    capacity = int((top - PDF_MARGIN) // PDF_ROW_HEIGHT) - 1
+    pages = 0
+    written = 0
+    for row in _pdf_rows(_report_transactions(user, start_date, end_date), max_rows + 1 if max_rows else None):
+        if progress is not None:
+            progress()
+        if max_rows and written == max_rows:
+            row = ['...', '', '', '', f'Показаны первые {max_rows} операций'[:50]]
+        written += 1
+        page_rows.append(row)
+        if len(page_rows) == capacity:
+            draw_page(page_rows, top)
+            pages += 1
+            page_rows = []
+            top = height - PDF_MARGIN
+            capacity = int((top - PDF_MARGIN) // PDF_ROW_HEIGHT) - 1
+    if page_rows or not pages:
+        draw_page(page_rows, top)
+    canvas.save()
 
-    elements.append(table)
 
-    doc.build(elements)
-    buffer.seek(0)
-
-    return HttpResponse(buffer.getvalue(), content_type='application/pdf')
\ No newline at end of file
+def generate_pdf_report(user, start_date, end_date):
+    """Генерация PDF отчета — во временном файле (небольшие остаются в памяти), отдаётся потоком."""
+    tmp = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024, suffix='.pdf')
+    try:
+        write_pdf_report(tmp, user, start_date, end_date)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    return FileResponse(tmp, filename='report.pdf', content_type='application/pdf')
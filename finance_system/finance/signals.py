@@ -0,0 +1,146 @@
+"""Сигналы: денормализованные счётчики, балансы счетов, расходы бюджетов и свёртки, версии кэша, настройка соединений с БД, поисковый индекс."""
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Budget, Category, Family, FamilyMember, FinancialGoal, GoalContribution, Notification, Transaction,
+)
+from .utils.balances import apply_balance_deltas, diff_effects, transaction_effects
+from .utils.budgets import apply_transaction_change, rebuild_budget_spend
+from .utils.cache import GLOBAL, bump_data_version
+from .utils.notification_stream import publish_notification
+from .utils.notifications import bump_unread_count
+from .utils.rollups import apply_rollup_change, fold_category_rollup, fold_family_rollup
+from .utils.search import install_search_index
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    """Новое непрочитанное уведомление увеличивает счётчик пользователя и после коммита уходит в SSE-поток."""
+    if created and not instance.is_read:
+        bump_unread_count(instance.user_id, 1)
+        transaction.on_commit(lambda: publish_notification(instance))
+
+
+def _bump_owner_versions(user_id=None, family_id=None):
+    if user_id:
+        bump_data_version('user', user_id)
+    if family_id:
+        bump_data_version('family', family_id)
+
+
+# Поля, от которых зависят балансы счетов, расходы бюджетов и свёртка по категориям
+TRANSACTION_TRACKED_FIELDS = ('type', 'amount', 'account_id', 'transfer_to_account_id',
+                              'date', 'category_id', 'user_id', 'family_id')
+
+
+@receiver(pre_save, sender=Transaction)
+def transaction_remember_state(sender, instance, raw=False, **kwargs):
+    """Перед изменением транзакции запоминаем её прежнее состояние — из него считаются дельты."""
+    instance._old_state = None
+    if raw or instance._state.adding:
+        return
+    old = Transaction.objects.filter(pk=instance.pk).values(*TRANSACTION_TRACKED_FIELDS).first()
+    if old:
+        instance._old_state = Transaction(**old)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        old = getattr(instance, '_old_state', None)
+        old_effects = transaction_effects(old) if old is not None else {}
+        apply_balance_deltas(diff_effects(old_effects, transaction_effects(instance)))
+        apply_transaction_change(old, instance)
+        apply_rollup_change(old, instance)
+    _bump_owner_versions(instance.user_id, instance.family_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    apply_balance_deltas(diff_effects(transaction_effects(instance), {}))
+    apply_transaction_change(instance, None)
+    apply_rollup_change(instance, None)
+    _bump_owner_versions(instance.user_id, instance.family_id)
+
+
+@receiver(post_save, sender=Budget)
+def budget_saved(sender, instance, raw=False, **kwargs):
+    """Период, категории или владелец бюджета могли измениться — пересчитываем его расходы целиком."""
+    if not raw:
+        rebuild_budget_spend(instance)
+
+
+@receiver(m2m_changed, sender=Budget.categories.through)
+def budget_categories_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        rebuild_budget_spend(instance)
+
+
+@receiver([post_save, post_delete], sender=FinancialGoal)
+def goal_changed(sender, instance, **kwargs):
+    _bump_owner_versions(instance.user_id, instance.family_id)
+
+
+@receiver([post_save, post_delete], sender=GoalContribution)
+def contribution_changed(sender, instance, **kwargs):
+    goal = FinancialGoal.objects.filter(pk=instance.goal_id).values('user_id', 'family_id').first()
+    if goal:
+        _bump_owner_versions(goal['user_id'], goal['family_id'])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    if instance.is_system or not instance.owner_id:
+        bump_data_version(*GLOBAL)
+    else:
+        bump_data_version('user', instance.owner_id)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    fold_category_rollup(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Family)
+def family_changed(sender, instance, **kwargs):
+    _bump_owner_versions(instance.created_by_id, instance.pk)
+
+
+@receiver(pre_delete, sender=Family)
+def family_deleting(sender, instance, **kwargs):
+    fold_family_rollup(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=FamilyMember)
+def family_member_changed(sender, instance, **kwargs):
+    # Состав семьи влияет и на дашборд участника (семейные цели), и на страницу семьи
+    _bump_owner_versions(instance.user_id, instance.family_id)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Прагмы SQLite (WAL и т.п.) из settings.SQLITE_PRAGMAS для каждого нового соединения."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using='default', **kwargs):
+    """
+    После миграций проверяет поисковый индекс: SQLite пересоздаёт таблицу при изменении столбцов,
+    и триггеры FTS5 пропадают вместе со старой таблицей — тогда индекс строится заново.
+    """
+    if sender.name != 'finance':
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if 'finance_transaction' not in connection.introspection.table_names(cursor):
+            return
+    install_search_index(connection)
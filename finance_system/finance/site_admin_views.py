@@ -176,3 +176,23 @@ def site_admin_user_unblock(request, pk):
         user.save()
         messages.success(request, f'Пользователь {user.username} разблокирован.')
     return redirect('admin_users')
+
+
+@login_required
+@staff_required
+def site_admin_profiles(request):
+    """Сохранённые профили стека (collapsed stacks) по маршрутам."""
+    from .utils.stack_sampler import list_profiles
+    return render(request, 'finance/site_admin/profiles.html', {'profiles': list_profiles()})
+
+
+@login_required
+@staff_required
+def site_admin_profile_download(request, route, name):
+    """Скачивание файла профиля стека."""
+    from django.http import FileResponse, Http404
+    from .utils.stack_sampler import profile_path
+    path = profile_path(route, name)
+    if path is None:
+        raise Http404('Профиль не найден')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{route}-{name}', content_type='text/plain; charset=utf-8')
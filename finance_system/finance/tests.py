@@ -1,3 +1,1229 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+import json
+import tempfile
+from collections import Counter
+from contextlib import aclosing, contextmanager
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .checks import shared_cache_check
+from .models import (
+    Account, Budget, BudgetPeriodSpend, Category, CustomUser, Family, FamilyMember, FinancialGoal, GoalContribution,
+    MonthlyCategorySpend, Notification, NotificationArchive, NotificationDelivery, ReportJob, Transaction,
+)
+from .utils.balances import find_balance_drift
+from .utils.cache import cached_widget, data_version
+from .utils.periods import date_range_bounds, month_range_bounds, parse_month, period_q
+from .utils.recurring import advance, process_due, schedule_new_templates
+from .utils.report_jobs import cached_report_path, report_data_version, request_report, run_report_job
+from .utils.notification_stream import InProcessBroker, event_position
+from .utils.metrics import Counter as MetricCounter, Histogram, Registry
+from .utils.notification_delivery import RateLimiter, deliver_pending
+from .utils.notifications import inbox_page, notify, resolve_recipients
+from .utils.search import search_transactions
+from .utils.stack_sampler import list_profiles, save_profile
+from .utils.transaction_feed import parse_feed_filters, transactions_page
+
+
+def explain(queryset):
+    """План запроса; в PostgreSQL последовательное сканирование отключается, чтобы маленькая тестовая таблица не мешала выбору индекса."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            return queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+    return queryset.explain()
+
+
+class PeriodBoundsTests(SimpleTestCase):
+    def test_month_bounds_are_half_open_and_aware(self):
+        start, end = month_range_bounds('2025-12', '2025-12')
+        self.assertTrue(timezone.is_aware(start) and timezone.is_aware(end))
+        self.assertEqual(timezone.localtime(start).replace(tzinfo=None).isoformat(), '2025-12-01T00:00:00')
+        self.assertEqual(timezone.localtime(end).replace(tzinfo=None).isoformat(), '2026-01-01T00:00:00')
+
+    def test_date_range_bounds_include_last_day(self):
+        start, end = date_range_bounds(date(2025, 3, 1), date(2025, 3, 31))
+        self.assertEqual(timezone.localdate(start), date(2025, 3, 1))
+        self.assertEqual(timezone.localdate(end), date(2025, 4, 1))
+        self.assertEqual(end - start, timedelta(days=31))
+
+    def test_open_and_invalid_bounds(self):
+        self.assertIsNone(parse_month('2025-13'))
+        self.assertIsNone(parse_month(''))
+        self.assertEqual(month_range_bounds(None, None), (None, None))
+        self.assertEqual(str(period_q('date')), str(period_q('date', None, None)))
+
+
+class PeriodFilterIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('period_user')
+        account = Account.objects.create(owner=cls.user, name='Основной')
+        now = timezone.now()
+        for i in range(40):
+            Transaction.objects.create(
+                user=cls.user, account=account, amount=100 + i, type='expense', date=now - timedelta(days=i * 5),
+            )
+
+    def test_month_filter_matches_date_cast_filter(self):
+        start, end = month_range_bounds(timezone.localdate().replace(day=1), timezone.localdate())
+        by_bounds = set(Transaction.objects.filter(period_q('date', start, end), user=self.user).values_list('id', flat=True))
+        first = timezone.localdate().replace(day=1)
+        by_cast = set(Transaction.objects.filter(
+            user=self.user, date__date__gte=first, date__date__lt=timezone.localtime(end).date(),
+        ).values_list('id', flat=True))
+        self.assertEqual(by_bounds, by_cast)
+
+    def test_bounds_use_user_date_index(self):
+        start, end = month_range_bounds('2025-01', '2025-06')
+        plan = explain(Transaction.objects.filter(period_q('date', start, end), user=self.user))
+        if connection.vendor == 'sqlite':
+            self.assertRegex(plan, r'USING (COVERING )?INDEX \S+ \(user_id=\? AND date>\? AND date<\?\)')
+        elif connection.vendor == 'postgresql':
+            self.assertIn('Index Cond', plan)
+            self.assertRegex(plan, r'Index Cond: .*date >=')
+
+    def test_date_cast_filter_cannot_use_date_in_index(self):
+        # Для сравнения: приведение столбца к дате оставляет в индексе только user_id
+        plan = explain(Transaction.objects.filter(
+            user=self.user, date__date__gte=date(2025, 1, 1), date__date__lte=date(2025, 6, 30),
+        ))
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('date>', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertNotRegex(plan, r'Index Cond: .*date >=')
+
+    def test_family_contributions_use_goal_date_index(self):
+        family = Family.objects.create(name='Семья', created_by=self.user)
+        goal = FinancialGoal.objects.create(name='Цель', family=family, target_amount=1000, deadline=timezone.localdate())
+        GoalContribution.objects.create(goal=goal, amount=10, user=self.user)
+        start, end = month_range_bounds('2025-01', '2025-03')
+        plan = explain(GoalContribution.objects.filter(period_q('contributed_at', start, end), goal__family=family))
+        if connection.vendor == 'sqlite':
+            self.assertRegex(plan, r'USING (COVERING )?INDEX \S+ \(goal_id=\? AND contributed_at>\? AND contributed_at<\?\)')
+        elif connection.vendor == 'postgresql':
+            self.assertRegex(plan, r'Index Cond: .*contributed_at >=')
+
+
+class TransactionFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('feed_user')
+        cls.account = Account.objects.create(owner=cls.user, name='Карта')
+        cls.other = Account.objects.create(owner=cls.user, name='Наличные')
+        same_day = timezone.now().replace(microsecond=0)
+        for i in range(25):
+            # Часть транзакций с одинаковой датой — порядок внутри неё решают created_at и id
+            Transaction.objects.create(
+                user=cls.user, account=cls.account if i % 2 else cls.other, amount=10 + i, type='expense',
+                date=same_day if i < 8 else same_day - timedelta(days=i), merchant='Пятёрочка' if i % 3 else 'Лента',
+            )
+
+    def _walk(self, filters=None, limit=7):
+        seen, cursor = [], None
+        while True:
+            items, cursor = transactions_page(self.user, filters, cursor, limit)
+            seen += [tx.id for tx in items]
+            if not cursor:
+                return seen
+
+    def test_pages_cover_feed_without_gaps_or_duplicates(self):
+        expected = list(Transaction.objects.filter(user=self.user).order_by('-date', '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self._walk(), expected)
+
+    def test_filters_apply_to_every_page(self):
+        filters = parse_feed_filters({'account': str(self.account.id), 'merchant': 'пят', 'amount_min': '15', 'amount_max': 'x'})
+        self.assertNotIn('amount_max', filters)
+        expected = set(Transaction.objects.filter(
+            user=self.user, account=self.account, merchant__icontains='пят', amount__gte=15,
+        ).values_list('id', flat=True))
+        walked = self._walk(filters, limit=3)
+        self.assertEqual(len(walked), len(expected))
+        self.assertEqual(set(walked), expected)
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        first, _ = transactions_page(self.user, cursor='garbage', limit=5)
+        self.assertEqual([tx.id for tx in first], self._walk(limit=5)[:5])
+
+    def test_deep_page_reads_feed_index_without_sort(self):
+        items, cursor = transactions_page(self.user, limit=20)
+        tx = items[-1]
+        start = Transaction.objects.filter(user=self.user, date__lte=tx.date).order_by('-date', '-created_at', '-id')
+        plan = explain(start)
+        if connection.vendor == 'sqlite':
+            self.assertIn('tx_user_feed_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertIn('tx_user_feed_idx', plan)
+            self.assertNotRegex(plan, r'(?m)^\s*Sort')
+
+
+class TransactionSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('search_user')
+        other = CustomUser.objects.create_user('search_other')
+        account = Account.objects.create(owner=cls.user, name='Карта')
+        other_account = Account.objects.create(owner=other, name='Карта')
+        cls.shop = Transaction.objects.create(
+            user=cls.user, account=account, amount=500, type='expense', merchant='Пятёрочка',
+            description='продукты на неделю', tags=['еда', 'дом'],
+        )
+        cls.cafe = Transaction.objects.create(
+            user=cls.user, account=account, amount=300, type='expense', merchant='Кофейня',
+            description='кофе после пятёрочки', tags=['кафе и рестораны'],
+        )
+        cls.taxi = Transaction.objects.create(
+            user=cls.user, account=account, amount=200, type='expense', merchant='Такси', tags=['едаа'],
+        )
+        Transaction.objects.create(user=other, account=other_account, amount=1, type='expense', merchant='Пятёрочка')
+
+    def ids(self, text, tags=()):
+        return [tx.id for tx in search_transactions(self.user, text, tags)]
+
+    def test_prefix_search_ignores_case_and_yo(self):
+        self.assertEqual(self.ids('ПЯТЕР'), [self.shop.id, self.cafe.id])
+        self.assertEqual(self.ids('пятёр кофе'), [self.cafe.id])
+
+    def test_merchant_match_ranks_above_description(self):
+        found = search_transactions(self.user, 'пятер')
+        self.assertEqual(found[0].id, self.shop.id)
+        self.assertGreater(found[0].search_rank, found[1].search_rank)
+
+    def test_tag_filter_is_exact(self):
+        self.assertEqual(self.ids('#еда'), [self.shop.id])
+        self.assertEqual(self.ids('', ['кафе и рестораны']), [self.cafe.id])
+        self.assertEqual(self.ids('кофе', ['дом']), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.taxi.merchant = 'Яндекс Go'
+        self.taxi.save()
+        self.assertEqual(self.ids('такси'), [])
+        self.assertEqual(self.ids('яндекс'), [self.taxi.id])
+        self.taxi.delete()
+        self.assertEqual(self.ids('яндекс'), [])
+
+    def test_feed_search_filter_keeps_date_order(self):
+        items, _ = transactions_page(self.user, parse_feed_filters({'q': 'пятер'}))
+        expected = sorted([self.shop, self.cafe], key=lambda tx: (tx.date, tx.created_at), reverse=True)
+        self.assertEqual([tx.id for tx in items], [tx.id for tx in expected])
+
+
+class RecurringSchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('recurring_user')
+        cls.account = Account.objects.create(owner=cls.user, name='Карта', initial_balance=10000)
+
+    def test_month_end_anchor_is_kept(self):
+        start = timezone.make_aware(datetime(2025, 1, 31, 12, 0))
+        second = advance(start, 'monthly', 31)
+        self.assertEqual(timezone.localtime(second).date(), date(2025, 2, 28))
+        self.assertEqual(timezone.localtime(advance(second, 'monthly', 31)).date(), date(2025, 3, 31))
+
+    def test_due_occurrences_created_once_with_side_effects(self):
+        now = timezone.now()
+        template = Transaction.objects.create(
+            user=self.user, account=self.account, amount=100, type='expense', date=now - timedelta(days=21),
+            is_recurring=True, recurring_rule='weekly', merchant='Подписка',
+        )
+        Transaction.objects.create(
+            user=self.user, account=self.account, amount=5, type='expense', date=now - timedelta(days=1),
+            is_recurring=True, recurring_rule='fortnightly',
+        )
+        self.assertEqual(process_due(now), (1, 3))
+        self.assertEqual(process_due(now), (0, 0))
+        occurrences = template.occurrences.order_by('date')
+        self.assertEqual(occurrences.count(), 3)
+        self.assertTrue(all(tx.merchant == 'Подписка' and tx.created_via == 'recurring' for tx in occurrences))
+        template.refresh_from_db()
+        self.assertGreater(template.next_occurrence, now)
+        self.assertFalse(Transaction.objects.filter(recurring_rule='fortnightly', is_recurring=True).exists())
+        self.assertEqual(find_balance_drift(), [])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 10000 - 4 * 100 - 5)
+
+    def test_occurrence_created_by_parallel_run_is_skipped(self):
+        now = timezone.now()
+        template = Transaction.objects.create(
+            user=self.user, account=self.account, amount=50, type='expense', date=now - timedelta(days=2),
+            is_recurring=True, recurring_rule='daily',
+        )
+        schedule_new_templates()
+        template.refresh_from_db()
+        # Параллельный запуск уже создал первое вхождение, но ещё не сдвинул next_occurrence
+        Transaction.objects.create(
+            user=self.user, account=self.account, amount=50, type='expense', date=template.next_occurrence,
+            recurring_source=template,
+        )
+        self.assertEqual(process_due(now), (1, 1))
+        self.assertEqual(template.occurrences.count(), 2)
+        self.assertEqual(find_balance_drift(), [])
+
+    def test_side_effects_batched_regardless_of_account_count(self):
+        # Середина текущего месяца: все вхождения попадают в текущий период бюджета
+        now = timezone.localtime().replace(day=15, hour=12)
+
+        def run(n_accounts):
+            user = CustomUser.objects.create_user(f'recurring_bulk_{n_accounts}')
+            food = Category.objects.create(name='Еда', type='expense', owner=user)
+            budget = Budget.objects.create(name='Еда', user=user, amount=100, period='monthly', category=food,
+                                           start_date=timezone.localdate() - timedelta(days=60))
+            for i in range(n_accounts):
+                account = Account.objects.create(owner=user, name=f'Счёт {i}', initial_balance=1000)
+                Transaction.objects.create(
+                    user=user, account=account, category=food, amount=10 + i, type='expense',
+                    date=now - timedelta(days=3), is_recurring=True, recurring_rule='daily',
+                )
+            version = data_version('user', user.pk)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(process_due(now)[0], n_accounts)
+            self.assertNotEqual(data_version('user', user.pk), version)
+            spent = Transaction.objects.filter(user=user, type='expense').aggregate(total=Sum('amount'))['total']
+            self.assertEqual(MonthlyCategorySpend.objects.filter(user=user).aggregate(total=Sum('amount'))['total'], spent)
+            self.assertEqual(budget.period_spends.aggregate(total=Sum('spent'))['total'], spent)
+            self.assertEqual(Notification.objects.filter(user=user, notification_type='budget_warning').count(), 1)
+            return len(queries)
+
+        self.assertEqual(run(2), run(6))
+        self.assertEqual(find_balance_drift(), [])
+
+
+class SeedScaleTests(TestCase):
+    def test_seed_is_reproducible_and_derived_data_consistent(self):
+        out = StringIO()
+        call_command('seed_scale', users=4, transactions=120, months=3, seed=7, stdout=out)
+        first = sorted(Transaction.objects.filter(type='expense').values_list('amount', 'merchant'))
+        self.assertEqual(len(first), 120)
+        self.assertEqual(find_balance_drift(), [])
+        self.assertEqual(
+            MonthlyCategorySpend.objects.aggregate(total=Sum('amount'))['total'],
+            Transaction.objects.filter(type='expense').aggregate(total=Sum('amount'))['total'],
+        )
+        call_command('seed_scale', users=4, transactions=120, months=3, seed=7, flush=True, stdout=out)
+        self.assertEqual(sorted(Transaction.objects.filter(type='expense').values_list('amount', 'merchant')), first)
+
+    def test_flush_keeps_other_users_data_consistent(self):
+        call_command('seed_scale', users=4, transactions=60, months=2, seed=3, family_share=1.0, stdout=StringIO())
+        family = Family.objects.filter(created_by__username__startswith='load_').first()
+        seeded_account = Account.objects.filter(owner=family.created_by, family__isnull=True).first()
+        outsider = CustomUser.objects.create_user('seed_outsider')
+        FamilyMember.objects.create(family=family, user=outsider, role='member')
+        own = Account.objects.create(owner=outsider, name='Карта', initial_balance=1000)
+        kept = Transaction.objects.create(user=outsider, account=own, family=family, amount=70, type='expense',
+                                          date=timezone.now())
+        Transaction.objects.create(user=family.created_by, account=seeded_account, transfer_to_account=own,
+                                   amount=300, type='transfer', date=timezone.now())
+
+        call_command('seed_scale', users=0, transactions=0, flush=True, stdout=StringIO())
+        self.assertFalse(CustomUser.objects.filter(username__startswith='load_').exists())
+        kept.refresh_from_db()
+        self.assertIsNone(kept.family_id)
+        own.refresh_from_db()
+        self.assertEqual(own.balance, 1000 - 70)
+        self.assertEqual(find_balance_drift(), [])
+        self.assertEqual(list(MonthlyCategorySpend.objects.values_list('user_id', 'family_id', 'amount')),
+                         [(outsider.pk, None, Decimal('70.00'))])
+
+
+class StatementTimeoutTests(SimpleTestCase):
+    class FakeConnection:
+        def __init__(self, vendor):
+            self.vendor = vendor
+            self.executed = []
+
+        @contextmanager
+        def cursor(self):
+            yield SimpleNamespace(execute=self.executed.append)
+
+    @override_settings(DB_STATEMENT_TIMEOUT_MS=30000)
+    def test_timeout_only_for_postgresql_and_installed_by_middleware(self):
+        from finance_system.middleware import StatementTimeoutMiddleware, _set_statement_timeout
+        postgresql, sqlite = self.FakeConnection('postgresql'), self.FakeConnection('sqlite')
+        for conn in (postgresql, sqlite):
+            _set_statement_timeout(conn)
+        self.assertEqual(postgresql.executed, ['SET statement_timeout = 30000'])
+        self.assertEqual(sqlite.executed, [])
+        # Обработчик connection_created подключается при загрузке middleware (в management-командах его нет)
+        connection_created.disconnect(dispatch_uid='finance_statement_timeout')
+        StatementTimeoutMiddleware(lambda request: None)
+        self.assertTrue(connection_created.disconnect(dispatch_uid='finance_statement_timeout'))
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user('profiling_staff', is_staff=True)
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.staff)
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0, REQUEST_PROFILING_BUDGETS_MS={'notifications_list': 0})
+    def test_sampled_request_reports_server_timing_and_logs_over_budget(self):
+        with self.assertLogs('finance.profiling', 'WARNING') as logs:
+            response = self.client.get(reverse('notifications_list'))
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'tpl;dur=', 'app;dur='):
+            self.assertIn(metric, timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['event'], record['route'], record['budget_ms']), ('slow_request', 'notifications_list', 0))
+        self.assertTrue(record['sampled'])
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_has_no_breakdown(self):
+        response = self.client.get(reverse('notifications_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class StackSamplingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(STACK_PROFILES_DIR=tmp.name, STACK_PROFILING_INTERVAL_MS=0.5, STACK_PROFILES_KEEP=2)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = CustomUser.objects.create_user('sampler_staff', is_staff=True)
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.staff)
+
+    def test_header_profiles_request_and_staff_downloads_file(self):
+        self.assertEqual(self.client.get(reverse('dashboard'), HTTP_X_STACK_PROFILE='1').status_code, 200)
+        profiles = list_profiles()
+        self.assertEqual([p['route'] for p in profiles], ['dashboard'])
+        response = self.client.get(reverse('admin_profile_download', args=[profiles[0]['route'], profiles[0]['name']]))
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('finance.views:dashboard', body)
+        self.assertGreater(int(body.splitlines()[0].rsplit(' ', 1)[1]), 0)
+        self.assertContains(self.client.get(reverse('admin_profiles')), profiles[0]['name'])
+        self.assertEqual(self.client.get(reverse('admin_profile_download', args=['dashboard', 'x.collapsed'])).status_code, 404)
+
+    def test_header_ignored_for_regular_user_and_old_files_rotated(self):
+        user = CustomUser.objects.create_user('sampler_user')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        client.get(reverse('dashboard'), HTTP_X_STACK_PROFILE='1')
+        self.assertEqual(list_profiles(), [])
+        self.assertEqual(client.get(reverse('admin_profiles')).status_code, 302)
+        for i in range(3):
+            save_profile('dashboard', Counter({'a;b': i + 1}), 10)
+        self.assertEqual(len(list_profiles()), 2)
+
+
+class MetricsTests(TestCase):
+    def test_snapshots_of_processes_are_summed(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        workers = [Registry(), Registry()]
+        with override_settings(METRICS_MULTIPROC_DIR=tmp.name):
+            for i, registry in enumerate(workers):
+                rows = MetricCounter('rows_total', 'Строки.', labels=('result',), registry=registry)
+                latency = Histogram('latency_seconds', 'Задержка.', buckets=(0.1, 1), registry=registry)
+                rows.inc(2 + i, result='created')
+                latency.observe(0.05 + i / 2)
+                registry.flush()
+            text = workers[0].render()
+        self.assertIn('# TYPE rows_total counter', text)
+        self.assertIn('rows_total{result="created"} 5', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count 2', text)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_endpoint_restricted_to_allowed_addresses(self):
+        client = Client(HTTP_HOST='localhost')
+        self.assertContains(client.get(reverse('metrics')), '# TYPE finance_import_rows_total counter')
+        self.assertEqual(client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(client.get(reverse('metrics')).status_code, 403)
+            self.assertEqual(client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class AsyncReceiptViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('receipt_user', is_staff=True)
+        cls.cafe = Category.objects.create(name='Кафе и рестораны', type='expense', is_system=True)
+
+    async def test_analyze_runs_through_async_stack(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.post(reverse('analyze_receipt_api'), {'raw_text': 'Шоколадница, кофе латте 300', 'merchant': 'Шоколадница'})
+        payload = response.json()
+        self.assertEqual((payload['merchant'], payload['category_id']), ('Шоколадница', str(self.cafe.id)))
+        # Запросы к БД из sync_to_async учтены профилировщиком
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertEqual((await client.post(reverse('analyze_receipt_api'), {})).status_code, 400)
+
+    async def test_scan_validates_upload_and_returns_json(self):
+        from io import BytesIO
+        from PIL import Image
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        self.assertEqual((await client.post(reverse('scan_receipt_api'), {})).status_code, 400)
+        image = BytesIO()
+        Image.new('RGB', (40, 40), 'white').save(image, 'PNG')
+        upload = SimpleUploadedFile('receipt.png', image.getvalue(), content_type='image/png')
+        response = await client.post(reverse('scan_receipt_api'), {'receipt': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+
+
+class NotificationStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('stream_user')
+
+    async def test_broker_delivers_event_published_from_another_thread(self):
+        import asyncio
+        import threading
+        broker = InProcessBroker()
+        async with broker.subscribe(self.user.pk) as subscription:
+            threading.Thread(target=broker.publish, args=(self.user.pk, {'kind': 'unread'})).start()
+            self.assertEqual(await subscription.get(timeout=2), {'kind': 'unread'})
+        self.assertEqual(broker.subscribers, {})
+
+    @override_settings(NOTIFICATION_STREAM_POLL_SECONDS=0.05, NOTIFICATION_STREAM_MAX_SECONDS=1)
+    async def test_stream_resumes_from_last_event_id_and_picks_up_new_notifications(self):
+        def create(title):
+            return Notification.objects.acreate(user=self.user, notification_type='system', title=title, message='')
+        seen = await create('Прочитанное')
+        missed = await create('Пропущенное')
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(
+            reverse('notifications_stream'), headers={'Last-Event-ID': event_position(seen.created_at, seen.id)},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = []
+        async with aclosing(response.streaming_content) as stream:
+            async for chunk in stream:
+                chunks.append(chunk.decode())
+                if len(chunks) == 3:
+                    await create('Новое')
+                if 'Новое' in chunk.decode():
+                    break
+        body = ''.join(chunks)
+        self.assertNotIn('Прочитанное', body)
+        self.assertLess(body.index('Пропущенное'), body.index('Новое'))
+        self.assertIn(f'id: {event_position(missed.created_at, missed.id)}', body)
+        self.assertIn(f'id: {event_position(missed.created_at, missed.id)}\nevent: unread\ndata: {{"count": 2}}', body)
+
+    def test_wsgi_returns_current_state_and_reconnect_delay(self):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(self.user)
+        body = b''.join(client.get(reverse('notifications_stream')).streaming_content).decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn('event: unread\ndata: {"count": 0}', body)
+        # Переподключение с id события unread досылает уведомления, созданные после ответа
+        last_event_id = body.split('id: ', 1)[1].split('\n', 1)[0]
+        Notification.objects.create(user=self.user, notification_type='system', title='После ответа', message='')
+        body = b''.join(client.get(reverse('notifications_stream'), headers={'Last-Event-ID': last_event_id})
+                        .streaming_content).decode()
+        self.assertIn('После ответа', body)
+
+
+class NotificationFanoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('fanout_owner', email='owner@example.com', telegram_id='100')
+        cls.member = CustomUser.objects.create_user('fanout_member', email='member@example.com')
+        cls.family = Family.objects.create(name='Семья', created_by=cls.owner)
+        FamilyMember.objects.create(family=cls.family, user=cls.owner, role='creator')
+        FamilyMember.objects.create(family=cls.family, user=cls.member)
+
+    def test_recipients_resolved_in_one_query_without_duplicates(self):
+        with self.assertNumQueries(1):
+            recipients = resolve_recipients(user_ids=[self.owner.pk], family_ids=[self.family.pk])
+        self.assertEqual(sorted(r['id'] for r in recipients), sorted([self.owner.pk, self.member.pk]))
+
+    @override_settings(TELEGRAM_BOT_TOKEN='token')
+    def test_fanout_bumps_unread_queues_deliveries_and_skips_repeats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = notify('budget_warning', 'Бюджет', 'Превышен', family_ids=[self.family.pk],
+                             dedup_key='budget:1')
+        self.assertEqual(len(created), 2)
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.unread_notifications_count, 1)
+        self.assertEqual(
+            sorted(NotificationDelivery.objects.values_list('channel', 'address')),
+            [('email', 'member@example.com'), ('email', 'owner@example.com'), ('telegram', '100')],
+        )
+
+        self.assertEqual(notify('budget_warning', 'Бюджет', 'Превышен', family_ids=[self.family.pk], dedup_key='budget:1'), [])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.unread_notifications_count, 1)
+
+    @override_settings(TELEGRAM_BOT_TOKEN='')
+    def test_unconfigured_channel_is_not_queued(self):
+        notify('budget_warning', 'Бюджет', 'Превышен', user_ids=[self.owner.pk])
+        self.assertEqual(list(NotificationDelivery.objects.values_list('channel', 'address')),
+                         [('email', 'owner@example.com')])
+
+    def test_cron_and_dashboard_reminders_share_dedup_key(self):
+        from .utils.goal_reminders import create_replenishment_reminders
+        FinancialGoal.objects.create(
+            family=self.family, user=self.owner, name='Отпуск', target_amount=1000, current_amount=0,
+            start_date=date.today() - timedelta(days=3), deadline=date.today() + timedelta(days=90),
+            replenishment_frequency='daily',
+        )
+        create_replenishment_reminders()
+        call_command('goal_replenishment_reminders', stdout=StringIO())
+        self.assertEqual(Notification.objects.filter(notification_type='goal_replenishment_reminder').count(), 2)
+        # Повторная загрузка дашборда только читает: цели и ключи уже отправленных напоминаний
+        with self.assertNumQueries(2):
+            create_replenishment_reminders()
+
+    def test_rejoining_family_notifies_creator_again(self):
+        from urllib.parse import quote
+        from django.core.signing import Signer
+
+        guest = CustomUser.objects.create_user('fanout_guest')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(guest)
+        url = reverse('family_accept_invite', kwargs={'token': quote(Signer().sign(str(self.family.pk)), safe='')})
+        joined = Notification.objects.filter(user=self.owner, notification_type='member_joined')
+        client.get(url)
+        self.assertEqual(joined.count(), 1)
+        FamilyMember.objects.filter(family=self.family, user=guest).delete()
+        client.get(url)
+        self.assertEqual(joined.count(), 2)
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """locmem-бэкенд, который считает открытия соединения и не принимает письма на адреса из rejected."""
+    opened = 0
+    rejected = set()
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any(set(message.to) & self.rejected for message in messages):
+            raise ConnectionError('550 mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    NOTIFICATION_DELIVERY_RATE={}, NOTIFICATION_DELIVERY_RETRY_SECONDS=60, NOTIFICATION_DELIVERY_MAX_ATTEMPTS=2,
+    NOTIFICATION_DELIVERY_CHANNELS={'system': ('email', 'telegram')}, TELEGRAM_BOT_TOKEN='',
+)
+class NotificationDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [CustomUser.objects.create_user(f'deliver_{i}', email=f'user{i}@example.com') for i in range(3)]
+
+    def setUp(self):
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.rejected = set()
+        notify('system', 'Тема', 'Текст', user_ids=[u.pk for u in self.users])
+
+    @override_settings(EMAIL_BACKEND='finance.tests.FlakyEmailBackend')
+    def test_batch_shares_one_connection_and_marks_notifications_sent(self):
+        self.assertEqual(deliver_pending(batch_size=10), {'email': (3, 0)})
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [u.email for u in self.users])
+        self.assertEqual(set(Notification.objects.values_list('is_sent', 'sent_via')), {(True, 'email')})
+        self.assertEqual(deliver_pending(), {'email': (0, 0)})
+
+    @override_settings(EMAIL_BACKEND='finance.tests.FlakyEmailBackend')
+    def test_failed_sends_retry_with_backoff_then_give_up(self):
+        FlakyEmailBackend.rejected = {'user0@example.com'}
+        with self.assertLogs('finance.utils.notification_delivery', 'WARNING'):
+            self.assertEqual(deliver_pending(batch_size=2), {'email': (2, 1)})
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+        delivery = NotificationDelivery.objects.get(address='user0@example.com')
+        self.assertEqual((delivery.status, delivery.attempts), ('pending', 1))
+        self.assertIn('550', delivery.last_error)
+        self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertFalse(delivery.notification.is_sent)
+
+        NotificationDelivery.objects.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs('finance.utils.notification_delivery', 'WARNING'):
+            self.assertEqual(deliver_pending(), {'email': (0, 1)})
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('failed', 2))
+
+    def test_telegram_batch_reuses_keep_alive_connection(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        requests = []
+
+        class BotApi(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                requests.append((self.client_address, self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+                body = b'{"ok": true}'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), BotApi)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        NotificationDelivery.objects.filter(channel='email').update(channel='telegram', address='42')
+        with self.settings(TELEGRAM_BOT_TOKEN='token', TELEGRAM_API_URL=f'http://127.0.0.1:{server.server_port}'):
+            self.assertEqual(deliver_pending(['telegram']), {'telegram': (3, 0)})
+        self.assertEqual(len({address for address, _, _ in requests}), 1)
+        self.assertEqual(requests[0][1], '/bottoken/sendMessage')
+        self.assertEqual(requests[0][2], {'chat_id': '42', 'text': 'Тема\n\nТекст'})
+        self.assertEqual(set(Notification.objects.values_list('sent_via', flat=True)), {'telegram'})
+
+    def test_rate_limiter_spaces_sends(self):
+        clock = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(round(seconds, 3))
+            clock[0] += seconds
+
+        limiter = RateLimiter(4, clock=lambda: clock[0], sleep=sleep)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(sleeps, [0.25, 0.25])
+
+
+class NotificationInboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('inbox_user')
+
+    def create(self, title, is_read=False, created_at=None):
+        notification = Notification.objects.create(user=self.user, notification_type='system', title=title,
+                                                   message='', is_read=is_read)
+        if created_at is not None:
+            Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification
+
+    def test_unread_counter_follows_creation_and_mark_all_read(self):
+        for i in range(3):
+            self.create(f'Новое {i}')
+        self.create('Прочитанное', is_read=True)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications_count, 3)
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(self.user)
+        client.post(reverse('notifications_mark_all_read'))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications_count, 0)
+
+    def test_keyset_pages_put_unread_first_and_cover_ties_without_overlap(self):
+        moment = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            self.create(f'Прочитанное {i}', is_read=True, created_at=moment)
+        for i in range(4):
+            self.create(f'Новое {i}', created_at=moment - timedelta(minutes=i))
+        seen, cursor = [], None
+        while True:
+            page, cursor = inbox_page(self.user, cursor, limit=2)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(len({n.pk for n in seen}), 9)
+        self.assertEqual([n.is_read for n in seen], [False] * 4 + [True] * 5)
+        self.assertEqual([n.title for n in seen[:4]], [f'Новое {i}' for i in range(4)])
+        self.assertEqual(inbox_page(self.user, 'мусор', limit=2)[0], seen[:2])
+
+    def test_archive_command_moves_old_read_notifications(self):
+        old = timezone.now() - timedelta(days=120)
+        archived = self.create('Старое прочитанное', is_read=True, created_at=old)
+        self.create('Старое непрочитанное', created_at=old)
+        self.create('Свежее прочитанное', is_read=True)
+        out = StringIO()
+        call_command('archive_notifications', '--days', '90', '--recount', stdout=out)
+        self.assertIn('Перенесено в архив: 1', out.getvalue())
+        self.assertEqual(list(NotificationArchive.objects.values_list('pk', flat=True)), [archived.pk])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications_count, 1)
+
+
+class SlidingSessionTests(TestCase):
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(CustomUser.objects.create_user('session_user'))
+        self.client.get(reverse('notifications_list'))
+        self.stale = timezone.now() + timedelta(days=1)
+        Session.objects.filter(pk=self.client.session.session_key).update(expire_date=self.stale)
+
+    def expire_date(self):
+        return Session.objects.get(pk=self.client.session.session_key).expire_date
+
+    def test_plain_page_views_do_not_rewrite_session(self):
+        self.client.get(reverse('notifications_list'))
+        self.assertEqual(self.expire_date(), self.stale)
+
+    @override_settings(SESSION_REFRESH_INTERVAL=0)
+    def test_session_expiry_extended_after_refresh_interval(self):
+        self.client.get(reverse('notifications_list'))
+        self.assertGreater(self.expire_date(), self.stale + timedelta(days=7))
+
+
+class WidgetCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('cache_user')
+        cls.account = Account.objects.create(owner=cls.user, name='Основной')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_widget_recomputed_only_after_owner_data_changes(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return Transaction.objects.filter(user=self.user).count()
+
+        scopes = [('user', self.user.pk)]
+        self.assertEqual(cached_widget('count', scopes, compute), 0)
+        self.assertEqual(cached_widget('count', scopes, compute), 0)
+        self.assertEqual(len(calls), 1)
+        Transaction.objects.create(user=self.user, account=self.account, amount=5, type='expense', date=timezone.now())
+        self.assertEqual(cached_widget('count', scopes, compute), 1)
+        self.assertEqual(len(calls), 2)
+        # Данные другого пользователя не сбрасывают кэш
+        other = CustomUser.objects.create_user('cache_other')
+        other_account = Account.objects.create(owner=other, name='Чужой')
+        Transaction.objects.create(user=other, account=other_account, amount=5, type='expense', date=timezone.now())
+        cached_widget('count', scopes, compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_anonymous_page_served_from_cache_with_validators(self):
+        client = Client(HTTP_HOST='localhost')
+        first = client.get(reverse('features'))
+        second = client.get(reverse('features'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(client.get(reverse('features'), headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+    def test_locmem_cache_warns_outside_debug(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual([w.id for w in shared_cache_check(None)], ['finance.W001'])
+        with self.settings(DEBUG=True, CACHES=locmem):
+            self.assertEqual(shared_cache_check(None), [])
+
+
+class ConditionalJsonTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('etag_user')
+        cls.account = Account.objects.create(owner=cls.user, name='Основной')
+
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+
+    def test_etag_revalidation_and_change_after_write(self):
+        url = reverse('dashboard_chart_data')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        not_modified = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(not_modified.content, b'')
+
+        category = Category.objects.create(name='Еда', type='expense', owner=self.user)
+        Transaction.objects.create(user=self.user, account=self.account, category=category, amount=10, type='expense',
+                                   date=timezone.now())
+        changed = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.json()['total'], 10)
+
+    def test_chart_pages_load_data_from_json_endpoints(self):
+        family = Family.objects.create(name='Семья', created_by=self.user)
+        FamilyMember.objects.create(family=family, user=self.user, role='creator')
+        pages = [
+            ('family_detail', reverse('family_chart_data', args=[family.id]) + '?month_from='),
+            ('family_admin_chart', reverse('family_chart_data', args=[family.id]) + '?kind=admin'),
+        ]
+        for name, data_url in pages:
+            body = self.client.get(reverse(name, args=[family.id])).content.decode()
+            self.assertIn(f'data-url="{data_url}', body)
+            self.assertNotIn('chart_datasets', body)
+            response = self.client.get(reverse('family_chart_data', args=[family.id]), {'kind': 'admin'})
+            self.assertEqual(response.json()['labels'], [])
+
+
+class ExcelReportTests(TestCase):
+    def test_report_rows_and_pivot_streamed_from_temp_file(self):
+        import openpyxl
+        from .reports import generate_excel_report
+
+        user = CustomUser.objects.create_user('excel_user')
+        account = Account.objects.create(owner=user, name='Основной')
+        food = Category.objects.create(name='Еда', type='expense', owner=user)
+        today = timezone.localdate()
+        for amount, tx_type, category in ((100, 'expense', food), (50, 'expense', food), (1000, 'income', None)):
+            Transaction.objects.create(user=user, account=account, category=category, amount=amount, type=tx_type,
+                                       date=timezone.now(), description=f'Операция {amount}')
+        Transaction.objects.create(user=user, account=account, amount=7, type='expense',
+                                   date=timezone.now() - timedelta(days=60))
+
+        response = generate_excel_report(user, today, today)
+        self.assertTrue(response.streaming)
+        wb = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(wb['Транзакции'].values)
+        self.assertEqual(rows[0], ('Дата', 'Тип', 'Категория', 'Сумма', 'Описание'))
+        self.assertEqual(sorted(row[3] for row in rows[1:]), [50, 100, 1000])
+        header, *pivot_rows = wb['Сводка'].values
+        self.assertEqual(header, ('Категория', 'Доход', 'Расход'))
+        self.assertEqual({row[0]: row[1:] for row in pivot_rows}, {'-': (1000, 0), 'Еда': (0, 150)})
+
+
+    def test_report_dates_are_inclusive(self):
+        from .reports import _report_transactions
+
+        user = CustomUser.objects.create_user('excel_period_user')
+        account = Account.objects.create(owner=user, name='Основной')
+        last_day = date(2025, 3, 31)
+        for moment in (datetime(2025, 3, 1), datetime(2025, 3, 31, 23, 30), datetime(2025, 4, 1)):
+            Transaction.objects.create(user=user, account=account, amount=1, type='expense',
+                                       date=timezone.make_aware(moment))
+        self.assertEqual(_report_transactions(user, date(2025, 3, 1), last_day).count(), 2)
+        self.assertEqual(_report_transactions(user, last_day, last_day).count(), 1)
+
+
+class PdfReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('pdf_user')
+        account = Account.objects.create(owner=cls.user, name='Основной')
+        now = timezone.now()
+        Transaction.objects.bulk_create([
+            Transaction(user=cls.user, account=account, amount=i + 1, type='expense', date=now - timedelta(minutes=i))
+            for i in range(200)
+        ])
+
+    def page_count(self):
+        from .reports import write_pdf_report
+        out = BytesIO()
+        write_pdf_report(out, self.user, timezone.localdate() - timedelta(days=1), timezone.localdate())
+        return out.getvalue().count(b'/Type /Page\n')
+
+    @override_settings(REPORT_PDF_MAX_ROWS=0)
+    def test_rows_split_into_fixed_pages(self):
+        self.assertEqual(self.page_count(), 5)
+
+    @override_settings(REPORT_PDF_MAX_ROWS=60)
+    def test_rows_capped_by_setting(self):
+        self.assertEqual(self.page_count(), 2)
+
+
+class ReportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('report_user')
+        account = Account.objects.create(owner=cls.user, name='Основной')
+        Transaction.objects.create(user=cls.user, account=account, amount=10, type='expense', date=timezone.now())
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        overrides = self.settings(REPORTS_CACHE_DIR=cache_dir.name, REPORT_JOBS_INLINE_WORKER=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.today = timezone.localdate()
+
+    def request(self):
+        return request_report(self.user, 'xlsx', self.today, self.today)
+
+    def test_job_claimed_by_one_worker_and_cached_file_reused(self):
+        job = self.request()
+        self.assertEqual(job.status, 'pending')
+        self.assertTrue(run_report_job(job.pk))
+        self.assertFalse(run_report_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertIsNotNone(job.started_at)
+        self.assertIsNotNone(cached_report_path(job))
+
+        again = self.request()
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    def test_data_version_changes_when_account_renamed(self):
+        before = report_data_version(self.user, self.today, self.today)
+        account = Account.objects.get(owner=self.user)
+        account.name = 'Зарплатная карта'
+        account.save()
+        self.assertNotEqual(report_data_version(self.user, self.today, self.today), before)
+
+    @override_settings(REPORT_JOBS_HEARTBEAT_SECONDS=0)
+    def test_worker_renews_heartbeat_while_rendering(self):
+        job = self.request()
+        self.assertTrue(run_report_job(job.pk))
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+    def test_stale_running_job_is_failed_and_replaced(self):
+        job = self.request()
+        hour_ago = timezone.now() - timedelta(hours=1)
+        ReportJob.objects.filter(pk=job.pk).update(status='running', started_at=hour_ago, heartbeat_at=hour_ago)
+        # Долгий рендер с продлеваемым heartbeat и свежий running возвращаются как есть,
+        # зависший — отмечается failed, заказ создаёт новое задание
+        long_running = ReportJob.objects.create(user=self.user, format='xlsx', start_date=self.today,
+                                                end_date=self.today, status='running', started_at=hour_ago,
+                                                heartbeat_at=timezone.now(), cache_key='long')
+        fresh = ReportJob.objects.create(user=self.user, format='pdf', start_date=self.today, end_date=self.today,
+                                         status='running', started_at=timezone.now(), cache_key='fresh')
+        replacement = self.request()
+        self.assertNotEqual(replacement.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, 'running')
+        long_running.refresh_from_db()
+        self.assertEqual(long_running.status, 'running')
+
+        ReportJob.objects.filter(pk=replacement.pk).update(status='running', started_at=timezone.now() - timedelta(hours=1))
+        call_command('run_report_jobs', stdout=StringIO())
+        replacement.refresh_from_db()
+        self.assertEqual(replacement.status, 'failed')
+
+
+class AccountBalanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('balance_user')
+        cls.card = Account.objects.create(owner=cls.user, name='Карта', initial_balance=1000)
+        cls.cash = Account.objects.create(owner=cls.user, name='Наличные', initial_balance=200)
+        cls.savings = Account.objects.create(owner=cls.user, name='Вклад')
+
+    def assertBalances(self, card, cash, savings):
+        self.assertEqual(find_balance_drift(), [])
+        balances = dict(Account.objects.values_list('name', 'balance'))
+        self.assertEqual((balances['Карта'], balances['Наличные'], balances['Вклад']),
+                         (Decimal(card), Decimal(cash), Decimal(savings)))
+
+    def create(self, **fields):
+        return Transaction.objects.create(user=self.user, date=timezone.now(), **fields)
+
+    def test_saving_stale_account_keeps_balance(self):
+        stale = Account.objects.get(pk=self.card.pk)
+        self.create(account=self.card, amount=300, type='income')
+        stale.bank_name = 'Т-Банк'
+        stale.save()
+        self.assertBalances(1300, 200, 0)
+        self.assertEqual(Account.objects.get(pk=self.card.pk).bank_name, 'Т-Банк')
+
+    def test_create_edit_and_delete_keep_balances_in_sync(self):
+        salary = self.create(account=self.card, amount=500, type='income')
+        coffee = self.create(account=self.card, amount='150.50', type='expense')
+        self.assertBalances('1349.50', 200, 0)
+
+        coffee.amount = 50
+        coffee.save()
+        self.assertBalances('1450.00', 200, 0)
+        coffee.account = self.cash
+        coffee.save()
+        self.assertBalances(1500, 150, 0)
+        salary.type = 'expense'
+        salary.save()
+        self.assertBalances(500, 150, 0)
+
+        coffee.delete()
+        salary.delete()
+        self.assertBalances(1000, 200, 0)
+
+    def test_transfer_edits_move_both_sides(self):
+        transfer = self.create(account=self.card, transfer_to_account=self.savings, amount=300, type='transfer')
+        self.assertBalances(700, 200, 300)
+
+        transfer.transfer_to_account = self.cash
+        transfer.amount = 100
+        transfer.save()
+        self.assertBalances(900, 300, 0)
+        transfer.account = self.savings
+        transfer.save()
+        self.assertBalances(1000, 300, -100)
+        transfer.type = 'income'
+        transfer.transfer_to_account = None
+        transfer.save()
+        self.assertBalances(1000, 200, 100)
+
+        transfer.delete()
+        self.assertBalances(1000, 200, 0)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        self.create(account=self.card, amount=250, type='expense')
+        Account.objects.filter(pk=self.card.pk).update(balance=1)
+        Account.objects.filter(pk=self.cash.pk).update(balance=999)
+
+        out = StringIO()
+        call_command('reconcile_balances', stdout=out)
+        self.assertIn('Расхождений: 2', out.getvalue())
+        self.assertEqual(Account.objects.get(pk=self.card.pk).balance, 1)
+
+        call_command('reconcile_balances', '--fix', stdout=out)
+        self.assertIn('Исправлено счетов: 2', out.getvalue())
+        self.assertBalances(750, 200, 0)
+
+
+class BudgetSpendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('budget_user')
+        cls.account = Account.objects.create(owner=cls.user, name='Карта')
+        cls.food = Category.objects.create(name='Еда', type='expense', owner=cls.user)
+        cls.taxi = Category.objects.create(name='Такси', type='expense', owner=cls.user)
+
+    def setUp(self):
+        self.budget = Budget.objects.create(
+            name='Еда', user=self.user, amount=1000, period='monthly', category=self.food,
+            start_date=timezone.localdate() - timedelta(days=400),
+        )
+        self.month = timezone.localdate().replace(day=1)
+
+    def spend(self, amount, category=None, date=None):
+        return Transaction.objects.create(user=self.user, account=self.account, category=category or self.food,
+                                          amount=amount, type='expense', date=date or timezone.now())
+
+    def buckets(self):
+        self.budget.refresh_from_db()
+        return dict(self.budget.period_spends.filter(spent__gt=0).values_list('period_start', 'spent'))
+
+    def test_buckets_follow_create_edit_and_delete(self):
+        tx = self.spend(100)
+        self.assertEqual(self.buckets(), {self.month: 100})
+        self.assertEqual((self.budget.spent_amount, self.budget.remaining_amount), (100, 900))
+
+        tx.amount = 300
+        tx.save()
+        self.assertEqual(self.buckets(), {self.month: 300})
+        tx.category = self.taxi
+        tx.save()
+        self.assertEqual(self.buckets(), {})
+        tx.category = self.food
+        tx.date = timezone.now() - timedelta(days=45)
+        tx.save()
+        previous = timezone.localdate(tx.date).replace(day=1)
+        self.assertEqual(self.buckets(), {previous: 300})
+        self.assertEqual(self.budget.spent_amount, 0)
+
+        tx.delete()
+        self.assertEqual(self.buckets(), {})
+        self.spend(50)
+        call_command('rebuild_budget_spend', stdout=StringIO())
+        self.assertEqual(self.buckets(), {self.month: 50})
+
+    def test_category_set_change_rebuilds_budget(self):
+        self.spend(120, category=self.taxi)
+        self.spend(80)
+        self.budget.category = None
+        self.budget.save()
+        self.budget.categories.add(self.food)
+        self.assertEqual(self.buckets(), {self.month: 80})
+        self.budget.categories.add(self.taxi)
+        self.assertEqual(self.buckets(), {self.month: 200})
+        self.budget.categories.remove(self.food)
+        self.assertEqual(self.buckets(), {self.month: 120})
+
+    def test_decrement_for_missing_period_is_skipped(self):
+        tx = self.spend(90)
+        # Период удалён раньше транзакции — так бывает при каскадном удалении бюджета
+        BudgetPeriodSpend.objects.filter(budget=self.budget).delete()
+        tx.delete()
+        self.assertFalse(BudgetPeriodSpend.objects.filter(budget=self.budget).exists())
+
+    def test_family_delete_with_budget_and_family_spend(self):
+        family = Family.objects.create(name='Семья', created_by=self.user)
+        family_account = Account.objects.create(family=family, name='Общий')
+        Budget.objects.create(name='Семейный', family=family, amount=100, start_date=self.budget.start_date)
+        Transaction.objects.create(user=self.user, account=family_account, family=family, amount=90, type='expense',
+                                   date=timezone.now())
+        family.delete()
+        self.assertFalse(BudgetPeriodSpend.objects.exclude(budget=self.budget).exists())
+
+    def test_threshold_warning_sent_once_per_period(self):
+        def warnings():
+            return Notification.objects.filter(user=self.user, notification_type='budget_warning').count()
+
+        self.spend(700)
+        self.assertEqual(warnings(), 0)
+        crossing = self.spend(150)
+        self.assertEqual(warnings(), 1)
+        self.spend(100)
+        self.spend(500)
+        self.assertEqual(warnings(), 1)
+        self.assertIsNotNone(self.budget.period_spends.get(period_start=self.month).warned_at)
+
+        # Вернулись ниже порога — следующее пересечение снова предупреждает
+        Transaction.objects.exclude(pk=crossing.pk).delete()
+        self.assertIsNone(self.budget.period_spends.get(period_start=self.month).warned_at)
+        self.spend(700)
+        self.assertEqual(warnings(), 2)
+
+
+class CategoryRollupDeleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('rollup_user')
+        cls.account = Account.objects.create(owner=cls.user, name='Личный')
+
+    def assertRollupMatchesTransactions(self):
+        expenses = Transaction.objects.filter(user=self.user, type='expense')
+        rollup = MonthlyCategorySpend.objects.filter(user=self.user)
+        self.assertFalse(rollup.filter(count__lte=0).exists())
+        self.assertEqual(rollup.aggregate(s=Sum('amount'))['s'] or 0, expenses.aggregate(s=Sum('amount'))['s'] or 0)
+        self.assertEqual(rollup.aggregate(s=Sum('count'))['s'] or 0, expenses.count())
+
+    def spend(self, amount, **fields):
+        fields.setdefault('account', self.account)
+        return Transaction.objects.create(user=self.user, amount=amount, type='expense', date=timezone.now(), **fields)
+
+    def test_deleted_category_spend_moves_to_uncategorised(self):
+        food = Category.objects.create(name='Еда', type='expense', owner=self.user)
+        self.spend(100, category=food)
+        self.spend(40, category=food)
+        self.spend(5)
+        food.delete()
+        self.assertRollupMatchesTransactions()
+        self.assertEqual(MonthlyCategorySpend.objects.get(user=self.user, category=None, family=None).amount, 145)
+
+    def test_deleted_family_keeps_remaining_transactions_in_rollup(self):
+        family = Family.objects.create(name='Семья', created_by=self.user)
+        family_account = Account.objects.create(family=family, name='Общий')
+        self.spend(300, account=family_account, family=family)
+        self.spend(70, family=family)
+        self.spend(30)
+        family.delete()
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertRollupMatchesTransactions()
@@ -14,6 +14,8 @@ urlpatterns = [
     path('admin/users/', site_admin_views.site_admin_users, name='admin_users'),
     path('admin/users/<uuid:pk>/block/', site_admin_views.site_admin_user_block, name='admin_user_block'),
     path('admin/users/<uuid:pk>/unblock/', site_admin_views.site_admin_user_unblock, name='admin_user_unblock'),
+    path('admin/profiles/', site_admin_views.site_admin_profiles, name='admin_profiles'),
+    path('admin/profiles/<str:route>/<str:name>/', site_admin_views.site_admin_profile_download, name='admin_profile_download'),
     path('features/', views.features, name='features'),
     path('pricing/', views.pricing, name='pricing'),
     path('contact/', views.contact, name='contact'),
@@ -23,6 +25,7 @@ urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('logout/', views.logout_view, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/chart-data/', views.dashboard_chart_data, name='dashboard_chart_data'),
     path('site-admin/', redirect_to_admin),
 
     # Редиректы для старых URL (если где-то используются)
@@ -35,11 +38,15 @@ urlpatterns = [
     path('categories/<uuid:category_id>/delete/', views.delete_category, name='delete_category'),
     path('receipt/upload/', views.upload_receipt_redirect, name='upload_receipt'),
     path('receipt/scan/', views.scan_receipt_redirect, name='scan_receipt'),
+    path('receipt/scan/api/', views.scan_receipt_api, name='scan_receipt_api'),
+    path('receipt/analyze/', views.analyze_receipt_api, name='analyze_receipt_api'),
     path('goals/create/', views.create_goal, name='create_goal'),
     path('goals/<uuid:goal_id>/edit/', views.edit_goal, name='edit_goal'),
     path('goals/<uuid:goal_id>/delete/', views.delete_goal, name='delete_goal'),
     path('goals/<uuid:goal_id>/add-money/', views.add_money_to_goal, name='add_money_to_goal'),
     path('transactions/import-excel/', views.import_transactions_excel, name='import_transactions_excel'),
+    path('transactions/feed/', views.transactions_feed, name='transactions_feed'),
+    path('transactions/search/', views.transactions_search, name='transactions_search'),
     path('transactions/add/', views.add_transaction, name='add_transaction'),
     path('transactions/example-excel/', views.download_transactions_example, name='download_transactions_example'),
 
@@ -55,8 +62,18 @@ urlpatterns = [
     path('family/<uuid:family_id>/invite/', views.family_invite, name='family_invite'),
     path('family/<uuid:family_id>/remove-member/', views.family_remove_member, name='family_remove_member'),
     path('family/<uuid:family_id>/admin-chart/', views.family_admin_chart, name='family_admin_chart'),
+    path('family/<uuid:family_id>/chart-data/', views.family_chart_data, name='family_chart_data'),
     path('family/accept/<str:token>/', views.family_accept_invite, name='family_accept_invite'),
     path('notifications/', views.notifications_list, name='notifications_list'),
+    path('notifications/stream/', views.notifications_stream, name='notifications_stream'),
     path('notifications/mark-all-read/', views.notifications_mark_all_read, name='notifications_mark_all_read'),
     path('profile/', views.profile_edit, name='profile_edit'),
+
+    # Отчёты PDF/Excel (фоновые задания)
+    path('reports/', views.report_jobs, name='report_jobs'),
+    path('reports/<uuid:job_id>/status/', views.report_job_status, name='report_job_status'),
+    path('reports/<uuid:job_id>/download/', views.report_job_download, name='report_job_download'),
+
+    # Метрики Prometheus
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Балансы счетов: Account.balance поддерживается инкрементально при создании, изменении и удалении транзакций
+(сигналы в finance/signals.py, атомарные UPDATE ... SET balance = balance + delta через F()).
+
+Баланс = initial_balance + доходы − расходы − исходящие переводы + входящие переводы (transfer_to_account).
+Сверка с полным пересчётом: python manage.py reconcile_balances [--fix]
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .bulk import increment_many
+
+
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+
+
+def balance_effects(tx_type, amount, account_id, transfer_to_account_id=None):
+    """Изменения балансов, которые вносит транзакция: {account_id: delta}."""
+    effects = {}
+    if not account_id or amount is None:
+        return effects
+    # Сумма может прийти float'ом из формы — округляем так же, как DecimalField при записи в БД
+    amount = Decimal(str(amount)).quantize(CENT)
+    if tx_type == 'income':
+        effects[account_id] = amount
+    elif tx_type == 'expense':
+        effects[account_id] = -amount
+    elif tx_type == 'transfer':
+        effects[account_id] = -amount
+        if transfer_to_account_id:
+            effects[transfer_to_account_id] = effects.get(transfer_to_account_id, ZERO) + amount
+    return effects
+
+
+def transaction_effects(tx):
+    return balance_effects(tx.type, tx.amount, tx.account_id, tx.transfer_to_account_id)
+
+
+def diff_effects(old, new):
+    """Разность двух наборов изменений (что нужно применить, чтобы перейти от old к new)."""
+    deltas = dict(new)
+    for account_id, delta in old.items():
+        deltas[account_id] = deltas.get(account_id, ZERO) - delta
+    return {account_id: delta for account_id, delta in deltas.items() if delta}
+
+
+def apply_balance_deltas(deltas):
+    """Атомарно применяет изменения одним UPDATE с CASE по счетам, без чтения текущего баланса."""
+    from finance.models import Account
+
+    increment_many(Account, {account_id: {'balance': delta} for account_id, delta in deltas.items()})
+
+
+def _signed_amount():
+    return Case(
+        When(type='income', then=F('amount')),
+        default=-F('amount'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def accounts_with_computed_balance(queryset=None):
+    """
+    Счета с аннотацией computed_balance — полный пересчёт по транзакциям одним SQL-запросом
+    (коррелированные подзапросы с GROUP BY по счёту).
+    """
+    from finance.models import Account, Transaction
+
+    if queryset is None:
+        queryset = Account.objects.all()
+    decimal = DecimalField(max_digits=14, decimal_places=2)
+    own = (
+        Transaction.objects.filter(account=OuterRef('pk'))
+        .order_by().values('account')
+        .annotate(total=Sum(_signed_amount())).values('total')
+    )
+    incoming = (
+        Transaction.objects.filter(transfer_to_account=OuterRef('pk'), type='transfer')
+        .order_by().values('transfer_to_account')
+        .annotate(total=Sum('amount')).values('total')
+    )
+    return queryset.annotate(
+        computed_balance=F('initial_balance')
+        + Coalesce(Subquery(own, output_field=decimal), Value(ZERO), output_field=decimal)
+        + Coalesce(Subquery(incoming, output_field=decimal), Value(ZERO), output_field=decimal)
+    )
+
+
+def find_balance_drift(queryset=None):
+    """Список (account, computed_balance) для счетов, у которых сохранённый баланс расходится с пересчётом."""
+    # Сравниваем в Python, округлив до копеек: SQLite считает суммы в плавающей точке,
+    # и на больших счетах погрешность выходит за пределы копейки
+    drifted = []
+    for account in accounts_with_computed_balance(queryset):
+        computed = Decimal(account.computed_balance).quantize(CENT)
+        if account.balance != computed:
+            drifted.append((account, computed))
+    return drifted
+
+
+def fix_balances(queryset=None):
+    """Записывает пересчитанный баланс в счета с расхождением. Возвращает число исправленных."""
+    from finance.models import Account
+
+    drifted = find_balance_drift(queryset)
+    for account, computed in drifted:
+        Account.objects.filter(pk=account.pk).update(balance=computed)
+    return len(drifted)
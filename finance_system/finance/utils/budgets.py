@@ -0,0 +1,303 @@
+"""
+Учёт расходов по бюджетам.
+
+Расходы хранятся по периодам (BudgetPeriodSpend: бюджет + начало дня/недели/месяца/квартала/года) и обновляются
+инкрементально при записи транзакций (сигналы в finance/signals.py): на каждый затронутый период — один
+UPDATE ... SET spent = spent + delta. Budget.spent_amount/remaining_amount — расходы текущего периода.
+Предупреждение budget_warning отправляется один раз за период, когда расходы пересекают порог
+notification_threshold (% от суммы бюджета); историю транзакций при этом не перечитываем.
+
+Полный пересчёт — только при изменении самого бюджета и командой rebuild_budget_spend
+(её же стоит запускать раз в сутки, чтобы spent_amount переключался на новый период).
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .bulk import increment_many
+from .periods import date_range_bounds, period_q
+
+
+TRUNC_BY_PERIOD = {
+    'daily': TruncDay,
+    'weekly': TruncWeek,
+    'monthly': TruncMonth,
+    'quarterly': TruncQuarter,
+    'yearly': TruncYear,
+}
+
+BUDGET_FIELDS = ('id', 'name', 'period', 'amount', 'notification_threshold', 'notifications_enabled',
+                 'user_id', 'family_id')
+
+
+def period_start(period, day):
+    """Первый день периода бюджета, в который попадает дата day."""
+    if period == 'daily':
+        return day
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if period == 'quarterly':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    if period == 'yearly':
+        return date(day.year, 1, 1)
+    return day.replace(day=1)
+
+
+def _local_date(value):
+    if isinstance(value, datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return timezone.localdate(value)
+    return value
+
+
+def _threshold_amount(budget):
+    return Decimal(budget['amount']) * budget['notification_threshold'] / 100
+
+
+def matching_budgets(tx):
+    """Бюджеты, в которые попадает расходная транзакция (один запрос)."""
+    from finance.models import Budget
+
+    if tx.type != 'expense' or not tx.user_id or tx.amount is None:
+        return []
+    day = _local_date(tx.date)
+    owner_q = Q(family__isnull=True, user_id=tx.user_id)
+    if tx.family_id:
+        owner_q |= Q(family_id=tx.family_id)
+    category_q = Q(category__isnull=True, categories__isnull=True)
+    if tx.category_id:
+        category_q |= Q(category_id=tx.category_id) | Q(categories=tx.category_id)
+    return list(
+        Budget.objects.filter(owner_q, category_q, start_date__lte=day)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=day))
+        .values(*BUDGET_FIELDS).distinct()
+    )
+
+
+def budget_contributions(tx):
+    """Вклад транзакции в расходы бюджетов: {(budget_id, period_start): сумма}, плюс словарь бюджетов."""
+    budgets = {b['id']: b for b in matching_budgets(tx)}
+    if not budgets:
+        return {}, budgets
+    amount = Decimal(str(tx.amount)).quantize(Decimal('0.01'))
+    day = _local_date(tx.date)
+    return {(b['id'], period_start(b['period'], day)): amount for b in budgets.values()}, budgets
+
+
+def apply_transaction_change(old, new):
+    """
+    Переносит изменение транзакции в расходы бюджетов. old — прежнее состояние (None при создании),
+    new — новое (None при удалении).
+    """
+    old_parts, old_budgets = budget_contributions(old) if old is not None else ({}, {})
+    new_parts, new_budgets = budget_contributions(new) if new is not None else ({}, {})
+    budgets = {**old_budgets, **new_budgets}
+    deltas = dict(new_parts)
+    for key, amount in old_parts.items():
+        deltas[key] = deltas.get(key, Decimal('0')) - amount
+    for (budget_id, start), delta in deltas.items():
+        if delta:
+            _apply_bucket_delta(budgets[budget_id], start, delta)
+
+
+def apply_created_transactions(transactions):
+    """
+    Учитывает в бюджетах пакет новых транзакций (после bulk_create, минуя сигналы). Бюджеты владельцев
+    читаются одним запросом и сопоставляются в Python по тем же правилам, что matching_budgets();
+    затем недостающие периоды создаются одним bulk_create, а расходы периодов и текущие суммы бюджетов
+    прибавляются одним UPDATE с CASE на каждую таблицу.
+    """
+    from finance.models import Budget, BudgetPeriodSpend
+
+    expenses = [tx for tx in transactions if tx.type == 'expense' and tx.user_id and tx.amount is not None]
+    if not expenses:
+        return
+    user_ids = {tx.user_id for tx in expenses}
+    family_ids = {tx.family_id for tx in expenses if tx.family_id}
+    candidates = (
+        Budget.objects.filter(Q(family__isnull=True, user_id__in=user_ids) | Q(family_id__in=family_ids))
+        .prefetch_related('categories')
+    )
+    budgets = []
+    for budget in candidates:
+        category_ids = {c.id for c in budget.categories.all()}
+        if budget.category_id:
+            category_ids.add(budget.category_id)
+        values = {field: getattr(budget, field) for field in BUDGET_FIELDS}
+        budgets.append((values, category_ids, budget.start_date, budget.end_date))
+
+    deltas = {}
+    by_id = {}
+    for tx in expenses:
+        day = _local_date(tx.date)
+        amount = Decimal(str(tx.amount)).quantize(Decimal('0.01'))
+        for values, category_ids, start_date, end_date in budgets:
+            if values['family_id']:
+                if values['family_id'] != tx.family_id:
+                    continue
+            elif values['user_id'] != tx.user_id:
+                continue
+            if category_ids and tx.category_id not in category_ids:
+                continue
+            if start_date > day or (end_date and end_date < day):
+                continue
+            key = (values['id'], period_start(values['period'], day))
+            deltas[key] = deltas.get(key, Decimal('0')) + amount
+            by_id[values['id']] = values
+    if not deltas:
+        return
+
+    buckets = _bucket_ids(deltas)
+    missing = [key for key in deltas if key not in buckets]
+    if missing:
+        # Период мог создать параллельный процесс — конфликт пропускается, прибавка ниже всё равно через F()
+        BudgetPeriodSpend.objects.bulk_create([
+            BudgetPeriodSpend(budget_id=budget_id, period_start=start) for budget_id, start in missing
+        ], ignore_conflicts=True)
+        buckets.update(_bucket_ids(missing))
+    increment_many(BudgetPeriodSpend, {buckets[key]: {'spent': delta} for key, delta in deltas.items()})
+
+    today = timezone.localdate()
+    current = {(budget_id, period_start(budget['period'], today)) for budget_id, budget in by_id.items()}
+    increment_many(Budget, {
+        budget_id: {'spent_amount': delta, 'remaining_amount': -delta}
+        for (budget_id, start), delta in deltas.items() if (budget_id, start) in current
+    })
+
+    # Пороги: итоги периодов читаются одним запросом; помечается и предупреждает только период, впервые пересёкший порог
+    now = timezone.now()
+    unwarned = BudgetPeriodSpend.objects.filter(pk__in=list(buckets.values()), warned_at__isnull=True)
+    for pk, budget_id, start, spent in unwarned.values_list('pk', 'budget_id', 'period_start', 'spent'):
+        budget = by_id[budget_id]
+        if spent < _threshold_amount(budget):
+            continue
+        if BudgetPeriodSpend.objects.filter(pk=pk, warned_at__isnull=True).update(warned_at=now):
+            if (budget_id, start) in current and budget['notifications_enabled']:
+                _notify_budget_warning(budget, spent)
+
+
+def _bucket_ids(keys):
+    """{(budget_id, period_start): pk} для существующих периодов бюджетов (один запрос)."""
+    from finance.models import BudgetPeriodSpend
+
+    keys = set(keys)
+    candidates = BudgetPeriodSpend.objects.filter(
+        budget_id__in={key[0] for key in keys}, period_start__in={key[1] for key in keys}
+    ).values_list('pk', 'budget_id', 'period_start')
+    return {(budget_id, start): pk for pk, budget_id, start in candidates if (budget_id, start) in keys}
+
+
+def _apply_bucket_delta(budget, start, delta):
+    from finance.models import Budget, BudgetPeriodSpend
+
+    buckets = BudgetPeriodSpend.objects.filter(budget_id=budget['id'], period_start=start)
+    if not buckets.update(spent=F('spent') + delta):
+        if delta < 0:
+            # Периода нет — бюджет удаляется вместе с семьёй или категорией, вычитать не из чего
+            return
+        try:
+            with transaction.atomic():
+                BudgetPeriodSpend.objects.create(budget_id=budget['id'], period_start=start, spent=delta)
+        except IntegrityError:
+            # Период создан параллельной транзакцией
+            buckets.update(spent=F('spent') + delta)
+
+    is_current = start == period_start(budget['period'], timezone.localdate())
+    if is_current:
+        Budget.objects.filter(pk=budget['id']).update(
+            spent_amount=F('spent_amount') + delta, remaining_amount=F('remaining_amount') - delta
+        )
+
+    spent = buckets.values_list('spent', flat=True).first() or Decimal('0')
+    threshold = _threshold_amount(budget)
+    if delta > 0 and spent >= threshold:
+        # Помечаем период до отправки: предупреждение уходит ровно один раз, даже при гонке
+        if buckets.filter(warned_at__isnull=True).update(warned_at=timezone.now()):
+            if is_current and budget['notifications_enabled']:
+                _notify_budget_warning(budget, spent)
+    elif delta < 0 and spent < threshold:
+        buckets.filter(warned_at__isnull=False).update(warned_at=None)
+
+
+def _notify_budget_warning(budget, spent):
+    from .notifications import notify
+
+    amount = Decimal(budget['amount'])
+    percent = int(spent * 100 / amount) if amount else 100
+    title = f'Бюджет «{budget["name"]}»: израсходовано {percent}%'
+    if spent > amount:
+        message = f'Расходы {spent:.2f} ₽ превысили бюджет {amount:.2f} ₽.'
+    else:
+        message = f'Израсходовано {spent:.2f} ₽ из {amount:.2f} ₽, осталось {amount - spent:.2f} ₽.'
+    if budget['family_id']:
+        recipients = {'family_ids': [budget['family_id']]}
+    else:
+        recipients = {'user_ids': [budget['user_id']] if budget['user_id'] else []}
+    notify('budget_warning', title, message, data={'budget_id': str(budget['id']), 'percent': percent}, **recipients)
+
+
+def budget_transactions(budget):
+    """Расходные транзакции, которые учитываются в бюджете (для полного пересчёта)."""
+    from finance.models import Transaction
+
+    start, end = date_range_bounds(budget.start_date, budget.end_date)
+    qs = Transaction.objects.filter(period_q('date', start, end), type='expense')
+    if budget.family_id:
+        qs = qs.filter(family_id=budget.family_id)
+    else:
+        qs = qs.filter(user_id=budget.user_id)
+    category_ids = set(budget.categories.values_list('id', flat=True))
+    if budget.category_id:
+        category_ids.add(budget.category_id)
+    if category_ids:
+        qs = qs.filter(category_id__in=category_ids)
+    return qs
+
+
+def rebuild_budget_spend(budget):
+    """Пересчитывает расходы бюджета по всем периодам одним GROUP BY. Уже превышенные периоды не шлют предупреждений повторно."""
+    from finance.models import Budget, BudgetPeriodSpend
+
+    trunc = TRUNC_BY_PERIOD.get(budget.period, TruncMonth)
+    rows = (
+        budget_transactions(budget).order_by()
+        .annotate(bucket=trunc('date')).values('bucket').annotate(total=Sum('amount'))
+    )
+    threshold = budget.amount * budget.notification_threshold / 100
+    now = timezone.now()
+    buckets = []
+    for row in rows:
+        bucket = row['bucket'].date() if isinstance(row['bucket'], datetime) else row['bucket']
+        buckets.append(BudgetPeriodSpend(
+            budget=budget, period_start=bucket, spent=row['total'],
+            warned_at=now if row['total'] >= threshold else None,
+        ))
+    current = period_start(budget.period, timezone.localdate())
+    spent_now = next((b.spent for b in buckets if b.period_start == current), Decimal('0'))
+    with transaction.atomic():
+        BudgetPeriodSpend.objects.filter(budget=budget).delete()
+        BudgetPeriodSpend.objects.bulk_create(buckets)
+        Budget.objects.filter(pk=budget.pk).update(spent_amount=spent_now, remaining_amount=budget.amount - spent_now)
+    return len(buckets)
+
+
+def refresh_current_spend(budgets=None):
+    """Переключает spent_amount/remaining_amount на текущий период (после смены дня/недели/месяца)."""
+    from finance.models import Budget, BudgetPeriodSpend
+
+    budgets = Budget.objects.all() if budgets is None else budgets
+    today = timezone.localdate()
+    updated = 0
+    for budget in budgets.only('id', 'period', 'amount', 'spent_amount'):
+        spent = BudgetPeriodSpend.objects.filter(
+            budget=budget, period_start=period_start(budget.period, today)
+        ).values_list('spent', flat=True).first() or Decimal('0')
+        if spent != budget.spent_amount:
+            Budget.objects.filter(pk=budget.pk).update(spent_amount=spent, remaining_amount=budget.amount - spent)
+            updated += 1
+    return updated
@@ -0,0 +1,32 @@
+"""
+Пакетные инкременты: UPDATE ... SET field = field + CASE pk WHEN ... END WHERE pk IN (...) — один запрос
+на пачку строк вместо UPDATE на каждую. Прибавление идёт к значению в БД (F()), без чтения: параллельные
+изменения тех же строк не теряются.
+"""
+from django.db.models import Case, F, Value, When
+
+
+INCREMENT_BATCH_SIZE = 500
+
+
+def increment_many(model, deltas, batch_size=INCREMENT_BATCH_SIZE):
+    """
+    Прибавляет к полям строк model значения deltas: {pk: {поле: delta}}.
+    Возвращает число обновлённых строк (строки, которых уже нет, пропускаются).
+    """
+    items = [(pk, fields) for pk, fields in deltas.items() if any(fields.values())]
+    updated = 0
+    for i in range(0, len(items), batch_size):
+        chunk = items[i:i + batch_size]
+        names = {name for _, fields in chunk for name in fields}
+        values = {}
+        for name in names:
+            output_field = model._meta.get_field(name)
+            values[name] = F(name) + Case(
+                *[When(pk=pk, then=Value(fields[name], output_field=output_field))
+                  for pk, fields in chunk if fields.get(name)],
+                default=Value(0, output_field=output_field),
+                output_field=output_field,
+            )
+        updated += model._default_manager.filter(pk__in=[pk for pk, _ in chunk]).update(**values)
+    return updated
@@ -0,0 +1,140 @@
+"""
+Кэширование: версии данных пользователей и семей, виджеты дашборда, страницы для анонимов.
+
+Ключи виджетов содержат версии данных (scope, id). При записи транзакций, целей, категорий и т.п.
+сигналы (finance/signals.py) увеличивают версию — старые ключи просто перестают читаться
+и вытесняются по таймауту, явной инвалидации не требуется.
+"""
+import hashlib
+import secrets
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .metrics import CACHE_REQUESTS
+
+
+GLOBAL = ('global', 0)  # версия общих данных (системные категории)
+
+
+def _version_key(scope, obj_id):
+    return f'v:{scope}:{obj_id}'
+
+
+def _initial_version():
+    # Старт от текущего времени в мс: после вытеснения счётчика из кэша
+    # новая версия не совпадёт с уже выданными ранее
+    return int(time.time() * 1000)
+
+
+def data_versions(scopes):
+    """Возвращает {(scope, id): версия} для списка пар (scope, id) одним обращением к кэшу."""
+    keys = {_version_key(scope, obj_id): (scope, obj_id) for scope, obj_id in scopes}
+    found = cache.get_many(list(keys))
+    result = {}
+    for key, pair in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _initial_version(), None)
+            version = cache.get(key)
+        result[pair] = version
+    return result
+
+
+def data_version(scope, obj_id):
+    """Текущая версия данных пользователя ('user') или семьи ('family')."""
+    return data_versions([(scope, obj_id)])[(scope, obj_id)]
+
+
+def bump_data_version(scope, obj_id):
+    """Увеличивает версию данных — все закэшированные по ней виджеты становятся неактуальными."""
+    key = _version_key(scope, obj_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, None)
+        return version
+
+
+def bump_data_versions(scopes):
+    """
+    Меняет версии нескольких областей одним set_many (cache.incr — по обращению на ключ). Новая версия —
+    случайное 62-битное число: с выданными раньше она не совпадёт, поэтому параллельный incr того же ключа
+    не приводит к возврату уже использованной версии.
+    """
+    scopes = set(scopes)
+    if scopes:
+        cache.set_many({_version_key(scope, obj_id): secrets.randbits(62) for scope, obj_id in scopes}, None)
+
+
+def restore_data_versions(versions):
+    """Возвращает версиям значения, полученные из data_versions(), — после отката изменений в БД (бенчмарки)."""
+    cache.set_many({_version_key(scope, obj_id): version for (scope, obj_id), version in versions.items()}, None)
+
+
+def versioned_key(name, scopes, *parts):
+    """Ключ кэша виджета: имя + версии всех областей данных + параметры (хэшируются)."""
+    versions = data_versions(scopes)
+    raw = '|'.join(f'{scope}:{obj_id}:{versions[(scope, obj_id)]}' for scope, obj_id in scopes)
+    raw += '|' + '|'.join(str(p) for p in parts)
+    return f'w:{name}:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def versions_etag(scopes, *parts):
+    """ETag по версиям данных: меняется только при записи в соответствующие данные, без запросов к БД."""
+    return quote_etag(versioned_key('etag', scopes, *parts).rsplit(':', 1)[-1])
+
+
+def cached_widget(name, scopes, compute, *parts, timeout=None):
+    """Возвращает данные виджета из кэша или вычисляет compute() и кладёт результат в кэш."""
+    if timeout is None:
+        timeout = getattr(settings, 'FINANCE_WIDGET_CACHE_TIMEOUT', 600)
+    key = versioned_key(name, scopes, *parts)
+    value = cache.get(key)
+    CACHE_REQUESTS.inc(cache='widget', result='miss' if value is None else 'hit')
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def cache_anonymous_page(view_func):
+    """
+    Полностраничный кэш для анонимных посетителей с ETag и Last-Modified.
+    Авторизованным пользователям и при наличии flash-сообщений страница рендерится как обычно.
+    """
+    @wraps(view_func)
+    def wrapped(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                or len(messages.get_messages(request))):
+            return view_func(request, *args, **kwargs)
+        language = getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE)
+        key = versioned_key('page', [GLOBAL], request.get_full_path(), language)
+        entry = cache.get(key)
+        CACHE_REQUESTS.inc(cache='page', result='miss' if entry is None else 'hit')
+        if entry is None:
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            entry = {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+                'last_modified': int(time.time()),
+            }
+            cache.set(key, entry, getattr(settings, 'FINANCE_PAGE_CACHE_TIMEOUT', 600))
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        patch_vary_headers(response, ('Cookie',))
+        return get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response
+        )
+    return wrapped
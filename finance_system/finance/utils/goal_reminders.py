@@ -2,6 +2,9 @@
 from django.utils import timezone
 from datetime import timedelta
 
+from .metrics import REMINDER_JOB_SECONDS
+from .notifications import notify
+
 
 FREQUENCY_DAYS = {
     'daily': 1,
@@ -12,17 +15,28 @@ FREQUENCY_DAYS = {
 }
 
 
+def reminder_dedup_key(goal, day):
+    """Ключ напоминания: одно уведомление по цели в день, кто бы его ни создал — дашборд или cron."""
+    return f'goal:{goal.id}:{day.isoformat()}'
+
+
+@REMINDER_JOB_SECONDS.time(job='dashboard')
 def create_replenishment_reminders():
-    """Создаёт уведомления о пополнении целей по графику. Не создаёт дубликаты за текущий день."""
-    from finance.models import FinancialGoal, Notification, FamilyMember
+    """
+    Создаёт уведомления о пополнении целей по графику. Не создаёт дубликаты за текущий день:
+    ключи уже отправленных сегодня напоминаний читаются одним запросом, и для таких целей notify()
+    (определение получателей и INSERT) не вызывается — повторные загрузки дашборда только читают.
+    """
+    from finance.models import FinancialGoal, Notification
 
-    today = timezone.now().date()
+    today = timezone.localdate()
 
     goals = FinancialGoal.objects.filter(
         status='active',
         replenishment_frequency__in=FREQUENCY_DAYS.keys(),
     ).exclude(replenishment_frequency='').select_related('family', 'user')
 
+    due = []
     for goal in goals:
         days = FREQUENCY_DAYS.get(goal.replenishment_frequency)
         if not days:
@@ -37,35 +51,27 @@ def create_replenishment_reminders():
         if today < next_due:
             continue
 
-        # Проверка: не создавали ли уже уведомление для этой цели сегодня
-        goal_id_str = str(goal.id)
-        if goal.family_id:
-            user_ids = [goal.family.created_by_id]
-            for m in FamilyMember.objects.filter(family=goal.family).values_list('user_id', flat=True):
-                if m not in user_ids:
-                    user_ids.append(m)
-        else:
-            if not goal.user_id:
-                continue
-            user_ids = [goal.user_id]
-
-        for user_id in user_ids:
-            try:
-                if Notification.objects.filter(
-                    user_id=user_id,
-                    notification_type='goal_replenishment_reminder',
-                    created_at__date=today,
-                    data__goal_id=goal_id_str,
-                ).exists():
-                    continue  # уже есть уведомление за сегодня
-            except Exception:
-                pass  # если БД не поддерживает data__goal_id, создаём без проверки дубликата
+        if not goal.family_id and not goal.user_id:
+            continue
+        due.append(goal)
+    if not due:
+        return
 
-            display_freq = dict(FinancialGoal.REPLENISHMENT_CHOICES).get(goal.replenishment_frequency) or goal.replenishment_frequency
-            Notification.objects.create(
-                user_id=user_id,
-                notification_type='goal_replenishment_reminder',
-                title='Напоминание: пополнение цели',
-                message=f'Цель «{goal.name}»: по графику пополнение {display_freq}. Рекомендуется внести сумму.',
-                data={'goal_id': goal_id_str, 'goal_name': goal.name, 'family_id': str(goal.family_id) if goal.family_id else None},
-            )
+    # Повтор за сегодня (дашборд открыт снова, уже отработал cron) отсекается ключом «цель:дата»
+    sent = set(Notification.objects.filter(
+        notification_type='goal_replenishment_reminder',
+        dedup_key__in=[reminder_dedup_key(goal, today) for goal in due],
+    ).values_list('dedup_key', flat=True).distinct())
+    for goal in due:
+        if reminder_dedup_key(goal, today) in sent:
+            continue
+        display_freq = dict(FinancialGoal.REPLENISHMENT_CHOICES).get(goal.replenishment_frequency) or goal.replenishment_frequency
+        notify(
+            'goal_replenishment_reminder',
+            'Напоминание: пополнение цели',
+            f'Цель «{goal.name}»: по графику пополнение {display_freq}. Рекомендуется внести сумму.',
+            user_ids=[] if goal.family_id else [goal.user_id],
+            family_ids=[goal.family_id] if goal.family_id else [],
+            data={'goal_id': str(goal.id), 'goal_name': goal.name, 'family_id': str(goal.family_id) if goal.family_id else None},
+            dedup_key=reminder_dedup_key(goal, today),
+        )
@@ -0,0 +1,258 @@
+"""
+Метрики приложения в текстовом формате Prometheus (эндпоинт /metrics).
+
+Счётчики и гистограммы объявляются здесь же, в коде вызываются через inc()/observe()/time():
+
+    RECEIPT_QR.inc(result='hit')
+    with ML_TRAIN_SECONDS.time():
+        pipe.fit(X, y)
+
+Значения хранятся в памяти процесса. Под gunicorn с несколькими воркерами задайте METRICS_MULTIPROC_DIR:
+каждый процесс раз в METRICS_FLUSH_INTERVAL секунд (и при выходе) пишет снимок своих значений в отдельный
+файл этого каталога, а /metrics суммирует все файлы — в том числе завершившихся воркеров, поэтому счётчики
+не «проседают» при перезапуске воркера. Каталог очищается при старте сервиса (как у prometheus_client).
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Registry:
+    """Метрики процесса: {имя: метрика} и значения {(имя, метки): число или [корзины..., сумма, количество]}."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.values = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.file_token = uuid.uuid4().hex[:8]
+        self.flusher = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Метрика {metric.name} уже объявлена')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def update(self, key, apply):
+        with self.lock:
+            apply(self.values, key)
+            self.dirty = True
+        if self.flusher is None and multiproc_dir():
+            self.start_flusher()
+
+    def reset_after_fork(self):
+        """В дочернем процессе — свои значения и свой файл: значения родителя остаются в файле родителя."""
+        self.lock = threading.Lock()
+        self.values = {}
+        self.dirty = False
+        self.file_token = uuid.uuid4().hex[:8]
+        self.flusher = None
+
+    # --- Несколько процессов ---
+
+    def snapshot_path(self, directory):
+        return Path(directory) / f'{os.getpid()}-{self.file_token}.json'
+
+    def flush(self):
+        directory = multiproc_dir()
+        if not directory:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            data = [[name, list(labels), value] for (name, labels), value in self.values.items()]
+            self.dirty = False
+        path = self.snapshot_path(directory)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(data), encoding='utf-8')
+        tmp.replace(path)
+
+    def start_flusher(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(target=loop, name='metrics-flusher', daemon=True)
+        self.flusher.start()
+
+    def collect(self):
+        """Значения всех процессов (или только текущего, если каталог не задан), просуммированные по ключу."""
+        directory = multiproc_dir()
+        if not directory:
+            with self.lock:
+                return {key: list(v) if isinstance(v, list) else v for key, v in self.values.items()}
+        self.flush()
+        merged = {}
+        for path in Path(directory).glob('*.json'):
+            try:
+                data = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue  # файл удалён или ещё не дописан
+            for name, labels, value in data:
+                key = (name, tuple(labels))
+                if isinstance(value, list):
+                    current = merged.setdefault(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4."""
+        values = self.collect()
+        by_name = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in sorted(by_name.get(name, [])):
+                lines.extend(metric.sample_lines(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=REGISTRY.reset_after_fork)
+atexit.register(lambda: REGISTRY.flush())
+
+
+def multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.registry = registry
+        registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name}: ожидаются метки {self.label_names}, получены {tuple(labels)}')
+        return self.name, tuple(str(labels[name]) for name in self.label_names)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        def apply(values, key):
+            values[key] = values.get(key, 0) + amount
+        self.registry.update(self.key(labels), apply)
+
+    def sample_lines(self, labels, value):
+        return [f'{self.name}{_format_labels(zip(self.label_names, labels))} {_format_value(value)}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+
+        def apply(values, key):
+            # Корзины хранятся не накопленными (+ корзина «больше всех границ»), затем сумма и количество
+            current = values.get(key)
+            if current is None:
+                current = values[key] = [0] * (len(self.buckets) + 3)
+            current[index] += 1
+            current[-2] += value
+            current[-1] += 1
+        self.registry.update(self.key(labels), apply)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def sample_lines(self, labels, value):
+        pairs = list(zip(self.label_names, labels))
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), value):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", _format_value(float(bound)))])} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(pairs)} {_format_value(float(value[-2]))}')
+        lines.append(f'{self.name}_count{_format_labels(pairs)} {value[-1]}')
+        return lines
+
+
+# --- Метрики приложения ---
+
+RECEIPT_OCR_PASS_SECONDS = Histogram(
+    'finance_receipt_ocr_pass_seconds', 'Длительность прохода распознавания чека (qr — pyzbar, tesseract — OCR).',
+    labels=('stage',),
+)
+RECEIPT_QR = Counter(
+    'finance_receipt_qr_total', 'Распознавания чека по QR: hit — сумма найдена в QR, miss — нужен OCR.',
+    labels=('result',),
+)
+ML_TRAIN_SECONDS = Histogram('finance_ml_train_seconds', 'Обучение ML-категоризатора.')
+ML_PREDICT_SECONDS = Histogram(
+    'finance_ml_predict_seconds', 'Предсказание категории ML-моделью.',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+IMPORT_ROWS = Counter('finance_import_rows_total', 'Строки импорта Excel: created или error.', labels=('result',))
+IMPORT_SECONDS = Histogram('finance_import_seconds', 'Длительность импорта одного файла Excel.')
+IMPORT_ROWS_PER_SECOND = Histogram(
+    'finance_import_rows_per_second', 'Скорость импорта файла Excel, строк в секунду.',
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+REMINDER_JOB_SECONDS = Histogram(
+    'finance_reminder_job_seconds', 'Длительность задания напоминаний о пополнении целей.', labels=('job',),
+)
+CACHE_REQUESTS = Counter(
+    'finance_cache_requests_total', 'Обращения к кэшу виджетов и страниц: hit или miss.', labels=('cache', 'result'),
+)
+NOTIFICATION_DELIVERIES = Counter(
+    'finance_notification_deliveries_total', 'Отправки уведомлений по внешним каналам: sent, retry или failed.',
+    labels=('channel', 'result'),
+)
@@ -10,6 +10,8 @@ from sklearn.pipeline import Pipeline
 from django.db.models import Count
 import json
 
+from .metrics import ML_PREDICT_SECONDS, ML_TRAIN_SECONDS
+
 
 class TransactionCategorizer:
     def __init__(self):
@@ -21,7 +23,8 @@ class TransactionCategorizer:
 
     def train(self, X, y):
         """Обучение модели на исторических данных"""
-        self.model.fit(X, y)
+        with ML_TRAIN_SECONDS.time():
+            self.model.fit(X, y)
         self.is_trained = True
 
     def predict(self, description):
@@ -29,7 +32,8 @@ class TransactionCategorizer:
         if not self.is_trained:
             return None, 0.0
 
-        probas = self.model.predict_proba([description])
+        with ML_PREDICT_SECONDS.time():
+            probas = self.model.predict_proba([description])
         max_idx = np.argmax(probas)
         confidence = probas[0][max_idx]
         category = self.model.classes_[max_idx]
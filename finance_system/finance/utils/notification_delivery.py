@@ -0,0 +1,262 @@
+"""
+Доставка уведомлений по внешним каналам (email, telegram) из исходящей очереди NotificationDelivery.
+
+Воркер (python manage.py deliver_notifications --loop) берёт пачку ожидающих записей канала под
+SELECT ... FOR UPDATE SKIP LOCKED — параллельные воркеры получают разные пачки — и сразу «арендует» их:
+увеличивает attempts и сдвигает next_attempt_at на NOTIFICATION_DELIVERY_LEASE_SECONDS. Отправка идёт уже
+после коммита, без удержания блокировок; если воркер упал посреди пачки, записи вернутся в очередь по
+истечении аренды.
+
+Пачка отправляется через одно соединение: SMTP — одно get_connection() на пачку, Telegram — одно
+keep-alive HTTPS-соединение с Bot API. Частота отправок ограничена по каналу (NOTIFICATION_DELIVERY_RATE,
+сообщений в секунду на процесс). Неудачная отправка повторяется с удваивающейся задержкой
+(NOTIFICATION_DELIVERY_RETRY_SECONDS ... _RETRY_MAX_SECONDS, для Telegram 429 — не меньше retry_after),
+после NOTIFICATION_DELIVERY_MAX_ATTEMPTS попыток запись помечается failed. Успешная отправка отмечает
+уведомление: is_sent=True, sent_via=канал.
+
+Для проверки без реальной почты: EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend, EMAIL_PORT=1025
+и локальный отладочный SMTP-сервер `python -m aiosmtpd -n -l localhost:1025`; в тестах — locmem-бэкенд Django.
+"""
+import http.client
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import NOTIFICATION_DELIVERIES
+
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = ('email', 'telegram')
+TELEGRAM_TIMEOUT = 10
+MAX_ERROR_LENGTH = 500
+
+
+class DeliveryError(Exception):
+    """Ошибка отправки одного сообщения; retry_after — минимальная пауза перед повтором, которую просит сервис."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Не чаще rate отправок в секунду: wait() выдерживает паузу от предыдущей отправки. rate <= 0 — без ограничения."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = self.clock()
+            if self.next_at > now:
+                self.sleep(self.next_at - now)
+                now = self.next_at
+            self.next_at = now + self.interval
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def rate_limiter(channel):
+    """Ограничитель канала, общий для всех пачек процесса."""
+    with _limiters_lock:
+        limiter = _limiters.get(channel)
+        if limiter is None:
+            rate = getattr(settings, 'NOTIFICATION_DELIVERY_RATE', {}).get(channel, 0)
+            limiter = _limiters[channel] = RateLimiter(rate)
+        return limiter
+
+
+def retry_delay(attempts, retry_after=None):
+    """Задержка перед следующей попыткой: база * 2^(попытка-1), не больше максимума и не меньше retry_after."""
+    base = settings.NOTIFICATION_DELIVERY_RETRY_SECONDS
+    delay = min(base * 2 ** max(attempts - 1, 0), settings.NOTIFICATION_DELIVERY_RETRY_MAX_SECONDS)
+    return max(delay, retry_after or 0)
+
+
+# --- Каналы ---
+
+class TelegramConnection:
+    """Keep-alive соединение с Telegram Bot API на время пачки (как SMTP-соединение у почты)."""
+
+    def __init__(self, token, api_url=None, timeout=TELEGRAM_TIMEOUT):
+        parts = urlsplit(api_url or settings.TELEGRAM_API_URL)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.path = f'{parts.path.rstrip("/")}/bot{token}/sendMessage'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+    def send(self, chat_id, text):
+        body = json.dumps({'chat_id': chat_id, 'text': text}, ensure_ascii=False).encode('utf-8')
+        try:
+            self.connection.request('POST', self.path, body, {'Content-Type': 'application/json'})
+            response = self.connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            self.connection.close()  # следующая отправка откроет соединение заново
+            raise DeliveryError(f'Telegram недоступен: {exc}')
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            data = {}
+        if response.status == 429:
+            raise DeliveryError(data.get('description') or 'Too Many Requests',
+                                retry_after=(data.get('parameters') or {}).get('retry_after'))
+        if response.status != 200 or not data.get('ok'):
+            raise DeliveryError(data.get('description') or f'HTTP {response.status}')
+
+
+def _send_email(deliveries, notifications, limiter):
+    errors = {}
+    # Одно SMTP-соединение на всю пачку: открывается при входе, закрывается при выходе
+    with get_connection(fail_silently=False) as connection:
+        for delivery in deliveries:
+            notification = notifications[delivery.notification_id]
+            limiter.wait()
+            message = EmailMessage(notification.title, notification.message, settings.DEFAULT_FROM_EMAIL,
+                                   [delivery.address], connection=connection)
+            try:
+                message.send()
+            except Exception as exc:
+                errors[delivery.pk] = DeliveryError(str(exc) or exc.__class__.__name__)
+    return errors
+
+
+def _send_telegram(deliveries, notifications, limiter):
+    errors = {}
+    with TelegramConnection(settings.TELEGRAM_BOT_TOKEN) as connection:
+        for delivery in deliveries:
+            notification = notifications[delivery.notification_id]
+            limiter.wait()
+            try:
+                connection.send(delivery.address, f'{notification.title}\n\n{notification.message}')
+            except DeliveryError as exc:
+                errors[delivery.pk] = exc
+    return errors
+
+
+SENDERS = {'email': _send_email, 'telegram': _send_telegram}
+
+
+def channel_configured(channel):
+    if channel == 'telegram':
+        return bool(getattr(settings, 'TELEGRAM_BOT_TOKEN', ''))
+    return channel in SENDERS
+
+
+# --- Очередь ---
+
+def claim_batch(channel, batch_size=None, now=None):
+    """Забирает пачку наступивших записей канала: блокировка SKIP LOCKED, затем аренда (attempts + 1, сдвиг срока)."""
+    from finance.models import NotificationDelivery
+
+    now = now or timezone.now()
+    batch_size = batch_size or settings.NOTIFICATION_DELIVERY_BATCH_SIZE
+    with transaction.atomic():
+        deliveries = list(
+            NotificationDelivery.objects.filter(channel=channel, status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not deliveries:
+            return []
+        lease_until = now + timedelta(seconds=settings.NOTIFICATION_DELIVERY_LEASE_SECONDS)
+        NotificationDelivery.objects.filter(pk__in=[d.pk for d in deliveries]).update(
+            attempts=F('attempts') + 1, next_attempt_at=lease_until,
+        )
+    for delivery in deliveries:
+        delivery.attempts += 1
+    return deliveries
+
+
+def _record_results(channel, deliveries, errors):
+    from finance.models import Notification, NotificationDelivery
+
+    now = timezone.now()
+    sent = [d for d in deliveries if d.pk not in errors]
+    failed = []
+    for delivery in deliveries:
+        error = errors.get(delivery.pk)
+        if error is None:
+            continue
+        delivery.last_error = str(error)[:MAX_ERROR_LENGTH]
+        if delivery.attempts >= settings.NOTIFICATION_DELIVERY_MAX_ATTEMPTS:
+            delivery.status = 'failed'
+        else:
+            delivery.next_attempt_at = now + timedelta(seconds=retry_delay(delivery.attempts, error.retry_after))
+        failed.append(delivery)
+
+    with transaction.atomic():
+        if sent:
+            NotificationDelivery.objects.filter(pk__in=[d.pk for d in sent]).update(
+                status='sent', sent_at=now, last_error='',
+            )
+            Notification.objects.filter(pk__in={d.notification_id for d in sent}).update(is_sent=True, sent_via=channel)
+        if failed:
+            NotificationDelivery.objects.bulk_update(failed, ['status', 'next_attempt_at', 'last_error'])
+
+    NOTIFICATION_DELIVERIES.inc(len(sent), channel=channel, result='sent')
+    for delivery in failed:
+        NOTIFICATION_DELIVERIES.inc(channel=channel, result='failed' if delivery.status == 'failed' else 'retry')
+        logger.warning('Доставка %s → %s не удалась (попытка %s): %s',
+                       channel, delivery.address, delivery.attempts, delivery.last_error)
+    return len(sent), len(failed)
+
+
+def deliver_batch(channel, batch_size=None, now=None):
+    """Отправляет одну пачку канала. Возвращает (отправлено, не отправлено) или (0, 0), если очередь пуста."""
+    from finance.models import Notification
+
+    deliveries = claim_batch(channel, batch_size, now)
+    if not deliveries:
+        return 0, 0
+    notifications = Notification.objects.only('title', 'message').in_bulk({d.notification_id for d in deliveries})
+    try:
+        errors = SENDERS[channel](deliveries, notifications, rate_limiter(channel))
+    except Exception as exc:
+        # Соединение с сервисом не открылось — повтор всей пачки по общим правилам
+        errors = {d.pk: DeliveryError(str(exc) or exc.__class__.__name__) for d in deliveries}
+    return _record_results(channel, deliveries, errors)
+
+
+def deliver_pending(channels=None, batch_size=None, max_batches=None):
+    """
+    Отправляет наступившие записи очереди по каналам, пачка за пачкой, пока очередь канала не опустеет
+    (или не будет отправлено max_batches пачек). Возвращает {канал: (отправлено, не отправлено)}.
+    """
+    totals = {}
+    for channel in channels or CHANNELS:
+        if not channel_configured(channel):
+            continue
+        sent_total = failed_total = batches = 0
+        now = timezone.now()
+        while max_batches is None or batches < max_batches:
+            # now фиксирован на проход: записи, отложенные на повтор в этом проходе, ждут следующего
+            sent, failed = deliver_batch(channel, batch_size, now)
+            if not sent and not failed:
+                break
+            sent_total += sent
+            failed_total += failed
+            batches += 1
+        totals[channel] = (sent_total, failed_total)
+    return totals
@@ -0,0 +1,264 @@
+"""
+Поток уведомлений для SSE (/notifications/stream/): новые уведомления и счётчик непрочитанных без перезагрузки страниц.
+
+Сигнал сохранения Notification после коммита публикует событие в брокер (publish_notification), открытые
+SSE-соединения пользователя получают его через свою очередь asyncio. Брокер по умолчанию — в памяти процесса.
+Если задан NOTIFICATION_BROKER_URL (redis://...), события пересылаются через Redis pub/sub и доходят до
+соединений в других воркерах и из cron-команд. Без брокера поток раз в NOTIFICATION_STREAM_POLL_SECONDS
+дочитывает из БД уведомления, созданные другими процессами, — это запасной путь, а не основной.
+
+id события — позиция уведомления («микросекунды.id»): браузер передаёт его в Last-Event-ID при переподключении,
+и пропущенные уведомления досылаются из БД. Событие unread несёт текущую позицию потока.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+CATCH_UP_LIMIT = 50
+CHANNEL_PREFIX = 'finance:notifications:'
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def event_position(created_at, notification_id):
+    micros = (created_at - _EPOCH) // timedelta(microseconds=1)
+    return f'{micros}.{notification_id.hex}'
+
+
+def parse_position(value):
+    """(created_at, id) из id события или None."""
+    try:
+        micros, hex_id = value.split('.')
+        return _EPOCH + timedelta(microseconds=int(micros)), uuid.UUID(hex=hex_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def notification_event(notification):
+    return {
+        'kind': 'notification',
+        'id': event_position(notification.created_at, notification.id),
+        'type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def offer(self, event):
+        # Вызывается в цикле событий подписчика; переполненная очередь (клиент не читает) — событие теряется,
+        # поток дочитает пропущенное из БД
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker:
+    """Подписки SSE-соединений этого процесса: {user_id: {Subscription}}. publish можно вызывать из любого потока."""
+
+    cross_process = False
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        subscription = Subscription(asyncio.get_running_loop())
+        key = str(user_id)
+        with self.lock:
+            self.subscribers.setdefault(key, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self.lock:
+                subs = self.subscribers.get(key)
+                if subs is not None:
+                    subs.discard(subscription)
+                    if not subs:
+                        del self.subscribers[key]
+
+    def publish(self, user_id, event):
+        self.deliver(str(user_id), event)
+
+    def deliver(self, key, event):
+        with self.lock:
+            subs = list(self.subscribers.get(key, ()))
+        for subscription in subs:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                pass  # цикл событий соединения уже закрыт — подписка снимется при выходе из subscribe
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Пересылка через Redis pub/sub: publish отправляет событие в канал пользователя, фоновый поток процесса
+    слушает все каналы и раздаёт события своим подписчикам (в том числе опубликованные этим же процессом).
+    """
+
+    cross_process = True
+
+    def __init__(self, url):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('NOTIFICATION_BROKER_URL задан, но пакет redis не установлен')
+        self.client = redis.Redis.from_url(url)
+        self.listener = None
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        self.ensure_listener()
+        async with super().subscribe(user_id) as subscription:
+            yield subscription
+
+    def publish(self, user_id, event):
+        try:
+            self.client.publish(f'{CHANNEL_PREFIX}{user_id}', json.dumps(event, ensure_ascii=False))
+        except Exception:
+            logger.exception('Не удалось опубликовать событие уведомления в Redis')
+            self.deliver(str(user_id), event)
+
+    def ensure_listener(self):
+        with self.lock:
+            if self.listener is not None and self.listener.is_alive():
+                return
+            self.listener = threading.Thread(target=self.listen, name='notification-broker', daemon=True)
+        self.listener.start()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                for message in pubsub.listen():
+                    channel = message['channel'].decode() if isinstance(message['channel'], bytes) else message['channel']
+                    self.deliver(channel[len(CHANNEL_PREFIX):], json.loads(message['data']))
+            except Exception:
+                logger.exception('Потеряно соединение с Redis, переподключение')
+                threading.Event().wait(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = getattr(settings, 'NOTIFICATION_BROKER_URL', '')
+                _broker = RedisBroker(url) if url else InProcessBroker()
+    return _broker
+
+
+def publish_notification(notification):
+    """Событие о новом уведомлении — вызывать после коммита транзакции, в которой оно создано."""
+    get_broker().publish(notification.user_id, notification_event(notification))
+
+
+def publish_unread_changed(user_id):
+    """Счётчик непрочитанных изменился без новых уведомлений (например, «прочитать все»)."""
+    get_broker().publish(user_id, {'kind': 'unread'})
+
+
+# --- Поток SSE ---
+
+def format_sse(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, ensure_ascii=False)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _unread_count(user_id):
+    from finance.models import CustomUser
+
+    count = await CustomUser.objects.filter(pk=user_id).values_list('unread_notifications_count', flat=True).afirst()
+    return count or 0
+
+
+async def _created_after(user_id, position):
+    from finance.models import Notification
+
+    created_at, last_id = position
+    qs = (
+        Notification.objects.filter(user_id=user_id, created_at__gte=created_at)
+        .exclude(created_at=created_at, id__lte=last_id)
+        .order_by('created_at', 'id')
+    )
+    return [notification_event(n) async for n in qs[:CATCH_UP_LIMIT]]
+
+
+async def notification_events(user_id, last_event_id=None, max_seconds=None):
+    """
+    Асинхронный генератор SSE для пользователя: при подключении — пропущенные уведомления (по Last-Event-ID)
+    и счётчик, далее — новые уведомления и счётчик по мере появления, комментарий-пинг при простое.
+    Через max_seconds поток закрывается, браузер переподключается сам (через retry мс).
+    """
+    from django.utils import timezone
+
+    poll = settings.NOTIFICATION_STREAM_POLL_SECONDS
+    if max_seconds is None:
+        max_seconds = settings.NOTIFICATION_STREAM_MAX_SECONDS
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_seconds
+    broker = get_broker()
+    position = parse_position(last_event_id) if last_event_id else None
+    catch_up = position is not None
+    if position is None:
+        position = (timezone.now(), uuid.UUID(int=0))
+
+    yield f'retry: {int(poll * 1000)}\n\n'
+    # Подписка до чтения из БД: уведомление, созданное между ними, придёт из очереди (повтор отсекается по позиции)
+    async with broker.subscribe(user_id) as subscription:
+        pending = await _created_after(user_id, position) if catch_up else []
+        while True:
+            for event in pending:
+                event_pos = parse_position(event['id'])
+                if event_pos <= position:
+                    continue
+                position = event_pos
+                yield format_sse('notification', event, event['id'])
+            # unread несёт текущую позицию: и поток без уведомлений (разовый ответ под WSGI) при переподключении
+            # досылает всё, что появилось после него
+            yield format_sse('unread', {'count': await _unread_count(user_id)}, event_position(*position))
+
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                event = await subscription.get(min(poll, remaining))
+                if event is not None:
+                    pending = [event] if event['kind'] == 'notification' else []
+                    break
+                if not broker.cross_process:
+                    pending = await _created_after(user_id, position)
+                    if pending:
+                        break
+                yield ': ping\n\n'
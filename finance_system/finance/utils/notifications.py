@@ -0,0 +1,185 @@
+"""Лента уведомлений: рассылка событий получателям, счётчик непрочитанных, keyset-пагинация и архивация старых прочитанных."""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .notification_delivery import channel_configured
+from .notification_stream import publish_notification
+
+
+INBOX_PAGE_SIZE = 50
+NOTIFY_BATCH_SIZE = 500
+
+# Поле профиля с адресом получателя для каждого канала доставки
+CHANNEL_ADDRESS_FIELDS = {'email': 'email', 'telegram': 'telegram_id'}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def bump_unread_count(user_id, delta):
+    """Атомарно изменяет счётчик непрочитанных уведомлений пользователя на delta."""
+    from finance.models import CustomUser
+
+    if not delta:
+        return
+    qs = CustomUser.objects.filter(pk=user_id)
+    if delta < 0:
+        # Счётчик не уходит в минус даже при рассинхронизации
+        qs = qs.filter(unread_notifications_count__gte=-delta)
+    qs.update(unread_notifications_count=F('unread_notifications_count') + delta)
+
+
+def resolve_recipients(user_ids=(), family_ids=(), exclude_user_ids=()):
+    """
+    Активные получатели одним запросом: пользователи user_ids, создатели и участники семей family_ids
+    (подзапросами, без дублей), кроме exclude_user_ids. Возвращает [{'id', 'email', 'telegram_id'}].
+    """
+    from finance.models import CustomUser, Family, FamilyMember
+
+    condition = Q(pk__in=list(user_ids))
+    if family_ids:
+        family_ids = list(family_ids)
+        condition |= Q(pk__in=FamilyMember.objects.filter(family_id__in=family_ids).values('user_id'))
+        condition |= Q(pk__in=Family.objects.filter(pk__in=family_ids).values('created_by_id'))
+    return list(
+        CustomUser.objects.filter(condition, is_active=True)
+        .exclude(pk__in=list(exclude_user_ids))
+        .values('id', *CHANNEL_ADDRESS_FIELDS.values())
+    )
+
+
+def notify(notification_type, title, message, *, user_ids=(), family_ids=(), exclude_user_ids=(),
+           data=None, dedup_key=None, channels=None):
+    """
+    Рассылка уведомления о событии: получатели определяются одним запросом (resolve_recipients),
+    уведомления пишутся одним bulk_create. С dedup_key повторная рассылка того же события тем же
+    получателям пропускается (уникальный ключ user + тип + dedup_key).
+
+    bulk_create не вызывает сигналы, поэтому здесь же одним UPDATE увеличиваются счётчики непрочитанных,
+    после коммита события уходят в SSE-поток, а для внешних каналов (channels, по умолчанию —
+    NOTIFICATION_DELIVERY_CHANNELS[тип], кроме ненастроенных) создаются записи исходящей очереди
+    NotificationDelivery — их отправляет воркер доставки. Возвращает список созданных уведомлений.
+    """
+    from finance.models import CustomUser, Notification, NotificationDelivery
+
+    recipients = resolve_recipients(user_ids, family_ids, exclude_user_ids)
+    if not recipients:
+        return []
+    if channels is None:
+        channels = getattr(settings, 'NOTIFICATION_DELIVERY_CHANNELS', {}).get(notification_type, ())
+    # Ненастроенный канал (нет TELEGRAM_BOT_TOKEN) воркер не отправляет — записи в очереди висели бы до архивации
+    channels = [channel for channel in channels if channel_configured(channel)]
+    notifications = [
+        Notification(user_id=r['id'], notification_type=notification_type, title=title, message=message,
+                     data=data or {}, dedup_key=dedup_key)
+        for r in recipients
+    ]
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications, batch_size=NOTIFY_BATCH_SIZE, ignore_conflicts=dedup_key is not None)
+        if dedup_key is not None:
+            # Уведомления, уже созданные прошлой рассылкой, пропущены — дальше только вставленные
+            inserted = set(Notification.objects.filter(pk__in=[n.pk for n in notifications]).values_list('pk', flat=True))
+            notifications = [n for n in notifications if n.pk in inserted]
+        if not notifications:
+            return []
+        CustomUser.objects.filter(pk__in=[n.user_id for n in notifications]).update(
+            unread_notifications_count=F('unread_notifications_count') + 1
+        )
+        addresses = {r['id']: r for r in recipients}
+        deliveries = [
+            NotificationDelivery(notification=n, channel=channel, address=address)
+            for n in notifications
+            for channel in channels
+            if (address := addresses[n.user_id].get(CHANNEL_ADDRESS_FIELDS[channel]))
+        ]
+        NotificationDelivery.objects.bulk_create(deliveries, batch_size=NOTIFY_BATCH_SIZE)
+        created = list(notifications)
+        transaction.on_commit(lambda: [publish_notification(n) for n in created])
+    return created
+
+
+def recount_unread(user_ids=None):
+    """Пересчитывает счётчик непрочитанных одним UPDATE с подзапросом. Возвращает число обновлённых строк."""
+    from finance.models import CustomUser, Notification
+
+    unread = Notification.objects.filter(
+        user_id=OuterRef('pk'), is_read=False
+    ).order_by().values('user_id').annotate(c=Count('id')).values('c')
+    users = CustomUser.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    return users.update(unread_notifications_count=Coalesce(Subquery(unread), Value(0)))
+
+
+def encode_cursor(notification):
+    """Курсор позиции в ленте: «прочитано.микросекунды.id»."""
+    micros = (notification.created_at - _EPOCH) // timedelta(microseconds=1)
+    return f"{int(notification.is_read)}.{micros}.{notification.id.hex}"
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор; возвращает (is_read, created_at, id) или None для некорректного значения."""
+    try:
+        is_read, micros, hex_id = cursor.split('.')
+        return bool(int(is_read)), _EPOCH + timedelta(microseconds=int(micros)), uuid.UUID(hex=hex_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def inbox_page(user, cursor=None, limit=INBOX_PAGE_SIZE):
+    """
+    Страница ленты уведомлений (непрочитанные первыми, затем новые).
+    Вместо OFFSET используется позиция последней показанной записи, поэтому
+    глубокие страницы читаются по индексу (user, is_read, -created_at) так же быстро, как первая.
+    Возвращает (список уведомлений, курсор следующей страницы или None).
+    """
+    from finance.models import Notification
+
+    qs = Notification.objects.filter(user=user).order_by('is_read', '-created_at', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        is_read, created_at, last_id = position
+        qs = qs.filter(
+            Q(is_read__gt=is_read)
+            | Q(is_read=is_read, created_at__lt=created_at)
+            | Q(is_read=is_read, created_at=created_at, id__lt=last_id)
+        )
+    items = list(qs[:limit + 1])
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+
+def archive_read_notifications(days, batch_size=1000, dry_run=False):
+    """
+    Переносит прочитанные уведомления старше days дней в NotificationArchive пачками по batch_size.
+    Каждая пачка — отдельная транзакция (копирование + удаление), таблица уведомлений не блокируется надолго.
+    Возвращает количество перенесённых записей.
+    """
+    from finance.models import Notification, NotificationArchive
+
+    cutoff = timezone.now() - timedelta(days=days)
+    old_read = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+    if dry_run:
+        return old_read.count()
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(old_read.order_by('created_at').values(
+                'id', 'user_id', 'notification_type', 'title', 'message', 'created_at', 'read_at'
+            )[:batch_size])
+            if not batch:
+                break
+            NotificationArchive.objects.bulk_create(
+                [NotificationArchive(**row) for row in batch], ignore_conflicts=True
+            )
+            Notification.objects.filter(id__in=[row['id'] for row in batch]).delete()
+        moved += len(batch)
+        if len(batch) < batch_size:
+            break
+    return moved
@@ -0,0 +1,61 @@
+"""
+Фильтры по периодам: даты и месяцы из форм превращаются в полуоткрытые границы [начало, конец)
+в виде datetime с часовым поясом (локальное время, settings.TIME_ZONE).
+
+Фильтр вида field__gte=начало, field__lt=конец сравнивает сам столбец и использует индексы (user, date) и т.п.
+Фильтры field__date__gte/__lte оборачивают столбец в приведение к дате (в SQLite — django_datetime_cast_date(),
+в PostgreSQL — AT TIME ZONE ...::date), и индекс по столбцу не используется.
+"""
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def day_start(day):
+    """Начало дня day (00:00 локального времени) как aware datetime."""
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def parse_month(value):
+    """«YYYY-MM» → первое число месяца; некорректное или пустое значение — None."""
+    value = (value or '').strip()
+    try:
+        return date(int(value[:4]), int(value[5:7]), 1)
+    except (ValueError, IndexError):
+        return None
+
+
+def next_month(month):
+    """Первое число следующего месяца."""
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def date_range_bounds(start_date=None, end_date=None):
+    """Даты «с» и «по» включительно → (начало первого дня, начало дня после последнего). Пустая граница — None."""
+    start = day_start(start_date) if start_date else None
+    end = day_start(end_date + timedelta(days=1)) if end_date else None
+    return start, end
+
+
+def month_range_bounds(month_from=None, month_to=None):
+    """Месяцы «с» и «по» включительно (date или «YYYY-MM») → (начало первого месяца, начало месяца после последнего)."""
+    if isinstance(month_from, str):
+        month_from = parse_month(month_from)
+    if isinstance(month_to, str):
+        month_to = parse_month(month_to)
+    start = day_start(month_from.replace(day=1)) if month_from else None
+    end = day_start(next_month(month_to.replace(day=1))) if month_to else None
+    return start, end
+
+
+def period_q(field, start=None, end=None):
+    """Q(field >= start) & Q(field < end); пустые границы пропускаются."""
+    q = Q()
+    if start is not None:
+        q &= Q(**{f'{field}__gte': start})
+    if end is not None:
+        q &= Q(**{f'{field}__lt': end})
+    return q
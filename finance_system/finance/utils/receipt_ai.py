@@ -5,49 +5,97 @@ AI/ML-анализ чека: автоматическое определение
 3) правила по ключевым словам.
 
 Для OpenAI: добавьте в .env строку OPENAI_API_KEY=sk-...
+Для ASGI-представлений — analyze_receipt_async (асинхронный клиент OpenAI, поток не блокируется).
 """
 import json
 import os
 import re
 from django.conf import settings
 
+from .metrics import ML_PREDICT_SECONDS, ML_TRAIN_SECONDS
+
+
+OPENAI_MODEL = 'gpt-4o-mini'
+OPENAI_TIMEOUT = 20
+
+
+def _openai_key():
+    return os.environ.get('OPENAI_API_KEY') or getattr(settings, 'OPENAI_API_KEY', None)
+
+
+def _openai_prompt(raw_text):
+    return f"""Из текста чека извлеки:
+1. Название магазина/продавца (кратко, без ООО/ИП если можно)
+2. Категорию расхода на русском: Еда, Продукты, Кафе и рестораны, Здоровье, Транспорт, Такси, Развлечения, Одежда и обувь, Коммунальные услуги, Связь, Образование, Товары для дома, Прочее
+
+Текст чека:
+{raw_text[:2000]}
+
+Ответ строго в формате JSON: {{"merchant": "название", "category": "категория"}}
+"""
+
+
+def _openai_request(raw_text):
+    return {
+        'model': OPENAI_MODEL,
+        'messages': [{'role': 'user', 'content': _openai_prompt(raw_text)}],
+        'temperature': 0.1,
+        'max_tokens': 150,
+    }
+
+
+def _parse_openai_response(response):
+    text = response.choices[0].message.content.strip()
+    # Убираем markdown-блоки если есть
+    if text.startswith('```'):
+        text = re.sub(r'^```\w*\n?', '', text)
+        text = re.sub(r'\n?```$', '', text)
+    obj = json.loads(text)
+    merchant = (obj.get('merchant') or '').strip()[:100]
+    category = (obj.get('category') or '').strip()
+    return merchant if merchant else None, category if category else None
+
 
 def _call_openai(raw_text, amount=None):
     """
     Вызов OpenAI для извлечения магазина и категории из текста чека.
     Возвращает (merchant, category_name) или (None, None).
     """
-    api_key = os.environ.get('OPENAI_API_KEY') or getattr(settings, 'OPENAI_API_KEY', None)
+    api_key = _openai_key()
     if not api_key or not raw_text or len(raw_text.strip()) < 10:
         return None, None
 
     try:
         import openai
-        client = openai.OpenAI(api_key=api_key)
-        prompt = f"""Из текста чека извлеки:
-1. Название магазина/продавца (кратко, без ООО/ИП если можно)
-2. Категорию расхода на русском: Еда, Продукты, Кафе и рестораны, Здоровье, Транспорт, Такси, Развлечения, Одежда и обувь, Коммунальные услуги, Связь, Образование, Товары для дома, Прочее
+        client = openai.OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT)
+        return _parse_openai_response(client.chat.completions.create(**_openai_request(raw_text)))
+    except Exception:
+        return None, None
 
-Текст чека:
-{raw_text[:2000]}
 
-Ответ строго в формате JSON: {{"merchant": "название", "category": "категория"}}
-"""
-        response = client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[{'role': 'user', 'content': prompt}],
-            temperature=0.1,
-            max_tokens=150,
-        )
-        text = response.choices[0].message.content.strip()
-        # Убираем markdown-блоки если есть
-        if text.startswith('```'):
-            text = re.sub(r'^```\w*\n?', '', text)
-            text = re.sub(r'\n?```$', '', text)
-        obj = json.loads(text)
-        merchant = (obj.get('merchant') or '').strip()[:100]
-        category = (obj.get('category') or '').strip()
-        return merchant if merchant else None, category if category else None
+_async_clients = {}
+
+
+def _async_openai_client(api_key):
+    """Асинхронный клиент OpenAI на текущий цикл событий: соединения переиспользуются между запросами."""
+    import asyncio
+    import openai
+    key = (id(asyncio.get_running_loop()), api_key)
+    client = _async_clients.get(key)
+    if client is None:
+        _async_clients.clear()  # клиент прежнего цикла событий (после перезапуска цикла) больше не нужен
+        client = _async_clients[key] = openai.AsyncOpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT)
+    return client
+
+
+async def _call_openai_async(raw_text, amount=None):
+    """То же, что _call_openai, но без блокировки потока: HTTP-запрос ожидается в цикле событий."""
+    api_key = _openai_key()
+    if not api_key or not raw_text or len(raw_text.strip()) < 10:
+        return None, None
+    try:
+        client = _async_openai_client(api_key)
+        return _parse_openai_response(await client.chat.completions.create(**_openai_request(raw_text)))
     except Exception:
         return None, None
 
@@ -91,7 +139,8 @@ def _get_ml_categorizer(user):
             ('tfidf', TfidfVectorizer(max_features=500, ngram_range=(1, 2))),
             ('clf', MultinomialNB())
         ])
-        pipe.fit(X, y)
+        with ML_TRAIN_SECONDS.time():
+            pipe.fit(X, y)
         return pipe
     except Exception:
         return None
@@ -103,7 +152,8 @@ def _predict_ml(text, user):
     if pipe is None or not text or len(text.strip()) < 3:
         return None
     try:
-        pred = pipe.predict([text[:500]])[0]
+        with ML_PREDICT_SECONDS.time():
+            pred = pipe.predict([text[:500]])[0]
         return pred
     except Exception:
         return None
@@ -131,6 +181,24 @@ def _keyword_category(text):
     return None
 
 
+CATEGORY_ALIASES = {
+    'путешествия': 'Развлечения', 'путешествие': 'Развлечения', 'туризм': 'Развлечения',
+    'отдых': 'Развлечения', 'продукты питания': 'Продукты', 'продукты': 'Еда',
+    'кафе': 'Кафе и рестораны', 'ресторан': 'Кафе и рестораны', 'еда': 'Еда',
+    'транспорт': 'Транспорт', 'здоровье': 'Здоровье', 'медицина': 'Здоровье',
+    'коммунальные': 'Коммунальные услуги', 'жкх': 'Коммунальные услуги',
+    'такси': 'Такси', 'одежда': 'Одежда и обувь', 'обувь': 'Одежда и обувь',
+    'связь': 'Связь', 'образование': 'Образование', 'дом': 'Товары для дома',
+}
+
+
+def _normalize_category(category):
+    """Приводит категорию к одному из стандартных названий."""
+    if not category:
+        return category
+    return CATEGORY_ALIASES.get(category.lower().strip()) or category
+
+
 def analyze_receipt(raw_text, merchant_from_ocr, amount, user):
     """
     Анализ текста чека с помощью AI/ML.
@@ -155,18 +223,28 @@ def analyze_receipt(raw_text, merchant_from_ocr, amount, user):
     if not category:
         category = _keyword_category(combined)
 
-    # Приводим категорию к одному из стандартных названий
-    if category:
-        aliases = {
-            'путешествия': 'Развлечения', 'путешествие': 'Развлечения', 'туризм': 'Развлечения',
-            'отдых': 'Развлечения', 'продукты питания': 'Продукты', 'продукты': 'Еда',
-            'кафе': 'Кафе и рестораны', 'ресторан': 'Кафе и рестораны', 'еда': 'Еда',
-            'транспорт': 'Транспорт', 'здоровье': 'Здоровье', 'медицина': 'Здоровье',
-            'коммунальные': 'Коммунальные услуги', 'жкх': 'Коммунальные услуги',
-            'такси': 'Такси', 'одежда': 'Одежда и обувь', 'обувь': 'Одежда и обувь',
-            'связь': 'Связь', 'образование': 'Образование', 'дом': 'Товары для дома',
-        }
-        cat_lower = category.lower().strip()
-        category = aliases.get(cat_lower) or category
-
-    return merchant, category
+    return merchant, _normalize_category(category)
+
+
+async def analyze_receipt_async(raw_text, merchant_from_ocr, amount, user):
+    """
+    Асинхронный analyze_receipt для ASGI: запрос к OpenAI ожидается в цикле событий,
+    ML-модель (обучение по транзакциям пользователя — запросы к БД) выполняется в потоке.
+    """
+    from asgiref.sync import sync_to_async
+
+    merchant = merchant_from_ocr or ''
+    category = None
+    combined = f"{merchant} {raw_text}"[:1000] if raw_text else merchant
+
+    ai_merchant, ai_category = await _call_openai_async(raw_text or combined, amount)
+    if ai_merchant:
+        merchant = ai_merchant
+    if ai_category:
+        category = ai_category
+    if not category and user and combined.strip():
+        category = await sync_to_async(_predict_ml)(combined, user)
+    if not category:
+        category = _keyword_category(combined)
+
+    return merchant, _normalize_category(category)
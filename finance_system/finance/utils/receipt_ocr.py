@@ -1,8 +1,17 @@
 # receipt_ocr.py — извлечение данных из фото чека (QR + OCR)
+import asyncio
+import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote
 from io import BytesIO
 
+from django.conf import settings
+
+from .metrics import RECEIPT_OCR_PASS_SECONDS, RECEIPT_QR
+
 
 def _parse_qr_text(text):
     """Парсит данные из QR-кода российского чека (t=, s=, fn=, nn= и др.)."""
@@ -84,7 +93,9 @@ def extract_receipt_data(image_file):
     if hasattr(img_bytes, 'seek'):
         img_bytes.seek(0)
 
-    qr_data = _extract_from_qr(img_bytes)
+    with RECEIPT_OCR_PASS_SECONDS.time(stage='qr'):
+        qr_data = _extract_from_qr(img_bytes)
+    RECEIPT_QR.inc(result='hit' if qr_data.get('amount') else 'miss')
     if qr_data.get('amount'):
         result['amount'] = qr_data['amount']
     if qr_data.get('date'):
@@ -107,6 +118,7 @@ def extract_receipt_data(image_file):
     except ImportError:
         return result
 
+    ocr_started = time.perf_counter()
     try:
         img = Image.open(img_bytes)
         if img.mode not in ('L', 'RGB'):
@@ -130,6 +142,7 @@ def extract_receipt_data(image_file):
                 break
     except Exception:
         raw_text = ''
+    RECEIPT_OCR_PASS_SECONDS.observe(time.perf_counter() - ocr_started, stage='tesseract')
 
     result['raw_text'] = raw_text
 
@@ -228,3 +241,28 @@ def extract_receipt_data(image_file):
             break
 
     return result
+
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def ocr_pool():
+    """
+    Пул распознавания чеков. Tesseract работает в отдельном процессе, поток пула лишь ждёт его, поэтому
+    достаточно потоков; размер пула (RECEIPT_OCR_WORKERS) ограничивает число одновременных процессов
+    Tesseract — остальные чеки ждут в очереди, не занимая воркер сервера.
+    """
+    global _ocr_pool
+    if _ocr_pool is None:
+        with _ocr_pool_lock:
+            if _ocr_pool is None:
+                workers = getattr(settings, 'RECEIPT_OCR_WORKERS', None) or os.cpu_count() or 2
+                _ocr_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='receipt-ocr')
+    return _ocr_pool
+
+
+async def extract_receipt_data_async(image_bytes):
+    """extract_receipt_data в пуле распознавания: для async-представлений (ASGI), цикл событий не блокируется."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ocr_pool(), extract_receipt_data, BytesIO(image_bytes))
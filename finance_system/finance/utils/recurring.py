@@ -0,0 +1,178 @@
+"""
+Планировщик повторяющихся транзакций.
+
+Повторяющаяся транзакция (is_recurring=True) — шаблон: recurring_rule задаёт период (daily, weekly, biweekly,
+monthly, quarterly, yearly), next_occurrence — момент следующего повтора. Планировщик пачками выбирает
+наступившие шаблоны по частичному индексу tx_recurring_due_idx, создаёт вхождения одним bulk_create и
+сдвигает next_occurrence одним bulk_update.
+
+Повторный или параллельный запуск безопасен: в PostgreSQL шаблоны пачки блокируются (SKIP LOCKED — другой
+процесс берёт следующие), а уникальный ключ (recurring_source, date) не даёт создать вхождение дважды
+ни в какой БД. bulk_create не вызывает сигналы, поэтому балансы, бюджеты, свёртка расходов и версии кэша
+обновляются здесь — агрегированно: один UPDATE с CASE на таблицу (счета, периоды бюджетов, свёртка) и один
+set_many для версий кэша на всю пачку.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .balances import ZERO, apply_balance_deltas, transaction_effects
+from .budgets import apply_created_transactions
+from .cache import bump_data_versions
+from .rollups import apply_rollup_created
+
+
+RECURRENCE_RULES = {
+    'daily': ('days', 1),
+    'weekly': ('days', 7),
+    'biweekly': ('days', 14),
+    'monthly': ('months', 1),
+    'quarterly': ('months', 3),
+    'yearly': ('months', 12),
+}
+
+RECURRING_BATCH_SIZE = 1000
+# Сколько пропущенных повторов одного шаблона догоняется за один проход (остальные — в следующих пачках)
+MAX_CATCH_UP = 100
+
+COPIED_FIELDS = ('amount', 'currency', 'type', 'description', 'category_id', 'account_id', 'transfer_to_account_id',
+                 'user_id', 'family_id', 'location', 'merchant', 'mcc_code', 'tags')
+TEMPLATE_FIELDS = ('id', 'date', 'recurring_rule', 'next_occurrence', 'is_recurring') + tuple(
+    field[:-3] if field.endswith('_id') else field for field in COPIED_FIELDS
+)
+
+
+def normalize_rule(rule):
+    rule = (rule or '').strip().lower()
+    return rule if rule in RECURRENCE_RULES else None
+
+
+def advance(moment, rule, anchor_day=None):
+    """
+    Следующий повтор после moment. Месячные правила держатся за день месяца anchor_day
+    (31-е → 30 апреля → 31 мая), сдвиг считается в локальном времени.
+    """
+    unit, step = RECURRENCE_RULES[rule]
+    local = timezone.localtime(moment)
+    if unit == 'days':
+        return local + timedelta(days=step)
+    month_index = local.month - 1 + step
+    year, month = local.year + month_index // 12, month_index % 12 + 1
+    day = min(anchor_day or local.day, calendar.monthrange(year, month)[1])
+    return local.replace(year=year, month=month, day=day)
+
+
+def _occurrence(template, moment):
+    from finance.models import Transaction
+
+    return Transaction(
+        **{field: getattr(template, field) for field in COPIED_FIELDS},
+        date=moment, recurring_source_id=template.id, created_via='recurring',
+    )
+
+
+def _due_templates(now, batch_size):
+    from finance.models import Transaction
+
+    return (
+        Transaction.objects.filter(is_recurring=True, next_occurrence__lte=now)
+        .order_by('next_occurrence')
+        .only(*TEMPLATE_FIELDS)
+        .select_for_update(skip_locked=True)[:batch_size]
+    )
+
+
+def schedule_new_templates(batch_size=RECURRING_BATCH_SIZE):
+    """Проставляет next_occurrence повторяющимся транзакциям, у которых его ещё нет (первый повтор — через период от date)."""
+    from finance.models import Transaction
+
+    scheduled = 0
+    while True:
+        templates = list(
+            Transaction.objects.filter(is_recurring=True, next_occurrence__isnull=True)
+            .only('id', 'date', 'recurring_rule', 'next_occurrence', 'is_recurring')[:batch_size]
+        )
+        if not templates:
+            return scheduled
+        for template in templates:
+            rule = normalize_rule(template.recurring_rule)
+            if rule:
+                template.next_occurrence = advance(template.date, rule, timezone.localtime(template.date).day)
+            else:
+                # Неизвестное правило — транзакция перестаёт считаться повторяющейся
+                template.is_recurring = False
+        Transaction.objects.bulk_update(templates, ['next_occurrence', 'is_recurring'])
+        scheduled += len(templates)
+
+
+def process_batch(now=None, batch_size=RECURRING_BATCH_SIZE):
+    """
+    Обрабатывает одну пачку наступивших шаблонов в одной транзакции БД.
+    Возвращает (число обработанных шаблонов, число созданных вхождений).
+    """
+    from finance.models import Transaction
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        templates = list(_due_templates(now, batch_size))
+        if not templates:
+            return 0, 0
+        occurrences = []
+        for template in templates:
+            rule = normalize_rule(template.recurring_rule)
+            if rule is None:
+                template.is_recurring = False
+                continue
+            anchor_day = timezone.localtime(template.date).day
+            moment = template.next_occurrence
+            for _ in range(MAX_CATCH_UP):
+                if moment > now:
+                    break
+                occurrences.append(_occurrence(template, moment))
+                moment = advance(moment, rule, anchor_day)
+            template.next_occurrence = moment
+
+        Transaction.objects.bulk_create(occurrences, batch_size=batch_size, ignore_conflicts=True)
+        Transaction.objects.bulk_update(templates, ['next_occurrence', 'is_recurring'], batch_size=batch_size)
+        # Вхождения, которые уже создал параллельный запуск, пропущены — побочные эффекты только для вставленных
+        inserted_ids = set()
+        for i in range(0, len(occurrences), batch_size):
+            chunk = [tx.pk for tx in occurrences[i:i + batch_size]]
+            inserted_ids.update(Transaction.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+        created = [tx for tx in occurrences if tx.pk in inserted_ids]
+        apply_created_side_effects(created)
+    return len(templates), len(created)
+
+
+def apply_created_side_effects(transactions):
+    """То, что для одиночной записи делают сигналы post_save: балансы, бюджеты, свёртка расходов, версии кэша."""
+    if not transactions:
+        return
+    balance_deltas = {}
+    for tx in transactions:
+        for account_id, delta in transaction_effects(tx).items():
+            balance_deltas[account_id] = balance_deltas.get(account_id, ZERO) + delta
+    apply_balance_deltas(balance_deltas)
+    apply_created_transactions(transactions)
+    apply_rollup_created(transactions)
+    bump_data_versions(
+        [('user', tx.user_id) for tx in transactions if tx.user_id]
+        + [('family', tx.family_id) for tx in transactions if tx.family_id]
+    )
+
+
+def process_due(now=None, batch_size=RECURRING_BATCH_SIZE, max_batches=None):
+    """Обрабатывает все наступившие повторы пачками. Возвращает (шаблонов, вхождений)."""
+    now = now or timezone.now()
+    schedule_new_templates(batch_size)
+    total_templates = total_created = batches = 0
+    while max_batches is None or batches < max_batches:
+        templates, created = process_batch(now, batch_size)
+        if not templates:
+            break
+        total_templates += templates
+        total_created += created
+        batches += 1
+    return total_templates, total_created
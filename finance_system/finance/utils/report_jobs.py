@@ -0,0 +1,242 @@
+"""
+Асинхронные задания на отчёты и дисковый кэш готовых файлов.
+
+Файл отчёта кэшируется по ключу (пользователь, период, формат, версия данных). Версия данных —
+отпечаток транзакций периода (количество, сумма, последнее изменение транзакций и их категорий и счетов),
+поэтому повторная выгрузка того же периода без изменений — это отправка готового файла, а не повторный рендер.
+Кэш ограничен по размеру (REPORTS_CACHE_MAX_BYTES), вытесняются давно не скачанные файлы (LRU по mtime).
+
+Задания выполняет пул потоков в процессе веб-сервера (REPORT_JOBS_INLINE_WORKER) и/или
+отдельный воркер: python manage.py run_report_jobs --loop
+"""
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .periods import date_range_bounds, period_q
+
+
+_executor = None
+_executor_lock = Lock()
+
+
+def cache_dir():
+    path = Path(getattr(settings, 'REPORTS_CACHE_DIR', settings.BASE_DIR / 'report_cache'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def report_bounds(start_date, end_date):
+    """Границы периода отчёта [начало первого дня, начало дня после последнего) в локальном времени."""
+    return date_range_bounds(start_date, end_date)
+
+
+def report_data_version(user, start_date, end_date):
+    """
+    Отпечаток транзакций периода — меняется при добавлении, изменении или удалении операций,
+    а также при переименовании их категорий и счетов (названия попадают в отчёт).
+    """
+    from finance.models import Transaction
+
+    start, end = report_bounds(start_date, end_date)
+    agg = Transaction.objects.filter(period_q('date', start, end), user=user).aggregate(
+        count=Count('id'), total=Sum('amount'), changed=Max('updated_at'),
+        category_changed=Max('category__updated_at'), account_changed=Max('account__updated_at'),
+    )
+    stamps = [agg[name].isoformat() if agg[name] else '' for name in ('changed', 'category_changed', 'account_changed')]
+    raw = '|'.join([str(agg['count']), str(agg['total'])] + stamps)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def report_cache_key(user_id, start_date, end_date, fmt, data_version):
+    raw = f'{user_id}|{start_date}|{end_date}|{fmt}|{data_version}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cached_report_path(job):
+    """Путь к готовому файлу задания или None, если файл вытеснен из кэша. Обращение обновляет LRU-метку."""
+    if not job.cache_key:
+        return None
+    path = cache_dir() / f'{job.cache_key}.{job.format}'
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def request_report(user, fmt, start_date, end_date):
+    """
+    Возвращает задание на отчёт. Если такой файл уже есть в кэше или такое задание уже в работе —
+    возвращается существующее задание, новый рендер не запускается.
+    """
+    from finance.models import ReportJob
+
+    fail_stale_jobs(user=user)
+    data_version = report_data_version(user, start_date, end_date)
+    key = report_cache_key(user.pk, start_date, end_date, fmt, data_version)
+    existing = ReportJob.objects.filter(
+        user=user, cache_key=key, status__in=['pending', 'running', 'done']
+    ).order_by('-created_at').first()
+    if existing and (existing.status != 'done' or cached_report_path(existing)):
+        return existing
+    job = ReportJob.objects.create(
+        user=user, format=fmt, start_date=start_date, end_date=end_date,
+        data_version=data_version, cache_key=key,
+    )
+    schedule_report_job(job)
+    return job
+
+
+def requeue_report_job(job):
+    """Повторно ставит задание в очередь (например, файл вытеснен из кэша)."""
+    from finance.models import ReportJob
+
+    ReportJob.objects.filter(pk=job.pk).update(
+        status='pending', error='', started_at=None, heartbeat_at=None, finished_at=None
+    )
+    job.status = 'pending'
+    schedule_report_job(job)
+
+
+def schedule_report_job(job):
+    """Отдаёт задание пулу потоков после коммита транзакции (если встроенный воркер включён)."""
+    if not getattr(settings, 'REPORT_JOBS_INLINE_WORKER', True):
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'REPORT_JOBS_WORKERS', 2),
+                thread_name_prefix='report-jobs',
+            )
+        return _executor
+
+
+def _run_in_thread(job_id):
+    try:
+        run_report_job(job_id)
+    finally:
+        connection.close()
+
+
+def run_report_job(job_id):
+    """Выполняет задание: рендерит файл во временный файл и атомарно кладёт его в кэш. Возвращает True, если выполнено."""
+    from finance.models import ReportJob
+    from finance.reports import write_excel_report, write_pdf_report
+
+    # Захват задания: из pending в running переводит только один воркер
+    now = timezone.now()
+    if not ReportJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=now, heartbeat_at=now):
+        return False
+    job = ReportJob.objects.select_related('user').get(pk=job_id)
+    writer = write_pdf_report if job.format == 'pdf' else write_excel_report
+    target = cache_dir() / f'{job.cache_key}.{job.format}'
+    try:
+        if not target.exists():
+            fd, tmp_name = tempfile.mkstemp(dir=cache_dir(), suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    writer(tmp, job.user, job.start_date, job.end_date, progress=_Heartbeat(job_id))
+                os.replace(tmp_name, target)
+            except Exception:
+                os.unlink(tmp_name)
+                raise
+        job.status = 'done'
+        job.error = ''
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)[:500]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    evict_reports()
+    return job.status == 'done'
+
+
+class _Heartbeat:
+    """
+    Продлевает heartbeat_at выполняемого задания. Писатель отчёта вызывает его на каждой строке,
+    запрос в БД уходит не чаще раза в REPORT_JOBS_HEARTBEAT_SECONDS.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.interval = getattr(settings, 'REPORT_JOBS_HEARTBEAT_SECONDS', 30)
+        self.last = time.monotonic()
+
+    def __call__(self):
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return
+        from finance.models import ReportJob
+
+        self.last = now
+        ReportJob.objects.filter(pk=self.job_id, status='running').update(heartbeat_at=timezone.now())
+
+
+def fail_stale_jobs(user=None):
+    """
+    Задания в running, чей heartbeat_at не продлевался дольше REPORT_JOBS_STALE_SECONDS, — процесс воркера
+    упал во время рендера: отмечаются failed, чтобы повторный заказ отчёта создал новое задание,
+    а скачивание — перезапустило это. Долгий рендер живого воркера продлевает heartbeat и не считается зависшим.
+    Возвращает число отмеченных.
+    """
+    from finance.models import ReportJob
+
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_JOBS_STALE_SECONDS', 300))
+    # Задания, захваченные до появления heartbeat_at, проверяются по started_at
+    stale = ReportJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff), status='running'
+    )
+    if user is not None:
+        stale = stale.filter(user=user)
+    return stale.update(status='failed', error='Формирование прервано: воркер не завершил задание', finished_at=timezone.now())
+
+
+def process_pending_jobs(limit=None):
+    """Выполняет задания из очереди (старые первыми). Возвращает число выполненных."""
+    from finance.models import ReportJob
+
+    fail_stale_jobs()
+    ids = ReportJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+    if limit:
+        ids = ids[:limit]
+    return sum(1 for job_id in list(ids) if run_report_job(job_id))
+
+
+def evict_reports(max_bytes=None):
+    """Удаляет давно не использованные файлы, пока кэш больше max_bytes. Возвращает число удалённых."""
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'REPORTS_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    files = []
+    total = 0
+    for entry in os.scandir(cache_dir()):
+        if entry.is_file() and not entry.name.endswith('.part'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,174 @@
+"""
+Свёртка расходов MonthlyCategorySpend: сумма и число расходных операций по (пользователь, семья, категория, месяц).
+
+Поддерживается инкрементально при записи транзакций (сигналы в finance/signals.py) — один UPDATE ... SET
+amount = amount + delta на затронутую строку. Графики и фильтры по месяцам на дашборде читают несколько строк
+свёртки вместо сканирования таблицы транзакций. Полная перестройка: python manage.py rebuild_category_rollup
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .bulk import increment_many
+
+
+def _month_of(value):
+    if isinstance(value, datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        value = timezone.localdate(value)
+    return value.replace(day=1)
+
+
+def rollup_contributions(tx):
+    """Вклад транзакции в свёртку: {(user_id, family_id, category_id, month): (сумма, количество)}."""
+    if tx is None or tx.type != 'expense' or not tx.user_id or tx.amount is None:
+        return {}
+    amount = Decimal(str(tx.amount)).quantize(Decimal('0.01'))
+    return {(tx.user_id, tx.family_id, tx.category_id, _month_of(tx.date)): (amount, 1)}
+
+
+def apply_rollup_change(old, new):
+    """Переносит изменение транзакции в свёртку. old — прежнее состояние (None при создании), new — новое (None при удалении)."""
+    deltas = dict(rollup_contributions(new))
+    for key, (amount, count) in rollup_contributions(old).items():
+        cur_amount, cur_count = deltas.get(key, (Decimal('0'), 0))
+        deltas[key] = (cur_amount - amount, cur_count - count)
+    for key, (amount, count) in deltas.items():
+        if amount or count:
+            _apply_row_delta(key, amount, count)
+
+
+def apply_rollup_created(transactions):
+    """
+    Учитывает в свёртке пакет новых транзакций (после bulk_create, минуя сигналы): недостающие строки
+    создаются одним bulk_create с нулями, затем все затронутые строки — одним UPDATE с CASE.
+    """
+    from finance.models import MonthlyCategorySpend
+
+    deltas = {}
+    for tx in transactions:
+        for key, (amount, count) in rollup_contributions(tx).items():
+            cur_amount, cur_count = deltas.get(key, (Decimal('0'), 0))
+            deltas[key] = (cur_amount + amount, cur_count + count)
+    if not deltas:
+        return
+    rows = _rollup_row_ids(deltas)
+    missing = [key for key in deltas if key not in rows]
+    if missing:
+        # Строку могла создать параллельная транзакция — конфликт пропускается, прибавка ниже всё равно через F()
+        MonthlyCategorySpend.objects.bulk_create([
+            MonthlyCategorySpend(user_id=user_id, family_id=family_id, category_id=category_id, month=month)
+            for user_id, family_id, category_id, month in missing
+        ], ignore_conflicts=True)
+        rows.update(_rollup_row_ids(missing))
+    increment_many(MonthlyCategorySpend, {
+        rows[key]: {'amount': amount, 'count': count} for key, (amount, count) in deltas.items()
+    })
+
+
+def _rollup_row_ids(keys):
+    """{(user_id, family_id, category_id, month): pk} для существующих строк свёртки (один запрос)."""
+    from finance.models import MonthlyCategorySpend
+
+    keys = set(keys)
+    candidates = MonthlyCategorySpend.objects.filter(
+        user_id__in={key[0] for key in keys}, month__in={key[3] for key in keys}
+    ).values_list('pk', 'user_id', 'family_id', 'category_id', 'month')
+    return {tuple(key): pk for pk, *key in candidates if tuple(key) in keys}
+
+
+def _apply_row_delta(key, amount, count):
+    from finance.models import MonthlyCategorySpend
+
+    user_id, family_id, category_id, month = key
+    rows = MonthlyCategorySpend.objects.filter(
+        user_id=user_id, family_id=family_id, category_id=category_id, month=month
+    )
+    if rows.update(amount=F('amount') + amount, count=F('count') + count):
+        if count < 0:
+            rows.filter(count__lte=0).delete()
+        return
+    if count < 0:
+        # Строки нет — её уже удалили вместе с семьёй или категорией, вычитать не из чего
+        return
+    try:
+        with transaction.atomic():
+            MonthlyCategorySpend.objects.create(
+                user_id=user_id, family_id=family_id, category_id=category_id, month=month,
+                amount=amount, count=count,
+            )
+    except IntegrityError:
+        # Строку создала параллельная транзакция
+        rows.update(amount=F('amount') + amount, count=F('count') + count)
+
+
+def fold_category_rollup(category_id):
+    """
+    Перед удалением категории переносит её строки свёртки в строки «без категории»: транзакции категории
+    остаются (SET_NULL — это UPDATE без сигналов), и их расходы должны остаться в свёртке.
+    """
+    from finance.models import MonthlyCategorySpend
+
+    rows = MonthlyCategorySpend.objects.filter(category_id=category_id)
+    for row in list(rows.values('user_id', 'family_id', 'month', 'amount', 'count')):
+        _apply_row_delta((row['user_id'], row['family_id'], None, row['month']), row['amount'], row['count'])
+    rows.delete()
+
+
+def fold_family_rollup(family_id):
+    """
+    Перед удалением семьи: транзакции на семейных счетах удаляются каскадом (их сигналы сами вычитают расходы),
+    остальные транзакции семьи остаются с family=NULL без сигналов — их расходы переносятся в строки без семьи
+    одним GROUP BY, а строки свёртки семьи удаляются.
+    """
+    from finance.models import MonthlyCategorySpend, Transaction
+
+    surviving = (
+        Transaction.objects.filter(family_id=family_id, type='expense').exclude(account__family_id=family_id)
+        .order_by().annotate(month=TruncMonth('date'))
+        .values('user_id', 'category_id', 'month').annotate(total=Sum('amount'), n=Count('id'))
+    )
+    for row in surviving:
+        month = row['month'].date() if isinstance(row['month'], datetime) else row['month']
+        _apply_row_delta((row['user_id'], None, row['category_id'], month), row['total'], row['n'])
+    MonthlyCategorySpend.objects.filter(family_id=family_id).delete()
+
+
+def rebuild_category_rollup(user_ids=None, batch_size=2000):
+    """Перестраивает свёртку по транзакциям одним GROUP BY (всю или для указанных пользователей). Возвращает число строк."""
+    from finance.models import MonthlyCategorySpend, Transaction
+
+    source = Transaction.objects.filter(type='expense')
+    target = MonthlyCategorySpend.objects.all()
+    if user_ids is not None:
+        source = source.filter(user_id__in=user_ids)
+        target = target.filter(user_id__in=user_ids)
+    grouped = (
+        source.order_by()
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'family_id', 'category_id', 'month')
+        .annotate(total=Sum('amount'), n=Count('id'))
+    )
+    created = 0
+    with transaction.atomic():
+        target.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            month = row['month'].date() if isinstance(row['month'], datetime) else row['month']
+            batch.append(MonthlyCategorySpend(
+                user_id=row['user_id'], family_id=row['family_id'], category_id=row['category_id'],
+                month=month, amount=row['total'], count=row['n'],
+            ))
+            if len(batch) >= batch_size:
+                MonthlyCategorySpend.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            MonthlyCategorySpend.objects.bulk_create(batch)
+            created += len(batch)
+    return created
@@ -0,0 +1,218 @@
+"""
+Полнотекстовый поиск транзакций по магазину, описанию и тегам.
+
+PostgreSQL: GIN-индекс по выражению tsvector (конфигурация 'simple', веса: магазин A, теги B, описание C)
+и GIN-индекс jsonb_path_ops по тегам для точного фильтра tags @> '["тег"]'. Ранжирование — ts_rank.
+SQLite: contentless-таблица FTS5 finance_transaction_fts (rowid = rowid транзакции), которую поддерживают
+триггеры на finance_transaction; ранжирование — bm25. Теги индексируются раскодированными из JSON.
+
+Запрос «пятёр кофе #еда» означает: слова по префиксу (все должны встретиться) и точный тег «еда».
+Буква «ё» приравнивается к «е» и в индексе, и в запросе.
+"""
+import re
+
+
+SEARCH_MAX_RESULTS = 100
+
+FTS_TABLE = 'finance_transaction_fts'
+
+_TERM_RE = re.compile(r'\w+')
+_TAG_RE = re.compile(r'#([\w-]+)')
+
+
+def _fold(text):
+    return text.lower().replace('ё', 'е')
+
+
+def parse_search_query(text, tags=()):
+    """Разбирает строку поиска: (слова для префиксного поиска, точные теги). Теги пишутся как #тег или передаются отдельно."""
+    text = text or ''
+    found_tags = [tag.strip() for tag in list(tags) + _TAG_RE.findall(text) if tag and tag.strip()]
+    terms = [_fold(term) for term in _TERM_RE.findall(_TAG_RE.sub(' ', text))]
+    return terms[:10], list(dict.fromkeys(found_tags))[:5]
+
+
+# --- Индексы --------------------------------------------------------------------------------------------
+
+def _pg_vector_sql(table=None):
+    """Выражение tsvector; без table — в виде для CREATE INDEX, с table — с явной квалификацией столбцов."""
+    col = (lambda name: f'"{table}"."{name}"') if table else (lambda name: name)
+
+    def part(expr, weight):
+        return f"setweight(to_tsvector('simple'::regconfig, translate(COALESCE({expr}, ''), 'ёЁ', 'еЕ')), '{weight}')"
+
+    return ' || '.join([
+        part(col('merchant'), 'A'),
+        part(f"{col('tags')}::text", 'B'),
+        part(col('description'), 'C'),
+    ])
+
+
+def _sqlite_fold_sql(expr):
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _sqlite_row_values(alias):
+    return ', '.join([
+        f'{alias}.rowid',
+        _sqlite_fold_sql(f'{alias}.merchant'),
+        _sqlite_fold_sql(f'{alias}.description'),
+        _sqlite_fold_sql(f"(SELECT group_concat(value, ' ') FROM json_each({alias}.tags))"),
+    ])
+
+
+_SQLITE_TRIGGERS = {
+    'finance_transaction_fts_ai': (
+        f'AFTER INSERT ON finance_transaction BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, merchant, description, tags) VALUES ({_sqlite_row_values("new")}); END'
+    ),
+    'finance_transaction_fts_ad': (
+        f'AFTER DELETE ON finance_transaction BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, merchant, description, tags) VALUES ('delete', {_sqlite_row_values('old')}); END"
+    ),
+    'finance_transaction_fts_au': (
+        f'AFTER UPDATE OF merchant, description, tags ON finance_transaction BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, merchant, description, tags) VALUES ('delete', {_sqlite_row_values('old')}); "
+        f'INSERT INTO {FTS_TABLE}(rowid, merchant, description, tags) VALUES ({_sqlite_row_values("new")}); END'
+    ),
+}
+
+
+def _sqlite_triggers_missing(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'finance_transaction'"
+    )
+    return set(_SQLITE_TRIGGERS) - {row[0] for row in cursor.fetchall()}
+
+
+def install_search_index(connection, rebuild=False):
+    """
+    Создаёт поисковые индексы, если их нет (идемпотентно). В SQLite при отсутствии триггеров
+    (например, после пересоздания таблицы миграцией) FTS-таблица заполняется заново.
+    Возвращает True, если индекс был (пере)построен.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS tx_search_gin_idx ON finance_transaction USING gin (({_pg_vector_sql()}))'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS tx_tags_gin_idx ON finance_transaction USING gin (tags jsonb_path_ops)'
+            )
+            return False
+        if connection.vendor != 'sqlite':
+            return False
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"merchant, description, tags, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        missing = _sqlite_triggers_missing(cursor)
+        if not missing and not rebuild:
+            return False
+        for name in _SQLITE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, merchant, description, tags) '
+            f'SELECT {_sqlite_row_values("t")} FROM finance_transaction t'
+        )
+        for name, body in _SQLITE_TRIGGERS.items():
+            cursor.execute(f'CREATE TRIGGER {name} {body}')
+        return True
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS tx_search_gin_idx')
+            cursor.execute('DROP INDEX IF EXISTS tx_tags_gin_idx')
+        elif connection.vendor == 'sqlite':
+            for name in _SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+# --- Запросы --------------------------------------------------------------------------------------------
+
+def _pg_tsquery(terms):
+    return ' & '.join(f"'{term}':*" for term in terms)
+
+
+def _fts_match(terms, tags):
+    parts = [f'"{term}"*' for term in terms]
+    parts += ['tags : "{}"'.format(_fold(tag).replace('"', '""')) for tag in tags]
+    return ' AND '.join(parts)
+
+
+def search_condition(terms, tags):
+    """
+    Условие «транзакция найдена» для .filter(): по индексу поиска, без сканирования таблицы.
+    Возвращает список выражений/Q (пустой, если искать нечего).
+    """
+    from django.db import connection
+    from django.db.models import BooleanField, Q
+    from django.db.models.expressions import RawSQL
+
+    conditions = []
+    if connection.vendor == 'postgresql':
+        if terms:
+            conditions.append(RawSQL(
+                f"({_pg_vector_sql('finance_transaction')}) @@ to_tsquery('simple', %s)",
+                [_pg_tsquery(terms)], output_field=BooleanField(),
+            ))
+        for tag in tags:
+            conditions.append(Q(tags__contains=[tag]))
+    elif connection.vendor == 'sqlite':
+        if terms or tags:
+            conditions.append(RawSQL(
+                f'"finance_transaction".rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+                [_fts_match(terms, tags)], output_field=BooleanField(),
+            ))
+        for tag in tags:
+            # FTS находит тег по словам; точное совпадение элемента списка проверяем по JSON
+            conditions.append(RawSQL(
+                'EXISTS (SELECT 1 FROM json_each("finance_transaction"."tags") WHERE value = %s)',
+                [tag], output_field=BooleanField(),
+            ))
+    else:
+        for term in terms:
+            conditions.append(Q(merchant__icontains=term) | Q(description__icontains=term))
+    return conditions
+
+
+def _rank_expression(terms, tags):
+    from django.db import connection
+    from django.db.models import FloatField, Value
+    from django.db.models.expressions import RawSQL
+
+    if not terms and not tags:
+        return Value(0.0, output_field=FloatField())
+    if connection.vendor == 'postgresql':
+        if not terms:
+            return Value(0.0, output_field=FloatField())
+        return RawSQL(
+            f"ts_rank({_pg_vector_sql('finance_transaction')}, to_tsquery('simple', %s))",
+            [_pg_tsquery(terms)], output_field=FloatField(),
+        )
+    if connection.vendor == 'sqlite':
+        # bm25 отрицательный: чем меньше, тем релевантнее; знак меняем, чтобы сортировать по убыванию, как в PostgreSQL
+        return RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, 2.0, 1.0, 1.5) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = "finance_transaction".rowid)',
+            [_fts_match(terms, tags)], output_field=FloatField(),
+        )
+    return Value(0.0, output_field=FloatField())
+
+
+def search_transactions(user, text, tags=(), limit=SEARCH_MAX_RESULTS, queryset=None):
+    """Транзакции пользователя, найденные по строке поиска, — самые релевантные первыми, при равенстве — новые."""
+    from finance.models import Transaction
+
+    terms, tags = parse_search_query(text, tags)
+    if not terms and not tags:
+        return []
+    qs = Transaction.objects.filter(user=user) if queryset is None else queryset
+    qs = qs.filter(*search_condition(terms, tags)).annotate(search_rank=_rank_expression(terms, tags))
+    limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+    return list(qs.order_by('-search_rank', '-date', '-id')[:limit])
+
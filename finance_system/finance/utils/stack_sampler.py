@@ -0,0 +1,114 @@
+"""
+Статистический профайлер стека для отдельных запросов.
+
+Фоновый поток раз в STACK_PROFILING_INTERVAL_MS снимает стек потока, обрабатывающего запрос
+(sys._current_frames), и считает одинаковые стеки. Результат сохраняется в «свёрнутом» формате
+(collapsed stacks: «кадр;кадр;кадр число» в строке) — его читают flamegraph.pl, speedscope и inferno.
+
+Файлы лежат в STACK_PROFILES_DIR/<маршрут>/, для каждого маршрута хранятся последние STACK_PROFILES_KEEP.
+Профилируется только поток запроса, поэтому для асинхронных представлений под ASGI картина неполная.
+"""
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+
+PROFILE_SUFFIX = '.collapsed'
+_SAFE_NAME = re.compile(r'^[\w.-]+$')
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+def collapse(frame):
+    """Стек от корня к вершине в одну строку: «модуль:функция;модуль:функция»."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler(threading.Thread):
+    """Снимает стек потока thread_id каждые interval секунд, пока не вызван stop()."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[collapse(frame)] += 1
+            del frame
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+def profiles_dir():
+    return Path(settings.STACK_PROFILES_DIR)
+
+
+def safe_route(route):
+    return re.sub(r'[^\w.-]', '_', route or 'unresolved')
+
+
+def save_profile(route, stacks, duration_ms):
+    """Пишет профиль маршрута и удаляет старые сверх STACK_PROFILES_KEEP. Возвращает путь файла."""
+    directory = profiles_dir() / safe_route(route)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{round(duration_ms)}ms-{uuid.uuid4().hex[:6]}{PROFILE_SUFFIX}"
+    path = directory / name
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    tmp.replace(path)
+
+    files = sorted(directory.glob(f'*{PROFILE_SUFFIX}'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[settings.STACK_PROFILES_KEEP:]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def list_profiles():
+    """Сохранённые профили, новые первыми: [{'route', 'name', 'size', 'modified'}]."""
+    root = profiles_dir()
+    if not root.is_dir():
+        return []
+    profiles = []
+    for path in root.glob(f'*/*{PROFILE_SUFFIX}'):
+        stat = path.stat()
+        profiles.append({
+            'route': path.parent.name,
+            'name': path.name,
+            'size': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.get_current_timezone()),
+        })
+    profiles.sort(key=lambda p: p['modified'], reverse=True)
+    return profiles
+
+
+def profile_path(route, name):
+    """Путь к профилю по имени маршрута и файла или None (имена проверяются — выйти за каталог нельзя)."""
+    if not (_SAFE_NAME.match(route) and _SAFE_NAME.match(name) and name.endswith(PROFILE_SUFFIX)):
+        return None
+    path = profiles_dir() / route / name
+    return path if path.is_file() else None
@@ -0,0 +1,141 @@
+"""
+Лента транзакций с keyset-пагинацией по (date, created_at, id) и фильтрами.
+
+Следующая страница выбирается условием «строго после последней показанной записи», а не OFFSET,
+поэтому сотая страница читается по индексу (user, -date, -created_at) так же быстро, как первая.
+Из БД забираются только столбцы, которые показывает лента (only()).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+import uuid
+
+from django.db.models import Q
+
+
+FEED_PAGE_SIZE = 50
+FEED_MAX_PAGE_SIZE = 200
+
+FEED_FIELDS = (
+    'id', 'date', 'created_at', 'amount', 'currency', 'type', 'merchant', 'description', 'tags',
+    'category__name', 'category__color', 'account__name',
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _micros(value):
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def encode_feed_cursor(tx):
+    """Курсор позиции в ленте: «date_мкс.created_at_мкс.id»."""
+    return f'{_micros(tx.date)}.{_micros(tx.created_at)}.{tx.id.hex}'
+
+
+def decode_feed_cursor(cursor):
+    """Разбирает курсор; возвращает (date, created_at, id) или None для некорректного значения."""
+    try:
+        date_us, created_us, hex_id = cursor.split('.')
+        return (
+            _EPOCH + timedelta(microseconds=int(date_us)),
+            _EPOCH + timedelta(microseconds=int(created_us)),
+            uuid.UUID(hex=hex_id),
+        )
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def _parse_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_amount(value):
+    try:
+        return Decimal(str(value).replace(',', '.').replace(' ', '')) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def parse_feed_filters(params):
+    """
+    Фильтры ленты из GET-параметров: category, account, type, merchant, amount_min, amount_max,
+    q (полнотекстовый поиск, см. finance.utils.search) и tag. Некорректные значения игнорируются.
+    """
+    from finance.models import Transaction
+
+    filters = {
+        'category': _parse_uuid(params.get('category')),
+        'account': _parse_uuid(params.get('account')),
+        'type': params.get('type') if params.get('type') in dict(Transaction.TRANSACTION_TYPES) else None,
+        'merchant': (params.get('merchant') or '').strip()[:200] or None,
+        'amount_min': _parse_amount(params.get('amount_min')),
+        'amount_max': _parse_amount(params.get('amount_max')),
+        'q': (params.get('q') or '').strip()[:200] or None,
+        'tag': (params.get('tag') or '').strip()[:100] or None,
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def transactions_page(user, filters=None, cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    Страница ленты транзакций пользователя (новые первыми).
+    Возвращает (список транзакций, курсор следующей страницы или None).
+    """
+    from finance.models import Transaction
+
+    filters = filters or {}
+    qs = (
+        Transaction.objects.filter(user=user)
+        .select_related('category', 'account')
+        .only(*FEED_FIELDS)
+        .order_by('-date', '-created_at', '-id')
+    )
+    if 'category' in filters:
+        qs = qs.filter(category_id=filters['category'])
+    if 'account' in filters:
+        qs = qs.filter(account_id=filters['account'])
+    if 'type' in filters:
+        qs = qs.filter(type=filters['type'])
+    if 'merchant' in filters:
+        qs = qs.filter(merchant__icontains=filters['merchant'])
+    if 'amount_min' in filters:
+        qs = qs.filter(amount__gte=filters['amount_min'])
+    if 'amount_max' in filters:
+        qs = qs.filter(amount__lte=filters['amount_max'])
+    if 'q' in filters or 'tag' in filters:
+        from finance.utils.search import parse_search_query, search_condition
+        terms, tags = parse_search_query(filters.get('q'), [filters['tag']] if 'tag' in filters else ())
+        qs = qs.filter(*search_condition(terms, tags))
+
+    position = decode_feed_cursor(cursor) if cursor else None
+    if position:
+        date, created_at, last_id = position
+        # date__lte отдельным условием — чтобы БД начала чтение индекса сразу с позиции курсора
+        qs = qs.filter(date__lte=date).filter(
+            Q(date__lt=date)
+            | Q(date=date, created_at__lt=created_at)
+            | Q(date=date, created_at=created_at, id__lt=last_id)
+        )
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+    items = list(qs[:limit + 1])
+    next_cursor = encode_feed_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+
+def feed_item_payload(tx):
+    """Транзакция ленты в виде JSON-совместимого словаря."""
+    return {
+        'id': str(tx.id),
+        'date': tx.date.isoformat(),
+        'amount': str(tx.amount),
+        'currency': tx.currency,
+        'type': tx.type,
+        'category': {'name': tx.category.name, 'color': tx.category.color} if tx.category_id else None,
+        'account': tx.account.name if tx.account_id else None,
+        'merchant': tx.merchant,
+        'description': tx.description,
+        'tags': tx.tags or [],
+    }
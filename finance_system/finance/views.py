@@ -10,12 +10,18 @@ from django.utils import timezone
 from datetime import date, timedelta
 import calendar
 import json
+import time
 
+from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, FinancialGoalForm, CategoryForm, ProfileUpdateForm
 from .models import Category, Transaction, FinancialGoal, GoalContribution, Account, Family, FamilyMember, Notification, FamilyInvitation, CustomUser
+from .utils.cache import cache_anonymous_page
+from .utils.metrics import IMPORT_ROWS, IMPORT_ROWS_PER_SECOND, IMPORT_SECONDS
+from .utils.notifications import notify
 
 
+@cache_anonymous_page
 def index(request):
     """Главная страница - редирект для авторизованных"""
     if request.user.is_authenticated:
@@ -23,16 +29,19 @@ def index(request):
     return render(request, 'finance/index.html')
 
 
+@cache_anonymous_page
 def features(request):
     """Страница возможностей"""
     return render(request, 'finance/features.html')
 
 
+@cache_anonymous_page
 def pricing(request):
     """Страница тарифов"""
     return render(request, 'finance/pricing.html')
 
 
+@cache_anonymous_page
 def contact(request):
     """Страница контактов"""
     return render(request, 'finance/contact.html')
@@ -169,35 +178,119 @@ def site_admin_panel(request):
     })
 
 
+def _months_between(first, last):
+    """Месяцы для фильтра графика: (YYYY-MM, «Месяц ГГГГ») от first до last; без данных — последние 12 месяцев."""
+    from django.utils import formats
+    months = []
+    if first and last:
+        cur = date(first.year, first.month, 1)
+        end = date(last.year, last.month, 1)
+        while cur <= end:
+            months.append((cur.strftime('%Y-%m'), formats.date_format(cur, 'F Y')))
+            if cur.month == 12:
+                cur = date(cur.year + 1, 1, 1)
+            else:
+                cur = date(cur.year, cur.month + 1, 1)
+    else:
+        today = timezone.now().date()
+        for i in range(11, -1, -1):
+            y, m = today.year, today.month - i
+            while m <= 0:
+                m += 12
+                y -= 1
+            d = date(y, m, 1)
+            months.append((d.strftime('%Y-%m'), formats.date_format(d, 'F Y')))
+    return months
+
+
+def _dashboard_overview_stats(user, family_ids):
+    """Статистика вкладки «Обзор»: цели, общие расходы, число транзакций, месяцы для фильтра графика.
+    Расходы и месяцы берутся из свёртки MonthlyCategorySpend (finance/utils/rollups.py)."""
+    from django.db.models import Count, Min, Max
+    goal_stats = FinancialGoal.objects.filter(
+        Q(user=user) | Q(family_id__in=family_ids)
+    ).aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(status='active')),
+        current=Sum('current_amount'),
+        target=Sum('target_amount'),
+    )
+    from .models import MonthlyCategorySpend
+    spend_stats = MonthlyCategorySpend.objects.filter(user=user).aggregate(
+        expenses=Sum('amount'),
+        first_month=Min('month'),
+        last_month=Max('month'),
+    )
+    return {
+        'total_goals': goal_stats['total'],
+        'active_goals': goal_stats['active'],
+        'total_current_amount': float(goal_stats['current'] or 0),
+        'total_target_amount': float(goal_stats['target'] or 0),
+        'total_expenses': float(spend_stats['expenses'] or 0),
+        'transaction_count': Transaction.objects.filter(user=user).count(),
+        'chart_available_months': _months_between(spend_stats['first_month'], spend_stats['last_month']),
+    }
+
+
+def _parse_chart_month(value):
+    """Разбор фильтра графика «YYYY-MM»: (месяц, первый день, последний день); некорректное значение — ('', None, None)."""
+    from finance.utils.periods import next_month, parse_month
+    month = parse_month(value)
+    if month is None:
+        return '', None, None
+    return (value or '').strip(), month, next_month(month) - timedelta(days=1)
+
+
+def _dashboard_expense_chart(user, start_d=None, end_d=None):
+    """Расходы по категориям для круговой диаграммы: {название: {amount, count, color, percentage}}.
+    Читает свёртку MonthlyCategorySpend — несколько строк на месяц вместо всех транзакций."""
+    from django.db.models import Max
+    from .models import MonthlyCategorySpend
+    spends = MonthlyCategorySpend.objects.filter(user=user, category__isnull=False)
+    if start_d and end_d:
+        spends = spends.filter(month__gte=start_d.replace(day=1), month__lte=end_d)
+    rows = spends.values('category__name').annotate(
+        amount=Sum('amount'),
+        count=Sum('count'),
+        color=Max('category__color'),
+        last=Max('month'),
+    ).order_by('-last', '-amount')
+    category_stats = {}
+    for row in rows:
+        category_stats[row['category__name']] = {
+            'amount': float(row['amount']),
+            'count': row['count'],
+            'color': row['color'],
+        }
+    expense_chart_total = sum(cat['amount'] for cat in category_stats.values())
+    for cat in category_stats.values():
+        if expense_chart_total > 0:
+            cat['percentage'] = (cat['amount'] / expense_chart_total) * 100
+        else:
+            cat['percentage'] = 0
+    return category_stats, expense_chart_total
+
+
 @login_required
 def dashboard(request):
     """Панель управления со всеми вкладками"""
+    from finance.utils.cache import GLOBAL, cached_widget
     try:
         from finance.utils.goal_reminders import create_replenishment_reminders
         create_replenishment_reminders()
     except Exception:
         pass
     user_goals = FinancialGoal.objects.filter(user=request.user)
-    user_families_ids = Family.objects.filter(
+    user_families_ids = list(Family.objects.filter(
         Q(created_by=request.user) | Q(members__user=request.user)
-    ).values_list('id', flat=True)
-    family_goals = FinancialGoal.objects.filter(family_id__in=user_families_ids)
-    transactions = Transaction.objects.filter(user=request.user).order_by('-date', '-created_at')
+    ).values_list('id', flat=True).distinct())
+    # Вкладка «Транзакции»: первая страница ленты, следующие подгружаются через transactions_feed по курсору
+    from finance.utils.transaction_feed import parse_feed_filters, transactions_page
+    transaction_filters = parse_feed_filters(request.GET)
+    transactions, transactions_next_cursor = transactions_page(request.user, transaction_filters)
 
     # Фильтр по месяцам для графика расходов по категориям
-    chart_month = request.GET.get('chart_month', '').strip()
-    expense_transactions = transactions.filter(type='expense')
-    if chart_month:
-        try:
-            y, m = int(chart_month[:4]), int(chart_month[5:7])
-            start_d = date(y, m, 1)
-            _, last_day = calendar.monthrange(y, m)
-            end_d = date(y, m, last_day)
-            expense_transactions = expense_transactions.filter(
-                date__date__gte=start_d, date__date__lte=end_d
-            )
-        except (ValueError, IndexError):
-            chart_month = ''
+    chart_month, start_d, end_d = _parse_chart_month(request.GET.get('chart_month', ''))
     categories = Category.objects.filter(
         Q(owner=request.user) | Q(is_system=True),
         type='expense'
@@ -210,72 +303,18 @@ def dashboard(request):
         _sort=Case(*order_cases, default=Value(100), output_field=IntegerField())
     ).order_by('_sort', 'name')
 
-    # Статистика для вкладки Обзор
-    total_goals = user_goals.count() + family_goals.count()
-    active_goals = user_goals.filter(status='active').count() + family_goals.filter(status='active').count()
-
-    total_current_amount = sum([float(g.current_amount) for g in user_goals]) + sum([float(g.current_amount) for g in family_goals])
-    total_target_amount = sum([float(g.target_amount) for g in user_goals]) + sum([float(g.target_amount) for g in family_goals])
-
-    # Статистика расходов
-    category_stats = {}
-    total_expenses = 0
-    transaction_count = transactions.count()
-    expense_chart_total = 0
-
-    for transaction in expense_transactions:
-        if transaction.category:
-            cat_name = transaction.category.name
-            if cat_name not in category_stats:
-                category_stats[cat_name] = {
-                    'amount': 0,
-                    'count': 0,
-                    'color': transaction.category.color
-                }
-            category_stats[cat_name]['amount'] += float(transaction.amount)
-            category_stats[cat_name]['count'] += 1
-            total_expenses += float(transaction.amount)
-            expense_chart_total += float(transaction.amount)
-
-    expense_chart_total = sum(cat['amount'] for cat in category_stats.values())
-    for cat in category_stats.values():
-        if expense_chart_total > 0:
-            cat['percentage'] = (cat['amount'] / expense_chart_total) * 100
-        else:
-            cat['percentage'] = 0
-
-    # Общие расходы для вкладки Обзор (все время)
-    total_expenses = sum(float(t.amount) for t in transactions.filter(type='expense'))
-
-    # Доступные месяцы для фильтра графика (из транзакций пользователя)
-    from django.db.models import Min, Max
-    from django.utils import formats
-    agg = Transaction.objects.filter(user=request.user, type='expense').aggregate(
-        first=Min('date'), last=Max('date'))
-    chart_available_months = []
-    if agg['first'] and agg['last']:
-        cur = agg['first'].date().replace(day=1)
-        end = agg['last'].date().replace(day=1)
-        while cur <= end:
-            chart_available_months.append((cur.strftime('%Y-%m'), formats.date_format(cur, 'F Y')))
-            if cur.month == 12:
-                cur = date(cur.year + 1, 1, 1)
-            else:
-                cur = date(cur.year, cur.month + 1, 1)
-    else:
-        today = timezone.now().date()
-        for i in range(11, -1, -1):
-            y, m = today.year, today.month - i
-            while m <= 0:
-                m += 12
-                y -= 1
-            d = date(y, m, 1)
-            chart_available_months.append((d.strftime('%Y-%m'), formats.date_format(d, 'F Y')))
-
-    # График расходов по категориям (круговая диаграмма)
-    expense_chart_labels = list(category_stats.keys())
-    expense_chart_data = [float(cat['amount']) for cat in category_stats.values()]
-    expense_chart_colors = [cat.get('color') or '#4361ee' for cat in category_stats.values()]
+    # Виджеты «Обзор» и статистика расходов кэшируются по версиям данных пользователя и его семей;
+    # сама диаграмма загружается из dashboard_chart_data (JSON с ETag)
+    user_scopes = [('user', request.user.pk), GLOBAL]
+    overview = cached_widget(
+        'dashboard_overview', user_scopes + [('family', fid) for fid in user_families_ids],
+        lambda: _dashboard_overview_stats(request.user, user_families_ids),
+    )
+    category_stats, expense_chart_total = cached_widget(
+        'dashboard_expense_chart', user_scopes,
+        lambda: _dashboard_expense_chart(request.user, start_d, end_d),
+        chart_month,
+    )
 
     user_families = Family.objects.filter(
         Q(created_by=request.user) | Q(members__user=request.user)
@@ -288,31 +327,63 @@ def dashboard(request):
 
     context = {
         'goals': user_goals,
-        'transactions': transactions[:50],
+        'transactions': transactions,
+        'transactions_next_cursor': transactions_next_cursor,
+        'transaction_filters': transaction_filters,
         'categories': categories,
         'user_families': user_families,
         'user_accounts': user_accounts,
-        'total_goals': total_goals,
-        'active_goals': active_goals,
-        'total_current_amount': total_current_amount,
-        'total_target_amount': total_target_amount,
-        'total_expenses': total_expenses,
-        'transaction_count': transaction_count,
+        'total_goals': overview['total_goals'],
+        'active_goals': overview['active_goals'],
+        'total_current_amount': overview['total_current_amount'],
+        'total_target_amount': overview['total_target_amount'],
+        'total_expenses': overview['total_expenses'],
+        'transaction_count': overview['transaction_count'],
         'category_count': categories.count(),
         'system_category_count': categories.filter(is_system=True).count(),
         'category_stats': category_stats,
-        'expense_chart_labels': json.dumps(expense_chart_labels),
-        'expense_chart_data': json.dumps(expense_chart_data),
-        'expense_chart_colors': json.dumps(expense_chart_colors),
         'expense_chart_total': expense_chart_total,
         'chart_month': chart_month,
-        'chart_available_months': chart_available_months,
+        'chart_available_months': overview['chart_available_months'],
         'active_tab': request.GET.get('tab', 'overview'),
     }
 
     return render(request, 'finance/dashboard.html', context)
 
 
+def _json_with_etag(request, etag, build_payload):
+    """JSON-ответ с ETag: при совпадении If-None-Match — 304 без вычисления данных."""
+    from django.utils.cache import get_conditional_response, patch_cache_control
+    response = get_conditional_response(request, etag=etag) or JsonResponse(build_payload())
+    response['ETag'] = etag  # и у 304: клиент обновляет сохранённый валидатор (RFC 9110, 15.4.5)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+def dashboard_chart_data(request):
+    """Данные круговой диаграммы расходов (JSON). ETag — по версии данных пользователя."""
+    from finance.utils.cache import GLOBAL, cached_widget, versions_etag
+    chart_month, start_d, end_d = _parse_chart_month(request.GET.get('chart_month', ''))
+    user_scopes = [('user', request.user.pk), GLOBAL]
+
+    def build_payload():
+        category_stats, expense_chart_total = cached_widget(
+            'dashboard_expense_chart', user_scopes,
+            lambda: _dashboard_expense_chart(request.user, start_d, end_d),
+            chart_month,
+        )
+        return {
+            'chart_month': chart_month,
+            'labels': list(category_stats.keys()),
+            'data': [cat['amount'] for cat in category_stats.values()],
+            'colors': [cat.get('color') or '#4361ee' for cat in category_stats.values()],
+            'total': expense_chart_total,
+        }
+
+    return _json_with_etag(request, versions_etag(user_scopes, 'dashboard_chart', chart_month), build_payload)
+
+
 @login_required
 def categories_redirect(request):
     """Страница категорий - редирект на dashboard"""
@@ -325,6 +396,46 @@ def transactions_redirect(request):
     return redirect(reverse('dashboard') + '?tab=transactions')
 
 
+@login_required
+def transactions_feed(request):
+    """
+    JSON-лента транзакций пользователя: ?after=<курсор>&limit=N и фильтры
+    category, account, type, merchant, amount_min, amount_max.
+    """
+    from finance.utils.transaction_feed import (
+        FEED_PAGE_SIZE, feed_item_payload, parse_feed_filters, transactions_page,
+    )
+    try:
+        limit = int(request.GET.get('limit', FEED_PAGE_SIZE))
+    except ValueError:
+        limit = FEED_PAGE_SIZE
+    cursor = request.GET.get('after', '').strip()
+    items, next_cursor = transactions_page(request.user, parse_feed_filters(request.GET), cursor or None, limit)
+    return JsonResponse({
+        'results': [feed_item_payload(tx) for tx in items],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def transactions_search(request):
+    """Поиск транзакций по магазину, описанию и тегам (?q=пятёр #еда&tag=...): JSON, самые релевантные первыми."""
+    from finance.utils.search import SEARCH_MAX_RESULTS, search_transactions
+    from finance.utils.transaction_feed import FEED_FIELDS, feed_item_payload
+    try:
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        limit = 20
+    queryset = Transaction.objects.filter(user=request.user).select_related('category', 'account').only(*FEED_FIELDS)
+    tag = request.GET.get('tag', '').strip()
+    found = search_transactions(
+        request.user, request.GET.get('q', '')[:200], [tag] if tag else (), min(limit, SEARCH_MAX_RESULTS), queryset,
+    )
+    return JsonResponse({
+        'results': [dict(feed_item_payload(tx), rank=round(tx.search_rank or 0.0, 6)) for tx in found],
+    })
+
+
 @login_required
 def goals_redirect(request):
     """Страница целей - редирект на dashboard"""
@@ -384,6 +495,73 @@ def upload_receipt_redirect(request):
     return redirect('dashboard')
 
 
+async def _receipt_category(user, name):
+    """Категория расхода пользователя (или системная) с названием name, если есть."""
+    if not name:
+        return None
+    return await Category.objects.filter(
+        Q(owner=user) | Q(is_system=True), type='expense', name__iexact=name,
+    ).only('id', 'name').afirst()
+
+
+@login_required
+async def scan_receipt_api(request):
+    """
+    Распознавание фото чека (JSON, асинхронно): OCR выполняется в пуле распознавания, запрос к OpenAI —
+    через асинхронный клиент. Под ASGI воркер не занят, пока чек распознаётся.
+    """
+    from .utils.receipt_ai import analyze_receipt_async
+    from .utils.receipt_ocr import extract_receipt_data_async
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Нужен POST'}, status=405)
+    upload = request.FILES.get('receipt')
+    if not upload:
+        return JsonResponse({'success': False, 'error': 'Прикрепите фото чека'}, status=400)
+    if upload.size > settings.RECEIPT_MAX_UPLOAD_BYTES:
+        return JsonResponse({'success': False, 'error': 'Файл слишком большой'}, status=400)
+    if not (upload.content_type or '').startswith('image/'):
+        return JsonResponse({'success': False, 'error': 'Нужно изображение'}, status=400)
+    user = await request.auser()
+    data = await extract_receipt_data_async(upload.read())
+    merchant, category_name = await analyze_receipt_async(data['raw_text'], data['merchant'], data['amount'], user)
+    category_name = category_name or data.get('suggested_category')
+    category = await _receipt_category(user, category_name)
+    return JsonResponse({
+        'success': True,
+        'amount': data['amount'],
+        'date': data.get('date'),
+        'merchant': merchant or '',
+        'category': category.name if category else category_name,
+        'category_id': str(category.id) if category else None,
+        'raw_text': data['raw_text'][:2000],
+    })
+
+
+@login_required
+async def analyze_receipt_api(request):
+    """Магазин и категория по тексту чека (JSON, асинхронно) — для уже распознанного текста."""
+    from .utils.receipt_ai import analyze_receipt_async
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Нужен POST'}, status=405)
+    raw_text = request.POST.get('raw_text', '')[:5000]
+    merchant = request.POST.get('merchant', '')[:100]
+    try:
+        amount = float(request.POST.get('amount') or 0) or None
+    except ValueError:
+        amount = None
+    if not (raw_text.strip() or merchant.strip()):
+        return JsonResponse({'success': False, 'error': 'Нет текста чека'}, status=400)
+    user = await request.auser()
+    merchant, category_name = await analyze_receipt_async(raw_text, merchant, amount, user)
+    category = await _receipt_category(user, category_name)
+    return JsonResponse({
+        'success': True,
+        'merchant': merchant or '',
+        'category': category.name if category else category_name,
+        'category_id': str(category.id) if category else None,
+    })
+
+
 def _get_or_create_default_account(user):
     """Возвращает счёт пользователя или создаёт основной счёт."""
     account = Account.objects.filter(owner=user, is_active=True).first()
@@ -473,6 +651,7 @@ def import_transactions_excel(request):
     categories_by_name = {c.name.lower().strip(): c for c in categories_qs}
     created = 0
     errors = []
+    import_started = time.perf_counter()
     wb = openpyxl.load_workbook(request.FILES['excel_file'], read_only=True, data_only=True)
     ws = wb.active
     rows = list(ws.iter_rows(min_row=2, values_only=True))
@@ -523,6 +702,12 @@ def import_transactions_excel(request):
         except Exception as e:
             errors.append(f'Строка {i}: {str(e)[:80]}')
     wb.close()
+    import_seconds = time.perf_counter() - import_started
+    IMPORT_SECONDS.observe(import_seconds)
+    IMPORT_ROWS.inc(created, result='created')
+    IMPORT_ROWS.inc(len(errors), result='error')
+    if created:
+        IMPORT_ROWS_PER_SECOND.observe(created / max(import_seconds, 1e-6))
     if created > 0:
         messages.success(request, f'Импортировано {created} транзакций')
     if errors:
@@ -747,9 +932,36 @@ def family_list(request):
 @login_required
 def notifications_list(request):
     """Список уведомлений (непрочитанные отображаются первыми и выделены)."""
-    # Непрочитанные первыми (is_read False < True, поэтому order_by('is_read') даёт unread первыми)
-    notifications = Notification.objects.filter(user=request.user).order_by('is_read', '-created_at')[:50]
-    return render(request, 'finance/notifications_list.html', {'notifications': notifications})
+    # Непрочитанные первыми (is_read False < True); страницы — по курсору ?after=, без OFFSET
+    from finance.utils.notifications import inbox_page
+    cursor = request.GET.get('after', '').strip()
+    notifications, next_cursor = inbox_page(request.user, cursor or None)
+    return render(request, 'finance/notifications_list.html', {
+        'notifications': notifications,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
+
+
+@login_required
+async def notifications_stream(request):
+    """
+    SSE-поток уведомлений и счётчика непрочитанных (finance/utils/notification_stream.py).
+    Под ASGI соединение держится NOTIFICATION_STREAM_MAX_SECONDS; под WSGI поток занимал бы воркер,
+    поэтому отдаётся только текущее состояние, и браузер переподключается через retry.
+    """
+    from django.http import StreamingHttpResponse
+    from finance.utils.notification_stream import notification_events
+    user = await request.auser()
+    last_event_id = request.headers.get('Last-Event-ID')
+    if hasattr(request, 'scope'):
+        events = notification_events(user.pk, last_event_id)
+    else:
+        events = [chunk async for chunk in notification_events(user.pk, last_event_id, max_seconds=0)]
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не буферизует поток
+    return response
 
 
 @login_required
@@ -758,10 +970,93 @@ def notifications_mark_all_read(request):
     if request.method == 'POST':
         from django.utils import timezone
         updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True, read_at=timezone.now())
+        CustomUser.objects.filter(pk=request.user.pk).update(unread_notifications_count=0)
+        from finance.utils.notification_stream import publish_unread_changed
+        publish_unread_changed(request.user.pk)
         messages.success(request, f'Отмечено прочитанными: {updated}')
     return redirect('notifications_list')
 
 
+def _parse_report_period(data):
+    """Период отчёта из формы: по умолчанию — с начала текущего месяца по сегодня."""
+    today = timezone.localdate()
+    try:
+        start_d = date.fromisoformat(data.get('start_date') or '')
+    except ValueError:
+        start_d = today.replace(day=1)
+    try:
+        end_d = date.fromisoformat(data.get('end_date') or '')
+    except ValueError:
+        end_d = today
+    return start_d, end_d
+
+
+def _report_job_payload(job):
+    return {
+        'id': str(job.id),
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'error': job.error,
+        'download_url': reverse('report_job_download', args=[job.id]) if job.status == 'done' else None,
+    }
+
+
+@login_required
+def report_jobs(request):
+    """Отчёты PDF/Excel: заказ отчёта за период и список последних заданий. Файл готовится в фоне."""
+    from .models import ReportJob
+    from finance.utils.report_jobs import request_report
+    if request.method == 'POST':
+        fmt = request.POST.get('format', 'xlsx')
+        start_d, end_d = _parse_report_period(request.POST)
+        if fmt not in dict(ReportJob.FORMAT_CHOICES):
+            messages.error(request, 'Неизвестный формат отчёта')
+        elif start_d > end_d:
+            messages.error(request, 'Дата начала позже даты окончания')
+        else:
+            job = request_report(request.user, fmt, start_d, end_d)
+            if job.status == 'done':
+                messages.success(request, 'Отчёт уже готов — данные за период не менялись.')
+            else:
+                messages.info(request, 'Отчёт формируется, страница обновится автоматически.')
+        return redirect('report_jobs')
+    start_d, end_d = _parse_report_period(request.GET)
+    jobs = ReportJob.objects.filter(user=request.user)[:20]
+    return render(request, 'finance/report_jobs.html', {
+        'jobs': jobs,
+        'start_date': start_d,
+        'end_date': end_d,
+        'has_active': any(job.status in ('pending', 'running') for job in jobs),
+    })
+
+
+@login_required
+def report_job_status(request, job_id):
+    """Статус задания на отчёт (JSON) — для опроса со страницы отчётов."""
+    from .models import ReportJob
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    return JsonResponse(_report_job_payload(job))
+
+
+@login_required
+def report_job_download(request, job_id):
+    """Скачивание готового отчёта из дискового кэша. Если файл вытеснен — задание ставится в очередь повторно."""
+    from django.http import FileResponse
+    from .models import ReportJob
+    from finance.reports import XLSX_CONTENT_TYPE
+    from finance.utils.report_jobs import cached_report_path, requeue_report_job
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    path = cached_report_path(job) if job.status == 'done' else None
+    if path is None:
+        if job.status in ('done', 'failed'):
+            requeue_report_job(job)
+        messages.info(request, 'Отчёт ещё формируется, попробуйте через несколько секунд.')
+        return redirect('report_jobs')
+    content_type = 'application/pdf' if job.format == 'pdf' else XLSX_CONTENT_TYPE
+    filename = f'financial_report_{job.start_date:%Y%m%d}_{job.end_date:%Y%m%d}.{job.format}'
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+
+
 @login_required
 def profile_edit(request):
     """Редактирование профиля"""
@@ -819,6 +1114,115 @@ def _family_avatar_url(family):
     return None
 
 
+def _family_contributions_filtered(family, chart_month_from, chart_month_to):
+    """Пополнения целей семьи с фильтром по месяцам (YYYY-MM) из GET-параметров графика."""
+    from finance.utils.periods import month_range_bounds, period_q
+    start, end = month_range_bounds(chart_month_from, chart_month_to)
+    return GoalContribution.objects.filter(period_q('contributed_at', start, end), goal__family=family)
+
+
+def _family_contribution_months(family):
+    """Список месяцев для фильтра графика пополнений семьи."""
+    from django.db.models import Min, Max
+    agg = GoalContribution.objects.filter(goal__family=family).aggregate(
+        first=Min('contributed_at'), last=Max('contributed_at'))
+    return _months_between(agg['first'], agg['last'])
+
+
+def _goal_datasets(by_goal, chart_labels):
+    """Датасеты Chart.js по целям: {goal_id: {'name', 'months': {YYYY-MM: сумма}}} → список."""
+    chart_datasets = []
+    colors = [
+        'rgba(67, 97, 238, 0.8)', 'rgba(34, 197, 94, 0.8)', 'rgba(234, 88, 12, 0.8)',
+        'rgba(168, 85, 247, 0.8)', 'rgba(14, 165, 233, 0.8)', 'rgba(225, 29, 72, 0.8)',
+    ]
+    for i, (gid, info) in enumerate(by_goal.items()):
+        data = [info['months'].get(m, 0) for m in chart_labels]
+        chart_datasets.append({
+            'label': (info['name'] or 'Цель')[:30],
+            'data': data,
+            'backgroundColor': colors[i % len(colors)],
+            'borderColor': colors[i % len(colors)].replace('0.8', '1'),
+            'borderWidth': 1,
+        })
+    return chart_datasets
+
+
+def _family_detail_chart(family, chart_month_from, chart_month_to):
+    """График пополнений по месяцам (последние 12) — отдельный датасет по каждой цели."""
+    contributions_raw = _family_contributions_filtered(family, chart_month_from, chart_month_to).annotate(
+        month=TruncMonth('contributed_at')
+    ).values('goal_id', 'goal__name', 'month').annotate(
+        total=Sum('amount')
+    ).order_by('month')
+    today = timezone.now().date()
+    chart_labels = []
+    for i in range(11, -1, -1):
+        y, m = today.year, today.month - i
+        while m <= 0:
+            m += 12
+            y -= 1
+        d = date(y, m, 1)
+        chart_labels.append(d.strftime('%Y-%m'))
+    by_goal = {}  # goal_id -> {'name': ..., 'months': {month_str: total}}
+    for row in contributions_raw:
+        month_val = row.get('month')
+        if month_val:
+            month_str = month_val.strftime('%Y-%m') if hasattr(month_val, 'strftime') else str(month_val)[:7]
+            gid = row.get('goal_id')
+            gname = row.get('goal__name') or 'Цель'
+            if gid not in by_goal:
+                by_goal[gid] = {'name': gname, 'months': {}}
+            by_goal[gid]['months'][month_str] = float(row.get('total') or 0)
+    return {
+        'chart_labels': chart_labels,
+        'chart_datasets': _goal_datasets(by_goal, chart_labels),
+        'chart_available_months': _family_contribution_months(family),
+    }
+
+
+def _family_admin_chart(family, chart_month_from, chart_month_to):
+    """График пополнений по целям — только месяцы, в которых были пополнения."""
+    contributions_raw = _family_contributions_filtered(family, chart_month_from, chart_month_to).annotate(
+        month=TruncMonth('contributed_at')
+    ).values('goal_id', 'goal__name', 'month').annotate(
+        total=Sum('amount')
+    ).order_by('month')
+    months_set = set()
+    by_goal = {}
+    for row in contributions_raw:
+        month_val = row.get('month')
+        if month_val:
+            month_str = month_val.strftime('%Y-%m') if hasattr(month_val, 'strftime') else str(month_val)[:7]
+            months_set.add(month_str)
+            gid = row.get('goal_id')
+            info = by_goal.setdefault(gid, {'name': '', 'months': {}})
+            info['name'] = row.get('goal__name') or 'Цель'
+            info['months'][month_str] = float(row.get('total') or 0)
+    chart_labels = sorted(months_set) if months_set else []
+    return {
+        'chart_labels': chart_labels,
+        'chart_datasets': _goal_datasets(by_goal, chart_labels),
+        'chart_available_months': _family_contribution_months(family),
+    }
+
+
+def _family_contributions_by_user(family):
+    """Сумма пополнений каждого пользователя по каждой семейной цели: {goal_id: [(имя, сумма), ...]}."""
+    rows = GoalContribution.objects.filter(goal__family=family).values(
+        'goal_id', 'user_id', 'user__username', 'user__first_name', 'user__last_name'
+    ).annotate(total=Sum('amount')).order_by('goal_id', 'user_id')
+    goal_contributions_by_user = {}
+    for row in rows:
+        if row['user_id']:
+            full_name = f"{row['user__first_name']} {row['user__last_name']}".strip()
+            display = full_name or row['user__username']
+        else:
+            display = '—'
+        goal_contributions_by_user.setdefault(row['goal_id'], []).append((display, float(row['total'] or 0)))
+    return goal_contributions_by_user
+
+
 @login_required
 def family_detail(request, family_id):
     """Детали семьи"""
@@ -845,118 +1249,27 @@ def family_detail(request, family_id):
         members_with_avatars = [(m, None) for m in members]
     if not members_with_avatars:
         members_with_avatars = [(m, None) for m in members]
-    # График пополнений по месяцам — отдельно по каждой цели (датасеты по целям)
-    from django.utils import formats
-    from django.db.models import Min, Max
-    from collections import defaultdict
+    # Суммы пополнений и месяцы фильтра кэшируются по версии данных семьи; сам график загружается
+    # из family_chart_data (JSON с ETag)
+    from finance.utils.cache import cached_widget
     chart_month_from = request.GET.get('month_from', '').strip()
     chart_month_to = request.GET.get('month_to', '').strip()
-    contributions_qs = GoalContribution.objects.filter(goal__family=family)
-    if chart_month_from:
-        try:
-            y, m = int(chart_month_from[:4]), int(chart_month_from[5:7])
-            start_date = date(y, m, 1)
-            contributions_qs = contributions_qs.filter(contributed_at__date__gte=start_date)
-        except (ValueError, IndexError):
-            pass
-    if chart_month_to:
-        try:
-            y, m = int(chart_month_to[:4]), int(chart_month_to[5:7])
-            _, last_day = calendar.monthrange(y, m)
-            end_date = date(y, m, last_day)
-            contributions_qs = contributions_qs.filter(contributed_at__date__lte=end_date)
-        except (ValueError, IndexError):
-            pass
-    contributions_raw = contributions_qs.annotate(
-        month=TruncMonth('contributed_at')
-    ).values('goal_id', 'goal__name', 'month').annotate(
-        total=Sum('amount')
-    ).order_by('month')
-    # Список месяцев для выбора в фильтре
-    agg = GoalContribution.objects.filter(goal__family=family).aggregate(
-        first=Min('contributed_at'), last=Max('contributed_at'))
-    chart_available_months = []
-    if agg['first'] and agg['last']:
-        cur = agg['first'].date().replace(day=1)
-        end = agg['last'].date().replace(day=1)
-        while cur <= end:
-            chart_available_months.append((cur.strftime('%Y-%m'), formats.date_format(cur, 'F Y')))
-            if cur.month == 12:
-                cur = date(cur.year + 1, 1, 1)
-            else:
-                cur = date(cur.year, cur.month + 1, 1)
-    else:
-        today = timezone.now().date()
-        for i in range(11, -1, -1):
-            y, m = today.year, today.month - i
-            while m <= 0:
-                m += 12
-                y -= 1
-            d = date(y, m, 1)
-            chart_available_months.append((d.strftime('%Y-%m'), formats.date_format(d, 'F Y')))
-    # Собираем все месяцы (последние 12) и по каждой цели — сумму за месяц
-    today = timezone.now().date()
-    chart_labels = []
-    for i in range(11, -1, -1):
-        y, m = today.year, today.month - i
-        while m <= 0:
-            m += 12
-            y -= 1
-        d = date(y, m, 1)
-        chart_labels.append(d.strftime('%Y-%m'))
-    by_goal = defaultdict(dict)  # goal_id -> { month_str: total }
-    for row in contributions_raw:
-        month_val = row.get('month')
-        if month_val:
-            month_str = month_val.strftime('%Y-%m') if hasattr(month_val, 'strftime') else str(month_val)[:7]
-            gid = row.get('goal_id')
-            gname = row.get('goal__name') or 'Цель'
-            if gid not in by_goal:
-                by_goal[gid] = {'name': gname, 'months': {}}
-            by_goal[gid]['months'][month_str] = float(row.get('total') or 0)
-    chart_datasets = []
-    colors = [
-        'rgba(67, 97, 238, 0.8)', 'rgba(34, 197, 94, 0.8)', 'rgba(234, 88, 12, 0.8)',
-        'rgba(168, 85, 247, 0.8)', 'rgba(14, 165, 233, 0.8)', 'rgba(225, 29, 72, 0.8)',
-    ]
-    for i, (gid, info) in enumerate(by_goal.items()):
-        data = [info['months'].get(m, 0) for m in chart_labels]
-        chart_datasets.append({
-            'label': info['name'][:30],
-            'data': data,
-            'backgroundColor': colors[i % len(colors)],
-            'borderColor': colors[i % len(colors)].replace('0.8', '1'),
-            'borderWidth': 1,
-        })
-    chart_labels_json = json.dumps(chart_labels)
-    chart_datasets_json = json.dumps(chart_datasets)
+    chart_available_months = cached_widget(
+        'family_contribution_months', [('family', family.pk)], lambda: _family_contribution_months(family),
+    )
     # История пополнений: кто, когда, сколько, по какой цели
     contributions_history = GoalContribution.objects.filter(
         goal__family=family
     ).select_related('user', 'goal').order_by('-contributed_at')[:100]
-    # Сумма пополнения каждого пользователя по каждой семейной цели
-    from django.db.models import Sum as DbSum
-    contributions_by_goal_user = GoalContribution.objects.filter(
-        goal__family=family
-    ).values('goal_id', 'user_id').annotate(total=DbSum('amount')).order_by('goal_id', 'user_id')
-    goal_contributions_by_user = {}  # goal_id -> [(display_name, total), ...]
-    for row in contributions_by_goal_user:
-        gid = row['goal_id']
-        if gid not in goal_contributions_by_user:
-            goal_contributions_by_user[gid] = []
-        try:
-            u = CustomUser.objects.get(id=row['user_id']) if row['user_id'] else None
-            display = (u.get_full_name() or u.username) if u else '—'
-        except CustomUser.DoesNotExist:
-            display = '—'
-        goal_contributions_by_user[gid].append((display, float(row['total'] or 0)))
+    goal_contributions_by_user = cached_widget(
+        'family_contributions_by_user', [('family', family.pk)],
+        lambda: _family_contributions_by_user(family),
+    )
     family_goals_with_contributions = [
         (goal, goal_contributions_by_user.get(goal.id, []))
         for goal in family_goals
     ]
     return render(request, 'finance/family_detail.html', {
-        'chart_labels_json': chart_labels_json,
-        'chart_datasets_json': chart_datasets_json,
         'chart_month_from': chart_month_from,
         'chart_month_to': chart_month_to,
         'chart_available_months': chart_available_months,
@@ -964,7 +1277,6 @@ def family_detail(request, family_id):
         'can_invite': can_invite, 'can_create_goal': can_create_goal,
         'family_goals': family_goals, 'family_goals_with_contributions': family_goals_with_contributions,
         'pending_emails': [], 'family_avatar_url': family_avatar_url,
-        'chart_labels': chart_labels,
         'contributions_history': contributions_history,
     })
 
@@ -1049,12 +1361,14 @@ def family_invite(request, family_id):
         except CustomUser.DoesNotExist:
             pass
         if invitee_user:
-            Notification.objects.create(
-                user=invitee_user,
-                notification_type='family_invite',
-                title='Приглашение в семью',
-                message=f'Вас пригласили в семью «{family.name}». Перейдите по ссылке, чтобы присоединиться.',
+            # Повторная отправка того же приглашения в тот же день не дублирует уведомление
+            notify(
+                'family_invite',
+                'Приглашение в семью',
+                f'Вас пригласили в семью «{family.name}». Перейдите по ссылке, чтобы присоединиться.',
+                user_ids=[invitee_user.id],
                 data={'family_id': str(family_id), 'invite_token': token, 'inviter': request.user.username},
+                dedup_key=f'invite:{inv.id}:{timezone.localdate().isoformat()}',
             )
             messages.success(request, f'Приглашение отправлено на {email}. Пользователь увидит уведомление.')
         else:
@@ -1100,15 +1414,17 @@ def family_accept_invite(request, token):
     if family.members.filter(user=request.user).exists():
         messages.info(request, 'Вы уже в этой семье')
         return redirect('family_detail', family_id=family_id)
-    FamilyMember.objects.get_or_create(family=family, user=request.user, defaults={'role': 'member'})
+    membership, _ = FamilyMember.objects.get_or_create(family=family, user=request.user, defaults={'role': 'member'})
     # Уведомление создателю семьи: кто присоединился
     display_name = request.user.get_full_name() or request.user.username
-    Notification.objects.create(
-        user=family.created_by,
-        notification_type='member_joined',
-        title='Новый участник в семье',
-        message=f'{display_name} присоединился(ась) к семье «{family.name}».',
+    notify(
+        'member_joined',
+        'Новый участник в семье',
+        f'{display_name} присоединился(ась) к семье «{family.name}».',
+        user_ids=[family.created_by_id],
         data={'family_id': str(family_id), 'user_id': str(request.user.id), 'username': request.user.username},
+        # Ключ — запись участия: повторное вступление после выхода из семьи снова уведомляет создателя
+        dedup_key=f'joined:{membership.pk}',
     )
     messages.success(request, f'Вы присоединились к семье «{family.name}»')
     return redirect('family_detail', family_id=family_id)
@@ -1121,89 +1437,50 @@ def family_admin_chart(request, family_id):
     if family.created_by != request.user and not family.members.filter(user=request.user).exists():
         messages.error(request, 'Нет доступа к этой семье')
         return redirect('family_list')
-    from django.utils import formats
-    from django.db.models import Min, Max
-    from collections import defaultdict
-    chart_month_from = request.GET.get('month_from', '').strip()
-    chart_month_to = request.GET.get('month_to', '').strip()
-    contributions_qs = GoalContribution.objects.filter(goal__family=family)
-    if chart_month_from:
-        try:
-            y, m = int(chart_month_from[:4]), int(chart_month_from[5:7])
-            start_date = date(y, m, 1)
-            contributions_qs = contributions_qs.filter(contributed_at__date__gte=start_date)
-        except (ValueError, IndexError):
-            pass
-    if chart_month_to:
-        try:
-            y, m = int(chart_month_to[:4]), int(chart_month_to[5:7])
-            _, last_day = calendar.monthrange(y, m)
-            end_date = date(y, m, last_day)
-            contributions_qs = contributions_qs.filter(contributed_at__date__lte=end_date)
-        except (ValueError, IndexError):
-            pass
-    contributions_raw = contributions_qs.annotate(
-        month=TruncMonth('contributed_at')
-    ).values('goal_id', 'goal__name', 'month').annotate(
-        total=Sum('amount')
-    ).order_by('month')
-    months_set = set()
-    by_goal = defaultdict(lambda: {'name': '', 'months': {}})
-    for row in contributions_raw:
-        month_val = row.get('month')
-        if month_val:
-            month_str = month_val.strftime('%Y-%m') if hasattr(month_val, 'strftime') else str(month_val)[:7]
-            months_set.add(month_str)
-            gid = row.get('goal_id')
-            by_goal[gid]['name'] = row.get('goal__name') or 'Цель'
-            by_goal[gid]['months'][month_str] = float(row.get('total') or 0)
-    chart_labels = sorted(months_set) if months_set else []
-    chart_datasets = []
-    colors = [
-        'rgba(67, 97, 238, 0.8)', 'rgba(34, 197, 94, 0.8)', 'rgba(234, 88, 12, 0.8)',
-        'rgba(168, 85, 247, 0.8)', 'rgba(14, 165, 233, 0.8)', 'rgba(225, 29, 72, 0.8)',
-    ]
-    for i, (gid, info) in enumerate(by_goal.items()):
-        data = [info['months'].get(m, 0) for m in chart_labels]
-        chart_datasets.append({
-            'label': (info['name'] or 'Цель')[:30],
-            'data': data,
-            'backgroundColor': colors[i % len(colors)],
-            'borderColor': colors[i % len(colors)].replace('0.8', '1'),
-            'borderWidth': 1,
-        })
-    agg = GoalContribution.objects.filter(goal__family=family).aggregate(
-        first=Min('contributed_at'), last=Max('contributed_at'))
-    chart_available_months = []
-    if agg['first'] and agg['last']:
-        cur = agg['first'].date().replace(day=1)
-        end = agg['last'].date().replace(day=1)
-        while cur <= end:
-            chart_available_months.append((cur.strftime('%Y-%m'), formats.date_format(cur, 'F Y')))
-            if cur.month == 12:
-                cur = date(cur.year + 1, 1, 1)
-            else:
-                cur = date(cur.year, cur.month + 1, 1)
-    else:
-        today = timezone.now().date()
-        for i in range(11, -1, -1):
-            y, m = today.year, today.month - i
-            while m <= 0:
-                m += 12
-                y -= 1
-            d = date(y, m, 1)
-            chart_available_months.append((d.strftime('%Y-%m'), formats.date_format(d, 'F Y')))
+    # Данные графика загружаются из family_chart_data?kind=admin (JSON с ETag)
+    from finance.utils.cache import cached_widget
     return render(request, 'finance/family_admin_chart.html', {
         'family': family,
-        'chart_labels_json': json.dumps(chart_labels),
-        'chart_datasets_json': json.dumps(chart_datasets),
-        'chart_month_from': chart_month_from,
-        'chart_month_to': chart_month_to,
-        'chart_available_months': chart_available_months,
+        'chart_month_from': request.GET.get('month_from', '').strip(),
+        'chart_month_to': request.GET.get('month_to', '').strip(),
+        'chart_available_months': cached_widget(
+            'family_contribution_months', [('family', family.pk)], lambda: _family_contribution_months(family),
+        ),
         'family_avatar_url': _family_avatar_url(family),
     })
 
 
+@login_required
+def family_chart_data(request, family_id):
+    """
+    Данные графика пополнений семьи (JSON). ETag — по версии данных семьи,
+    при совпадении ответ 304 без запросов к пополнениям.
+    ?kind=admin — вариант графика family_admin_chart (только месяцы с пополнениями).
+    """
+    from finance.utils.cache import cached_widget, versions_etag
+    family = get_object_or_404(Family, id=family_id)
+    if family.created_by != request.user and not family.members.filter(user=request.user).exists():
+        return JsonResponse({'success': False, 'error': 'Нет доступа'}, status=403)
+    chart_month_from = request.GET.get('month_from', '').strip()
+    chart_month_to = request.GET.get('month_to', '').strip()
+    scopes = [('family', family.pk)]
+    if request.GET.get('kind') == 'admin':
+        name, builder, parts = 'family_admin_chart', _family_admin_chart, (chart_month_from, chart_month_to)
+    else:
+        name, builder = 'family_detail_chart', _family_detail_chart
+        parts = (chart_month_from, chart_month_to, timezone.now().strftime('%Y-%m'))
+
+    def build_payload():
+        chart = cached_widget(name, scopes, lambda: builder(family, chart_month_from, chart_month_to), *parts)
+        return {
+            'labels': chart['chart_labels'],
+            'datasets': chart['chart_datasets'],
+            'available_months': chart['chart_available_months'],
+        }
+
+    return _json_with_etag(request, versions_etag(scopes, name, *parts), build_payload)
+
+
 @login_required
 def family_settings(request, family_id):
     """Настройки семьи (только создатель/админ)."""
@@ -1270,4 +1547,19 @@ def family_goal_create(request, family_id):
     if not _user_can_create_family_goals(request, family):
         messages.error(request, 'В этой семье только создатель/админ могут создавать цели. Включите опцию в настройках семьи.')
         return redirect('family_detail', family_id=family_id)
-    return redirect(reverse('dashboard') + '?tab=goals&family_id=' + str(family_id))
\ No newline at end of file
+    return redirect(reverse('dashboard') + '?tab=goals&family_id=' + str(family_id))
+
+
+def metrics(request):
+    """
+    Метрики приложения в текстовом формате Prometheus (finance/utils/metrics.py).
+    Доступ — с заголовком Authorization: Bearer <METRICS_TOKEN> или с адресов METRICS_ALLOWED_IPS.
+    """
+    import hmac
+    from .utils.metrics import REGISTRY
+    token = settings.METRICS_TOKEN
+    supplied = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ').strip()
+    allowed = hmac.compare_digest(supplied.encode(), token.encode()) if token else request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
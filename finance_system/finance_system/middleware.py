@@ -1,21 +1,340 @@
 """
-Middleware: в режиме DEBUG отключаем кэширование ответов браузером,
-чтобы всегда загружалась актуальная версия сайта.
+Middleware проекта:
+- в режиме DEBUG отключаем кэширование ответов браузером,
+  чтобы всегда загружалась актуальная версия сайта;
+- продлеваем срок сессии «скользящим окном» без записи сессии на каждый запрос;
+- профилируем выборку запросов: время, SQL, шаблоны, заголовок Server-Timing и лог медленных маршрутов;
+- по заголовку или выборочно снимаем стеки запроса и сохраняем их для flamegraph;
+- ограничиваем время SQL-запроса (statement_timeout PostgreSQL) только в веб-процессах.
 """
 
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+from django.utils.deprecation import MiddlewareMixin
 
 
-class DisableBrowserCacheMiddleware:
-    """В DEBUG добавляет заголовки, запрещающие кэширование HTML."""
+def _set_statement_timeout(connection, **kwargs):
+    timeout = getattr(settings, 'DB_STATEMENT_TIMEOUT_MS', 0)
+    if connection.vendor == 'postgresql' and timeout:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET statement_timeout = {int(timeout)}')
+
+
+class StatementTimeoutMiddleware:
+    """
+    statement_timeout = DB_STATEMENT_TIMEOUT_MS для соединений веб-процесса. Ставится сигналом connection_created,
+    который подключается при загрузке middleware, — то есть только в WSGI/ASGI-обработчике: у management-команд
+    (seed_scale, rebuild_category_rollup, reconcile_balances, run_report_jobs, миграции) ограничения нет.
+    """
+
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_set_statement_timeout, dispatch_uid='finance_statement_timeout')
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is not None:
+                _set_statement_timeout(conn)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        if settings.DEBUG:
+        return self.get_response(request)
+
+
+class DisableBrowserCacheMiddleware(MiddlewareMixin):
+    """В DEBUG добавляет заголовки, запрещающие кэширование HTML."""
+
+    def process_response(self, request, response):
+        # Ответы с ETag и так всегда перепроверяются у сервера — их не трогаем
+        if settings.DEBUG and not response.has_header("ETag"):
             response["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
             response["Pragma"] = "no-cache"
             response["Expires"] = "0"
         return response
+
+
+class SlidingSessionExpiryMiddleware(MiddlewareMixin):
+    """
+    Замена SESSION_SAVE_EVERY_REQUEST: сессия помечается изменённой (и сохраняется с новым сроком)
+    только если с последнего продления прошло больше SESSION_REFRESH_INTERVAL секунд.
+    Обычный просмотр страниц не пишет в таблицу сессий.
+    """
+
+    REFRESHED_KEY = '_session_refreshed_at'
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return response
+        interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', 24 * 60 * 60)
+        now = int(time.time())
+        refreshed_at = session.get(self.REFRESHED_KEY) or 0
+        # Если сессия и так будет сохранена (вход, сообщения и т.п.) — отмечаем продление бесплатно
+        if session.modified or now - refreshed_at >= interval:
+            session[self.REFRESHED_KEY] = now
+        return response
+
+
+_profile_var = contextvars.ContextVar('request_profile', default=None)
+_template_patch_installed = False
+
+
+def _install_template_timing():
+    """
+    Время рендеринга шаблонов: обёртка над render() шаблона бэкенда Django (его вызывают render()
+    и render_to_string; вложенные {% include %} через неё не проходят, поэтому время не считается дважды).
+    Ставится один раз; вне профилируемого запроса обёртка ничего не делает.
+    """
+    global _template_patch_installed
+    if _template_patch_installed:
+        return
+    from django.template.backends.django import Template
+
+    original = Template.render
+
+    def timed_render(self, *args, **kwargs):
+        profile = _profile_var.get()
+        if profile is None:
+            return original(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            profile['template'] += time.perf_counter() - started
+
+    Template.render = timed_render
+    _template_patch_installed = True
+
+
+def _profiled_execute(execute, sql, params, many, context):
+    """
+    Обёртка выполнения SQL, постоянно стоящая на соединениях: считает запросы, только если текущий запрос
+    профилируется. Профиль берётся из contextvar, поэтому учитываются и запросы async-представлений,
+    выполняемые через sync_to_async в другом потоке.
+    """
+    profile = _profile_var.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        spent = time.perf_counter() - started
+        profile['db'] += spent
+        # SQL приходит с плейсхолдерами — одинаковый текст означает один и тот же запрос с разными параметрами
+        count, total = profile['queries'].get(sql, (0, 0.0))
+        profile['queries'][sql] = (count + 1, total + spent)
+
+
+def _install_query_timing(connection, **kwargs):
+    if _profiled_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _profiled_execute)
+
+
+def _install_on_open_connections():
+    """Соединения текущего потока, открытые до подключения сигнала connection_created."""
+    for conn in connections.all(initialized_only=True):
+        _install_query_timing(conn)
+
+
+class RequestProfilingMiddleware:
+    """
+    Профилирование запросов: общее время — всегда (это дёшево); для доли запросов
+    REQUEST_PROFILING_SAMPLE_RATE — ещё число и время SQL-запросов, повторяющиеся запросы (N+1)
+    и время рендеринга шаблонов.
+
+    Заголовок Server-Timing (total, db, tpl, app) виден в DevTools браузера; добавляется в DEBUG
+    и для сотрудников (is_staff). Если запрос превысил бюджет маршрута (REQUEST_PROFILING_BUDGETS_MS
+    по имени маршрута, иначе REQUEST_PROFILING_BUDGET_MS) или выполнил один и тот же SQL не меньше
+    REQUEST_PROFILING_DUPLICATE_THRESHOLD раз, в лог finance.profiling пишется строка JSON.
+    """
+
+    logger = logging.getLogger('finance.profiling')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.0)
+        self.budget_ms = getattr(settings, 'REQUEST_PROFILING_BUDGET_MS', 1000)
+        self.route_budgets = getattr(settings, 'REQUEST_PROFILING_BUDGETS_MS', {})
+        self.duplicate_threshold = getattr(settings, 'REQUEST_PROFILING_DUPLICATE_THRESHOLD', 5)
+        if self.sample_rate > 0:
+            _install_template_timing()
+            connection_created.connect(_install_query_timing, dispatch_uid='finance_request_profiling')
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if not self.sampled():
+            response = self.get_response(request)
+            self.check_budget(request, response, time.perf_counter() - started)
+            return response
+
+        _install_on_open_connections()
+        profile = {'template': 0.0, 'db': 0.0, 'queries': {}}
+        token = _profile_var.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile_var.reset(token)
+        total = time.perf_counter() - started
+        show_timing = settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False)
+        self.report(request, response, total, profile, show_timing)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        if not self.sampled():
+            response = await self.get_response(request)
+            self.check_budget(request, response, time.perf_counter() - started)
+            return response
+
+        # ORM async-представлений работает в потоке sync_to_async — обёртка нужна на его соединениях
+        await sync_to_async(_install_on_open_connections)()
+        profile = {'template': 0.0, 'db': 0.0, 'queries': {}}
+        token = _profile_var.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile_var.reset(token)
+        total = time.perf_counter() - started
+        show_timing = settings.DEBUG
+        if not show_timing and hasattr(request, 'auser'):
+            show_timing = getattr(await request.auser(), 'is_staff', False)
+        self.report(request, response, total, profile, show_timing)
+        return response
+
+    def report(self, request, response, total, profile, show_timing):
+        queries = sum(count for count, _ in profile['queries'].values())
+        if show_timing:
+            other = max(0.0, total - profile['db'] - profile['template'])
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={total * 1000:.1f}',
+                f'db;dur={profile["db"] * 1000:.1f};desc="{queries} queries"',
+                f'tpl;dur={profile["template"] * 1000:.1f}',
+                f'app;dur={other * 1000:.1f}',
+            ])
+        duplicates = sorted(
+            ((sql, count, spent) for sql, (count, spent) in profile['queries'].items()
+             if count >= self.duplicate_threshold),
+            key=lambda item: -item[1],
+        )
+        self.check_budget(request, response, total, profile, queries, duplicates)
+
+    def check_budget(self, request, response, total, profile=None, queries=None, duplicates=()):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else None
+        budget = self.route_budgets.get(route, self.budget_ms)
+        over_budget = total * 1000 > budget
+        if not over_budget and not duplicates:
+            return
+        record = {
+            'event': 'slow_request' if over_budget else 'duplicate_queries',
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'budget_ms': budget,
+            'sampled': profile is not None,
+        }
+        if profile is not None:
+            record.update({
+                'db_ms': round(profile['db'] * 1000, 1),
+                'db_queries': queries,
+                'template_ms': round(profile['template'] * 1000, 1),
+                'duplicates': [
+                    {'sql': sql[:300], 'count': count, 'ms': round(spent * 1000, 1)}
+                    for sql, count, spent in duplicates[:5]
+                ],
+            })
+        self.logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+class StackSamplingMiddleware:
+    """
+    Выборочный профайлер стека (finance/utils/stack_sampler.py): пока выполняется запрос, фоновый поток
+    снимает стек потока запроса, и результат сохраняется файлом collapsed stacks для flamegraph.
+
+    Запрос профилируется по заголовку X-Stack-Profile: 1 (в DEBUG или от сотрудника) либо с вероятностью
+    STACK_PROFILING_SAMPLE_RATE, если маршрут входит в STACK_PROFILING_ROUTES (пустой список — любой).
+    Одновременно профилируется не больше STACK_PROFILING_MAX_CONCURRENT запросов на процесс.
+    Файлы скачиваются сотрудником в админке (/admin/profiles/). Под ASGI запросы проходят без профилирования:
+    код запроса выполняется в цикле событий и потоках sync_to_async, а не в одном потоке.
+    """
+
+    header = 'HTTP_X_STACK_PROFILE'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'STACK_PROFILING_SAMPLE_RATE', 0.0)
+        self.routes = set(getattr(settings, 'STACK_PROFILING_ROUTES', ()))
+        self.interval = getattr(settings, 'STACK_PROFILING_INTERVAL_MS', 5) / 1000
+        self.slots = threading.BoundedSemaphore(getattr(settings, 'STACK_PROFILING_MAX_CONCURRENT', 2))
+
+    def __call__(self, request):
+        if self.async_mode:
+            # Под ASGI у запроса нет одного потока, стек которого можно снимать, — профилирование не ведётся
+            return self.get_response(request)
+        route = self.route_to_profile(request)
+        if route is None or not self.slots.acquire(blocking=False):
+            return self.get_response(request)
+        from finance.utils.stack_sampler import StackSampler, save_profile
+
+        try:
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            started = time.perf_counter()
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                stacks = sampler.stop()
+                duration_ms = (time.perf_counter() - started) * 1000
+            if stacks:
+                try:
+                    save_profile(route, stacks, duration_ms)
+                except OSError:
+                    logging.getLogger('finance.profiling').exception('Не удалось сохранить профиль стека')
+            return response
+        finally:
+            self.slots.release()
+
+    def route_to_profile(self, request):
+        """Имя маршрута, если запрос нужно профилировать, иначе None."""
+        forced = request.META.get(self.header) == '1' and (
+            settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False)
+        )
+        if not forced and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return None
+        try:
+            route = resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+        if not forced and self.routes and route not in self.routes:
+            return None
+        return route
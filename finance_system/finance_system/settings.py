@@ -32,11 +32,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'finance_system.middleware.RequestProfilingMiddleware',  # Время запроса, SQL и шаблоны (выборочно), Server-Timing
+    'finance_system.middleware.StatementTimeoutMiddleware',  # statement_timeout PostgreSQL только для веб-запросов
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'finance_system.middleware.StackSamplingMiddleware',  # Профиль стека по заголовку/выборочно (после auth — нужен is_staff)
+    'finance_system.middleware.SlidingSessionExpiryMiddleware',  # Продление сессии без записи на каждый запрос
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'finance_system.middleware.DisableBrowserCacheMiddleware',  # В DEBUG — без кэша, всегда новая версия
@@ -68,8 +72,13 @@ WSGI_APPLICATION = 'finance_system.wsgi.application'
 # Database
 # По умолчанию SQLite. Для PostgreSQL задайте переменные окружения:
 # DB_ENGINE=postgresql, DB_NAME=finance_db, DB_USER=postgres, DB_PASSWORD=..., DB_HOST=localhost, DB_PORT=5432
+# Общие: DB_CONN_MAX_AGE — время жизни постоянного соединения в секундах (0 — новое соединение на каждый запрос),
+# DB_STATEMENT_TIMEOUT_MS — предельное время одного SQL-запроса веб-процесса (PostgreSQL) / ожидания блокировки (SQLite).
+# PostgreSQL: DB_POOL=1 — пул соединений psycopg 3 (pip install "psycopg[binary,pool]"), размеры DB_POOL_MIN/DB_POOL_MAX.
+# SQLite: SQLITE_WAL=0 отключает WAL и прагмы из SQLITE_PRAGMAS.
 import os
 _db_engine = os.getenv('DB_ENGINE', 'sqlite3')
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
 if _db_engine == 'postgresql':
     DATABASES = {
         'default': {
@@ -79,15 +88,161 @@ if _db_engine == 'postgresql':
             'PASSWORD': os.getenv('DB_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', 'localhost'),
             'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # statement_timeout ставит StatementTimeoutMiddleware — только в веб-процессах, не в командах
+            'OPTIONS': {},
         }
     }
+    if os.getenv('DB_POOL') == '1':
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            from django.core.exceptions import ImproperlyConfigured
+            raise ImproperlyConfigured('DB_POOL=1 требует psycopg 3 с пулом: pip install "psycopg[binary,pool]"')
+        # Пулом управляет psycopg, постоянные соединения Django с ним несовместимы
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX', 10)),
+            'timeout': 10,
+        }
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': DB_STATEMENT_TIMEOUT_MS / 1000,
+            },
+        }
+    }
+
+# Прагмы SQLite для установки на одном сервере (применяются при открытии соединения, см. finance/signals.py)
+SQLITE_PRAGMAS = {} if os.getenv('SQLITE_WAL') == '0' else {
+    'journal_mode': 'WAL',       # читатели не блокируют писателя
+    'synchronous': 'NORMAL',     # в режиме WAL безопасно и намного быстрее FULL
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,        # ~20 МБ кэша страниц на соединение
+    'mmap_size': 134217728,      # 128 МБ
+}
+
+# Cache
+# CACHE_BACKEND: locmem (по умолчанию), filesystem (CACHE_LOCATION — папка) или
+# redis (CACHE_LOCATION — URL любого Redis-совместимого сервера, например локального Valkey/KeyDB; нужен пакет redis).
+# locmem — только для одного процесса: при DEBUG=False check --deploy выдаёт предупреждение finance.W001 (finance/checks.py)
+_cache_backend = os.getenv('CACHE_BACKEND', 'locmem')
+if _cache_backend == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif _cache_backend == 'filesystem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'finance-system',
         }
     }
+CACHES['default']['KEY_PREFIX'] = 'finance'
+
+# Время жизни виджетов дашборда/семьи (ключи версионируются, см. finance/utils/cache.py)
+# и полностраничного кэша публичных страниц для анонимов, в секундах
+FINANCE_WIDGET_CACHE_TIMEOUT = int(os.getenv('FINANCE_WIDGET_CACHE_TIMEOUT', 600))
+FINANCE_PAGE_CACHE_TIMEOUT = int(os.getenv('FINANCE_PAGE_CACHE_TIMEOUT', 600))
+
+# Задания на отчёты (finance/utils/report_jobs.py): каталог и предельный размер дискового кэша готовых файлов,
+# встроенный пул потоков в веб-процессе (REPORT_JOBS_INLINE_WORKER=0 — только воркер run_report_jobs)
+REPORTS_CACHE_DIR = Path(os.getenv('REPORTS_CACHE_DIR', str(BASE_DIR / 'report_cache')))
+REPORTS_CACHE_MAX_BYTES = int(os.getenv('REPORTS_CACHE_MAX_MB', 512)) * 1024 * 1024
+REPORT_JOBS_INLINE_WORKER = os.getenv('REPORT_JOBS_INLINE_WORKER', '1') == '1'
+REPORT_JOBS_WORKERS = int(os.getenv('REPORT_JOBS_WORKERS', 2))
+# Воркер продлевает heartbeat задания во время рендера не чаще раза в REPORT_JOBS_HEARTBEAT_SECONDS;
+# задание «формируется» без продления дольше REPORT_JOBS_STALE_SECONDS считается прерванным (воркер упал)
+REPORT_JOBS_HEARTBEAT_SECONDS = int(os.getenv('REPORT_JOBS_HEARTBEAT_SECONDS', 30))
+REPORT_JOBS_STALE_SECONDS = int(os.getenv('REPORT_JOBS_STALE_SECONDS', 5 * 60))
+# Предел строк PDF-отчёта: reportlab держит все страницы в памяти до сохранения файла (0 — без предела)
+REPORT_PDF_MAX_ROWS = int(os.getenv('REPORT_PDF_MAX_ROWS', 20000))
+
+# Профилирование запросов (finance_system/middleware.py): доля запросов с замером SQL и шаблонов
+# (0 — только общее время; 0.01–0.05 приемлемо в продакшене), бюджет времени ответа в мс — общий и по именам
+# маршрутов, порог повторов одного SQL для предупреждения о N+1. Превышения пишутся в лог finance.profiling
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', 1.0 if DEBUG else 0.02))
+REQUEST_PROFILING_BUDGET_MS = int(os.getenv('REQUEST_PROFILING_BUDGET_MS', 800))
+REQUEST_PROFILING_BUDGETS_MS = {
+    'dashboard': 500,
+    'transactions_feed': 200,
+    'transactions_search': 300,
+    'import_transactions_excel': 5000,
+    'scan_receipt_api': 5000,
+    'report_job_download': 2000,
+}
+REQUEST_PROFILING_DUPLICATE_THRESHOLD = int(os.getenv('REQUEST_PROFILING_DUPLICATE_THRESHOLD', 5))
+
+# Профайлер стека (finance/utils/stack_sampler.py): доля запросов маршрутов STACK_PROFILING_ROUTES
+# (пустой список — все маршруты), шаг снятия стека, предел одновременных профилей на процесс,
+# каталог collapsed-файлов и сколько последних файлов хранить на маршрут. Заголовок X-Stack-Profile: 1 от
+# сотрудника профилирует запрос независимо от выборки
+STACK_PROFILING_SAMPLE_RATE = float(os.getenv('STACK_PROFILING_SAMPLE_RATE', 0))
+STACK_PROFILING_ROUTES = [r for r in os.getenv('STACK_PROFILING_ROUTES', 'dashboard').split(',') if r]
+STACK_PROFILING_INTERVAL_MS = float(os.getenv('STACK_PROFILING_INTERVAL_MS', 5))
+STACK_PROFILING_MAX_CONCURRENT = int(os.getenv('STACK_PROFILING_MAX_CONCURRENT', 2))
+STACK_PROFILES_DIR = Path(os.getenv('STACK_PROFILES_DIR', str(BASE_DIR / 'stack_profiles')))
+STACK_PROFILES_KEEP = int(os.getenv('STACK_PROFILES_KEEP', 20))
+
+# Метрики Prometheus (finance/utils/metrics.py, /metrics): каталог снимков значений процессов для нескольких
+# воркеров gunicorn (пусто — метрики одного процесса; каталог очищать при старте сервиса) и период записи
+# снимка в секундах. Доступ к /metrics — по токену (Authorization: Bearer ...) или с перечисленных адресов
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
+# Распознавание чеков (async-представления receipt/scan/api/, receipt/analyze/): число одновременных процессов
+# Tesseract на воркер (пусто — по числу CPU) и предельный размер фото
+RECEIPT_OCR_WORKERS = int(os.getenv('RECEIPT_OCR_WORKERS', 0)) or None
+RECEIPT_MAX_UPLOAD_BYTES = int(os.getenv('RECEIPT_MAX_UPLOAD_MB', 10)) * 1024 * 1024
+
+# SSE-поток уведомлений (finance/utils/notification_stream.py): брокер между процессами (redis://...; пусто —
+# в памяти процесса с дочитыванием из БД), период пинга/дочитывания и длительность соединения, в секундах
+NOTIFICATION_BROKER_URL = os.getenv('NOTIFICATION_BROKER_URL', '')
+NOTIFICATION_STREAM_POLL_SECONDS = float(os.getenv('NOTIFICATION_STREAM_POLL_SECONDS', 20))
+NOTIFICATION_STREAM_MAX_SECONDS = float(os.getenv('NOTIFICATION_STREAM_MAX_SECONDS', 300))
+
+# Внешние каналы доставки по типу уведомления: notify() ставит записи в очередь NotificationDelivery
+# (адрес — email или telegram_id получателя), отправляет их воркер доставки. Типы без записи — только в приложении
+NOTIFICATION_DELIVERY_CHANNELS = {
+    'family_invite': ('email',),
+    'budget_warning': ('email', 'telegram'),
+    'goal_replenishment_reminder': ('email', 'telegram'),
+}
+
+# Воркер доставки (python manage.py deliver_notifications --loop, finance/utils/notification_delivery.py):
+# размер пачки, предел отправок в секунду по каналу на процесс, число попыток, задержка повтора (удваивается
+# с каждой попыткой до максимума) и аренда взятой пачки, в секундах
+NOTIFICATION_DELIVERY_BATCH_SIZE = int(os.getenv('NOTIFICATION_DELIVERY_BATCH_SIZE', 50))
+NOTIFICATION_DELIVERY_RATE = {
+    'email': float(os.getenv('NOTIFICATION_EMAIL_RATE', 5)),
+    'telegram': float(os.getenv('NOTIFICATION_TELEGRAM_RATE', 25)),
+}
+NOTIFICATION_DELIVERY_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_DELIVERY_MAX_ATTEMPTS', 6))
+NOTIFICATION_DELIVERY_RETRY_SECONDS = int(os.getenv('NOTIFICATION_DELIVERY_RETRY_SECONDS', 60))
+NOTIFICATION_DELIVERY_RETRY_MAX_SECONDS = int(os.getenv('NOTIFICATION_DELIVERY_RETRY_MAX_SECONDS', 6 * 60 * 60))
+NOTIFICATION_DELIVERY_LEASE_SECONDS = int(os.getenv('NOTIFICATION_DELIVERY_LEASE_SECONDS', 300))
+# Бот для канала telegram (без токена записи канала остаются в очереди)
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -134,8 +289,22 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Session settings
+# SESSION_BACKEND: cached_db (по умолчанию), db, cache или signed_cookies
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.getenv('SESSION_BACKEND', 'cached_db')
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
-SESSION_SAVE_EVERY_REQUEST = True
+# Сессия не перезаписывается на каждый запрос: срок продлевает SlidingSessionExpiryMiddleware,
+# не чаще раза в SESSION_REFRESH_INTERVAL секунд
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = int(os.getenv('SESSION_REFRESH_INTERVAL', 24 * 60 * 60))
 
 # Email settings (for development)
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+# Для отправки через SMTP: EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend и EMAIL_HOST/EMAIL_PORT;
+# локальный отладочный сервер — python -m aiosmtpd -n -l localhost:1025 (EMAIL_PORT=1025)
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '0') == '1'
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', 20))
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
\ No newline at end of file